@@ -0,0 +1,130 @@
+"""
+Cache em disco local, com tamanho máximo e descarte LRU, para objetos do R2.
+
+As entradas são identificadas pela chave do objeto e pelo ETag, então uma
+versão nova do objeto nunca é servida a partir de uma entrada antiga.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CacheDisco:
+    def __init__(self, diretorio: str, max_bytes: int):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Nome do arquivo -> tamanho, do menos para o mais recentemente usado
+        self._entradas: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._estatisticas = {"hits": 0, "misses": 0, "gravacoes": 0, "descartes": 0}
+
+        os.makedirs(diretorio, exist_ok=True)
+        self._carregar()
+
+    def _carregar(self):
+        """Reconstrói a ordem LRU a partir do horário de acesso dos arquivos"""
+        arquivos = []
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            if nome.endswith(".tmp"):
+                os.remove(caminho)
+                continue
+            stat = os.stat(caminho)
+            arquivos.append((stat.st_mtime, nome, stat.st_size))
+
+        for _, nome, tamanho in sorted(arquivos):
+            self._entradas[nome] = tamanho
+            self._total_bytes += tamanho
+        self._descartar()
+
+    @staticmethod
+    def _nome(chave: str, etag: str) -> str:
+        return hashlib.sha256(f"{chave}\0{etag}".encode()).hexdigest()
+
+    def caminho(self, chave: str, etag: str) -> Optional[str]:
+        """
+        Retorna o caminho local da entrada, ou None se não estiver no cache.
+
+        Args:
+            chave: Chave do objeto
+            etag: ETag do objeto
+
+        Returns:
+            Caminho do arquivo em cache ou None
+        """
+        nome = self._nome(chave, etag)
+        with self._lock:
+            if nome not in self._entradas:
+                self._estatisticas["misses"] += 1
+                return None
+            self._entradas.move_to_end(nome)
+            self._estatisticas["hits"] += 1
+
+        caminho = os.path.join(self.diretorio, nome)
+        try:
+            # Mantém a ordem LRU entre reinícios do processo
+            os.utime(caminho)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._entradas.pop(nome, 0)
+            return None
+        return caminho
+
+    def ler(self, chave: str, etag: str) -> Optional[bytes]:
+        caminho = self.caminho(chave, etag)
+        if caminho is None:
+            return None
+        try:
+            with open(caminho, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def gravar(self, chave: str, etag: str, dados: bytes) -> str:
+        """
+        Grava uma entrada no cache, descartando as menos usadas se necessário.
+
+        Returns:
+            Caminho do arquivo em cache
+        """
+        nome = self._nome(chave, etag)
+        caminho = os.path.join(self.diretorio, nome)
+        temp_path = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(dados)
+        os.replace(temp_path, caminho)
+
+        with self._lock:
+            self._total_bytes -= self._entradas.pop(nome, 0)
+            self._entradas[nome] = len(dados)
+            self._total_bytes += len(dados)
+            self._estatisticas["gravacoes"] += 1
+            self._descartar()
+        return caminho
+
+    def _descartar(self):
+        while self._total_bytes > self.max_bytes and self._entradas:
+            nome, tamanho = self._entradas.popitem(last=False)
+            self._total_bytes -= tamanho
+            self._estatisticas["descartes"] += 1
+            try:
+                os.remove(os.path.join(self.diretorio, nome))
+            except FileNotFoundError:
+                pass
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            return {
+                **self._estatisticas,
+                "entradas": len(self._entradas),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,222 @@
+"""
+Backend de armazenamento em disco local com a mesma interface do cliente S3.
+
+Implementa apenas as operações do boto3 usadas pelo StorageR2, para que a
+camada de storage inteira (índice, deduplicação, ZIP, cache) rode e possa ser
+medida sem acesso ao R2. Ativado com STORAGE_BACKEND=local.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+
+
+class _Corpo(io.BytesIO):
+    """Imita o StreamingBody do botocore"""
+
+    def iter_chunks(self, chunk_size: int = 1024) -> Iterator[bytes]:
+        return iter(lambda: self.read(chunk_size), b"")
+
+
+class _PaginadorLocal:
+    def __init__(self, cliente: "ClienteArmazenamentoLocal"):
+        self.cliente = cliente
+
+    def paginate(self, Bucket: str, Prefix: str = "", PageSize: int = 1000):
+        chaves = self.cliente._listar_chaves(Prefix)
+        for inicio in range(0, len(chaves), PageSize):
+            yield {
+                "Contents": [
+                    self.cliente._descrever(c) for c in chaves[inicio : inicio + PageSize]
+                ]
+            }
+
+
+class ClienteArmazenamentoLocal:
+    """
+    Guarda cada objeto como um arquivo sob `diretorio`; o tipo, os metadados
+    do usuário e o ETag ficam em um arquivo .meta.json ao lado.
+    """
+
+    def __init__(self, diretorio: str):
+        self.diretorio = os.path.abspath(diretorio)
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def _caminho(self, chave: str) -> str:
+        caminho = os.path.abspath(os.path.join(self.diretorio, chave))
+        if not caminho.startswith(self.diretorio + os.sep):
+            raise ClientError(
+                {"Error": {"Code": "InvalidKey", "Message": chave}}, "LocalStorage"
+            )
+        return caminho
+
+    def _erro_nao_encontrado(self, chave: str, operacao: str):
+        return ClientError(
+            {"Error": {"Code": "NoSuchKey", "Message": chave}}, operacao
+        )
+
+    def _ler_meta(self, chave: str) -> Dict:
+        try:
+            with open(f"{self._caminho(chave)}.meta.json", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _gravar(self, chave: str, dados: bytes, content_type: str, metadata: Dict):
+        caminho = self._caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temp_path = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(dados)
+        with open(f"{caminho}.meta.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "ContentType": content_type,
+                    "Metadata": metadata,
+                    "ETag": f'"{hashlib.md5(dados).hexdigest()}"',
+                },
+                f,
+            )
+        os.replace(temp_path, caminho)
+
+    def _descrever(self, chave: str) -> Dict:
+        caminho = self._caminho(chave)
+        if not os.path.isfile(caminho):
+            raise self._erro_nao_encontrado(chave, "HeadObject")
+        stat = os.stat(caminho)
+        meta = self._ler_meta(chave)
+        return {
+            "Key": chave,
+            "Size": stat.st_size,
+            "ETag": meta.get("ETag", '""'),
+            "LastModified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+        }
+
+    def _listar_chaves(self, prefixo: str = "") -> List[str]:
+        chaves = []
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if nome.endswith((".meta.json", ".tmp")):
+                    continue
+                chave = os.path.relpath(os.path.join(raiz, nome), self.diretorio)
+                chave = chave.replace(os.sep, "/")
+                if chave.startswith(prefixo or ""):
+                    chaves.append(chave)
+        return sorted(chaves)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None):
+        extra = ExtraArgs or {}
+        with open(Filename, "rb") as f:
+            self._gravar(
+                Key,
+                f.read(),
+                extra.get("ContentType", "binary/octet-stream"),
+                extra.get("Metadata", {}),
+            )
+
+    def put_object(self, Bucket, Key, Body, ContentType="binary/octet-stream", Metadata=None):
+        self._gravar(Key, Body, ContentType, Metadata or {})
+        return {"ETag": self._ler_meta(Key)["ETag"]}
+
+    def download_file(self, Bucket, Key, Filename):
+        caminho = self._caminho(Key)
+        if not os.path.isfile(caminho):
+            raise self._erro_nao_encontrado(Key, "GetObject")
+        shutil.copyfile(caminho, Filename)
+
+    def head_object(self, Bucket, Key):
+        descricao = self._descrever(Key)
+        meta = self._ler_meta(Key)
+        return {
+            "ContentLength": descricao["Size"],
+            "ContentType": meta.get("ContentType", "binary/octet-stream"),
+            "ETag": descricao["ETag"],
+            "LastModified": descricao["LastModified"],
+            "Metadata": meta.get("Metadata", {}),
+        }
+
+    def get_object(
+        self, Bucket, Key, Range: Optional[str] = None, IfNoneMatch: Optional[str] = None
+    ):
+        head = self.head_object(Bucket, Key)
+        if IfNoneMatch is not None and IfNoneMatch == head["ETag"]:
+            # O boto3 transforma o 304 do S3 em ClientError
+            raise ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"
+            )
+        with open(self._caminho(Key), "rb") as f:
+            dados = f.read()
+
+        resposta = {**head}
+        if Range:
+            tamanho = len(dados)
+            inicio_txt, _, fim_txt = Range.replace("bytes=", "").partition("-")
+            if inicio_txt:
+                inicio = int(inicio_txt)
+                fim = min(int(fim_txt), tamanho - 1) if fim_txt else tamanho - 1
+            else:
+                inicio, fim = max(tamanho - int(fim_txt), 0), tamanho - 1
+            if inicio >= tamanho or inicio > fim:
+                raise ClientError(
+                    {"Error": {"Code": "InvalidRange", "Message": Range}}, "GetObject"
+                )
+            dados = dados[inicio : fim + 1]
+            resposta["ContentRange"] = f"bytes {inicio}-{fim}/{tamanho}"
+
+        resposta["ContentLength"] = len(dados)
+        resposta["Body"] = _Corpo(dados)
+        return resposta
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective="COPY", **kwargs):
+        origem = CopySource["Key"]
+        meta = self._ler_meta(origem)
+        with open(self._caminho(origem), "rb") as f:
+            dados = f.read()
+        if MetadataDirective == "REPLACE":
+            meta = {
+                "ContentType": kwargs.get("ContentType", "binary/octet-stream"),
+                "Metadata": kwargs.get("Metadata", {}),
+            }
+        self._gravar(
+            Key,
+            dados,
+            meta.get("ContentType", "binary/octet-stream"),
+            meta.get("Metadata", {}),
+        )
+        descricao = self._descrever(Key)
+        return {
+            "CopyObjectResult": {
+                "ETag": descricao["ETag"],
+                "LastModified": descricao["LastModified"],
+            }
+        }
+
+    def delete_object(self, Bucket, Key):
+        for caminho in (self._caminho(Key), f"{self._caminho(Key)}.meta.json"):
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+    def delete_objects(self, Bucket, Delete):
+        deletados = []
+        for obj in Delete["Objects"]:
+            self.delete_object(Bucket, obj["Key"])
+            deletados.append({"Key": obj["Key"]})
+        return {"Deleted": deletados}
+
+    def list_objects_v2(self, Bucket, Prefix: str = ""):
+        return {"Contents": [self._descrever(c) for c in self._listar_chaves(Prefix)]}
+
+    def get_paginator(self, operacao: str) -> _PaginadorLocal:
+        return _PaginadorLocal(self)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"file://{self._caminho(Params['Key'])}"
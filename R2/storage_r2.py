@@ -1,167 +1,956 @@
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Tuple
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
-from datetime import datetime
+from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import hashlib
+import io
 import os
 import logging
+import sqlite3
+import threading
+import time
+import zipfile
 from dotenv import load_dotenv
 
+from cache_disco import CacheDisco
+from storage_local import ClienteArmazenamentoLocal
+
 # Carrega as variáveis de ambiente do .env
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Extensões já comprimidas, gravadas no ZIP sem nova compressão
+EXTENSOES_COMPRIMIDAS = (".pdf", ".png", ".jpg", ".jpeg", ".webp", ".zip")
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+# Validade padrão das URLs assinadas; são reaproveitadas até faltar esta margem
+PRESIGNED_TTL = int(os.getenv("R2_PRESIGNED_TTL", "3600"))
+PRESIGNED_MARGEM = 0.2
+PROXY_CHUNK_SIZE = 64 * 1024
+
+# Limite de chaves por chamada de delete_objects
+DELETE_CHUNK_SIZE = 1000
+
+# Uploads: arquivos acima do limite vão em partes enviadas em paralelo
+R2_MAX_POOL_CONNECTIONS = int(os.getenv("R2_MAX_POOL_CONNECTIONS", "32"))
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=int(os.getenv("R2_UPLOAD_CONCURRENCY", "8")),
+    use_threads=True,
+)
+
+
+def _sha256_arquivo(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class _BufferZipStream(io.RawIOBase):
+    """Destino não pesquisável para o ZipFile: acumula os bytes até serem lidos"""
+
+    def __init__(self):
+        self._chunks = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._posicao += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._posicao
+
+    def flush(self):
+        pass
+
+    def drenar(self) -> bytes:
+        dados = b"".join(self._chunks)
+        self._chunks = []
+        return dados
+
+
+class IndiceObjetosR2:
+    """
+    Índice local (SQLite) dos objetos do bucket: nome, tamanho, etag e data.
+
+    Permite listar, paginar e buscar arquivos sem listar o bucket a cada
+    requisição. É atualizado nos uploads/deleções feitos pelo StorageR2 e
+    reconciliado periodicamente com o bucket (reconcile_index).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS objetos (
+                    chave TEXT PRIMARY KEY,
+                    tamanho INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (nome TEXT PRIMARY KEY, valor TEXT)"
+            )
+
+    def _conectar(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def registrar(
+        self, chave: str, tamanho: int, etag: Optional[str], last_modified: datetime
+    ):
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO objetos VALUES (?, ?, ?, ?)",
+                (chave, tamanho, etag, last_modified.isoformat()),
+            )
+
+    def remover(self, chaves: List[str]):
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                "DELETE FROM objetos WHERE chave = ?", [(c,) for c in chaves]
+            )
+
+    def substituir(self, objetos: Iterator[Dict]) -> int:
+        """
+        Sincroniza o índice com a listagem completa do bucket.
+
+        Entradas ausentes da listagem são removidas, exceto as registradas
+        depois do início da listagem (uploads concorrentes).
+        """
+        inicio = datetime.now(timezone.utc).isoformat()
+        registros = [
+            (
+                obj["Key"],
+                obj["Size"],
+                obj.get("ETag", "").strip('"'),
+                obj["LastModified"].isoformat(),
+            )
+            for obj in objetos
+        ]
+        with self._lock, self._conectar() as conn:
+            conn.execute("CREATE TEMP TABLE listados (chave TEXT PRIMARY KEY)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO listados VALUES (?)", [(r[0],) for r in registros]
+            )
+            conn.execute(
+                "DELETE FROM objetos WHERE last_modified < ? "
+                "AND chave NOT IN (SELECT chave FROM listados)",
+                (inicio,),
+            )
+            conn.executemany("INSERT OR REPLACE INTO objetos VALUES (?, ?, ?, ?)", registros)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('ultima_reconciliacao', ?)",
+                (inicio,),
+            )
+        return len(registros)
+
+    def obter(self, chave: str) -> Optional[Dict]:
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT tamanho, etag, last_modified FROM objetos WHERE chave = ?",
+                (chave,),
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            "tamanho": row[0],
+            "etag": row[1],
+            "last_modified": datetime.fromisoformat(row[2]),
+        }
+
+    def ultima_reconciliacao(self) -> Optional[datetime]:
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT valor FROM meta WHERE nome = 'ultima_reconciliacao'"
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def listar(
+        self,
+        prefix: Optional[str] = None,
+        search: Optional[str] = None,
+        limit: int = 0,
+        offset: int = 0,
+        exclude_prefix: Optional[str] = None,
+    ) -> Dict:
+        condicoes, params = [], []
+        if prefix:
+            # Intervalo de chaves em vez de LIKE, para usar a chave primária
+            condicoes.append("chave >= ? AND chave < ?")
+            params += [prefix, prefix + "\U0010ffff"]
+        if exclude_prefix:
+            condicoes.append("NOT (chave >= ? AND chave < ?)")
+            params += [exclude_prefix, exclude_prefix + "\U0010ffff"]
+        if search:
+            condicoes.append("chave LIKE ? ESCAPE '\\'")
+            termo = (
+                search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            params.append(f"%{termo}%")
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+        with self._conectar() as conn:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM objetos {where}", params
+            ).fetchone()[0]
+            sql = f"SELECT chave, tamanho, etag, last_modified FROM objetos {where} ORDER BY last_modified DESC, chave"
+            if limit > 0:
+                sql += " LIMIT ? OFFSET ?"
+                params = params + [limit, offset]
+            rows = conn.execute(sql, params).fetchall()
+
+        return {
+            "items": [
+                {"chave": r[0], "tamanho": r[1], "etag": r[2], "last_modified": r[3]}
+                for r in rows
+            ],
+            "total": total,
+        }
+
 
 class StorageR2:
     def __init__(self):
-        endpoint_url = os.getenv("R2_ENDPOINT_URL")
-        access_key = os.getenv("R2_ACCESS_KEY_ID")
-        secret_key = os.getenv("R2_SECRET_ACCESS_KEY")
-
-        if not all([endpoint_url, access_key, secret_key]):
-            raise ValueError("Credenciais R2 não encontradas nas variáveis de ambiente")
-
-        self.client = boto3.client(
-            "s3",
-            endpoint_url=endpoint_url,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            config=Config(s3={"addressing_style": "virtual"}, region_name="auto"),
-        )
+        if os.getenv("STORAGE_BACKEND", "r2") == "local":
+            # Disco local no lugar do R2 (desenvolvimento e benchmarks offline)
+            self.client = ClienteArmazenamentoLocal(
+                os.getenv("STORAGE_LOCAL_DIR", "storage_local")
+            )
+        else:
+            endpoint_url = os.getenv("R2_ENDPOINT_URL")
+            access_key = os.getenv("R2_ACCESS_KEY_ID")
+            secret_key = os.getenv("R2_SECRET_ACCESS_KEY")
+
+            if not all([endpoint_url, access_key, secret_key]):
+                raise ValueError(
+                    "Credenciais R2 não encontradas nas variáveis de ambiente"
+                )
+
+            self.client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                config=Config(
+                    s3={"addressing_style": "virtual"},
+                    region_name="auto",
+                    max_pool_connections=R2_MAX_POOL_CONNECTIONS,
+                ),
+            )
         self.bucket = os.getenv("R2_BUCKET_NAME", "fichas-clinica")
         self.public_url_prefix = os.getenv("R2_PUBLIC_URL_PREFIX", "")
+        self.index = IndiceObjetosR2(os.getenv("R2_INDEX_PATH", "r2_objetos.db"))
+        self._presigned_cache: Dict[Tuple[str, int], Tuple[str, float]] = {}
+        self._presigned_lock = threading.Lock()
+
+        # Cache de leitura em disco, opcional (R2_CACHE_DIR)
+        cache_dir = os.getenv("R2_CACHE_DIR")
+        self.cache = (
+            CacheDisco(cache_dir, int(os.getenv("R2_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+            if cache_dir
+            else None
+        )
 
-    def upload_file(self, local_path: str, dest_name: str) -> Optional[str]:
+    def _indexar(self, dest_name: str):
+        """Atualiza o índice local após gravar um objeto; falhas não interrompem a operação"""
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=dest_name)
+            self.index.registrar(
+                dest_name,
+                head["ContentLength"],
+                head["ETag"].strip('"'),
+                head["LastModified"],
+            )
+        except Exception as e:
+            logger.error(f"Erro ao atualizar índice para {dest_name}: {str(e)}")
+
+    def _mesmo_conteudo(self, dest_name: str, sha256: str) -> bool:
+        """Verifica (HEAD) se o objeto já existe com o mesmo hash de conteúdo"""
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=dest_name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return head.get("Metadata", {}).get("sha256") == sha256
+
+    def _enviar(
+        self, local_path: str, dest_name: str, sha256: Optional[str], dedup: bool
+    ) -> Dict:
+        inicio = time.perf_counter()
+        resultado = {"arquivo": local_path, "destino": dest_name, "url": None}
+        try:
+            sha256 = sha256 or _sha256_arquivo(local_path)
+
+            if dedup and self._mesmo_conteudo(dest_name, sha256):
+                logger.info(f"Arquivo {dest_name} já existe com o mesmo conteúdo")
+                resultado["status"] = "ignorado"
+            else:
+                self.client.upload_file(
+                    local_path,
+                    self.bucket,
+                    dest_name,
+                    ExtraArgs={
+                        "ContentType": "application/pdf",
+                        "Metadata": {"sha256": sha256},
+                    },
+                    Config=TRANSFER_CONFIG,
+                )
+                self._indexar(dest_name)
+                resultado["status"] = "enviado"
+
+            resultado["url"] = f"{self.public_url_prefix}/{dest_name}"
+
+        except Exception as e:
+            logger.error(f"Erro no upload do arquivo {dest_name}: {str(e)}")
+            resultado["status"] = "erro"
+            resultado["erro"] = str(e)
+
+        resultado["tempo_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        return resultado
+
+    def upload_file(
+        self,
+        local_path: str,
+        dest_name: str,
+        sha256: Optional[str] = None,
+        dedup: bool = False,
+    ) -> Optional[str]:
         """
         Faz upload de um arquivo para o R2 Storage.
 
+        O hash SHA-256 do conteúdo é gravado nos metadados do objeto; com
+        dedup=True, o upload é ignorado se o objeto já existe com o mesmo hash.
+
         Args:
             local_path (str): Caminho local do arquivo
             dest_name (str): Nome do arquivo no Storage
+            sha256 (Optional[str]): Hash do arquivo, se já calculado
+            dedup (bool): Ignora o upload de conteúdo idêntico
+
+        Returns:
+            Optional[str]: URL pública do arquivo ou None se houver erro
+        """
+        logger.info(f"Iniciando upload do arquivo {dest_name}")
+        resultado = self._enviar(local_path, dest_name, sha256, dedup)
+        if resultado["status"] == "enviado":
+            logger.info(
+                f"Arquivo {dest_name} enviado com sucesso. URL: {resultado['url']}"
+            )
+        return resultado["url"]
+
+    def upload_files(
+        self,
+        files: List[Tuple[str, str]],
+        max_workers: int = 8,
+        dedup: bool = True,
+    ) -> List[Dict]:
+        """
+        Envia vários arquivos em paralelo, compartilhando o pool de conexões.
+
+        Args:
+            files (List[Tuple[str, str]]): Pares (caminho local, nome no Storage)
+            max_workers (int): Uploads simultâneos
+            dedup (bool): Ignora arquivos já existentes com o mesmo conteúdo
+
+        Returns:
+            List[Dict]: Um resultado por arquivo, na ordem recebida, com
+            arquivo, destino, status (enviado/ignorado/erro), url e tempo_ms
+        """
+        if not files:
+            return []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            resultados = list(
+                executor.map(
+                    lambda f: self._enviar(f[0], f[1], None, dedup),
+                    files,
+                )
+            )
+
+        contagem = {}
+        for r in resultados:
+            contagem[r["status"]] = contagem.get(r["status"], 0) + 1
+        logger.info(f"Upload em lote concluído: {contagem}")
+        return resultados
+
+    def upload_bytes(
+        self, data: bytes, dest_name: str, content_type: str = "application/pdf"
+    ) -> Optional[str]:
+        """
+        Grava um conteúdo em memória (ex.: miniaturas) no R2 Storage.
+
+        Args:
+            data (bytes): Conteúdo do arquivo
+            dest_name (str): Nome do arquivo no Storage
+            content_type (str): Tipo MIME do conteúdo
 
         Returns:
             Optional[str]: URL pública do arquivo ou None se houver erro
         """
         try:
-            logger.info(f"Iniciando upload do arquivo {dest_name}")
+            self.client.put_object(
+                Bucket=self.bucket, Key=dest_name, Body=data, ContentType=content_type
+            )
+            self._indexar(dest_name)
+            return f"{self.public_url_prefix}/{dest_name}"
 
-            # Faz o upload do arquivo
-            self.client.upload_file(
-                local_path,
-                self.bucket,
-                dest_name,
-                ExtraArgs={"ContentType": "application/pdf"},
+        except Exception as e:
+            logger.error(f"Erro no upload do arquivo {dest_name}: {str(e)}")
+            return None
+
+    def read_file(self, file_name: str) -> Optional[bytes]:
+        """
+        Lê um arquivo do R2 Storage para a memória.
+
+        Args:
+            file_name (str): Nome do arquivo no Storage
+
+        Returns:
+            Optional[bytes]: Conteúdo do arquivo ou None se não existir ou houver erro
+        """
+        try:
+            return self._obter_objeto(file_name)[0]
+
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                logger.error(f"Erro ao ler arquivo {file_name}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Erro ao ler arquivo {file_name}: {str(e)}")
+            return None
+
+    def _obter_objeto(self, file_name: str) -> Tuple[bytes, datetime]:
+        """
+        Lê um objeto inteiro, passando pelo cache em disco quando habilitado.
+
+        A entrada em cache é a do ETag registrado no índice local, mas o índice
+        não vê gravações feitas por outros processos: a entrada só é servida
+        depois de um GET condicional (If-None-Match) responder 304, sem corpo.
+        """
+        if self.cache is None:
+            response = self.client.get_object(Bucket=self.bucket, Key=file_name)
+            return response["Body"].read(), response["LastModified"]
+
+        info = self.index.obter(file_name)
+        dados = self.cache.ler(file_name, info["etag"]) if info else None
+        try:
+            if dados is None:
+                response = self.client.get_object(Bucket=self.bucket, Key=file_name)
+            else:
+                response = self.client.get_object(
+                    Bucket=self.bucket, Key=file_name, IfNoneMatch=f'"{info["etag"]}"'
+                )
+        except ClientError as e:
+            if dados is not None and e.response.get("Error", {}).get("Code") in (
+                "304",
+                "NotModified",
+            ):
+                return dados, info["last_modified"]
+            raise
+
+        dados = response["Body"].read()
+        etag = response["ETag"].strip('"')
+        self.cache.gravar(file_name, etag, dados)
+        if info is None or info["etag"] != etag:
+            # Alterado fora deste processo: corrige o índice
+            self.index.registrar(file_name, len(dados), etag, response["LastModified"])
+        return dados, response["LastModified"]
+
+    def get_etag(self, file_name: str) -> Optional[str]:
+        """
+        Consulta (HEAD) o ETag atual de um objeto.
+
+        Args:
+            file_name (str): Nome do arquivo no Storage
+
+        Returns:
+            Optional[str]: ETag sem aspas ou None se o arquivo não existir
+        """
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=file_name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ETag"].strip('"')
+
+    def download_file(self, file_name: str, local_path: str) -> bool:
+        """
+        Baixa um arquivo do R2 Storage para o disco local.
+
+        Args:
+            file_name (str): Nome do arquivo no Storage
+            local_path (str): Caminho local de destino
+
+        Returns:
+            bool: True se o download foi concluído com sucesso
+        """
+        try:
+            if self.cache is None:
+                self.client.download_file(self.bucket, file_name, local_path)
+            else:
+                dados, _ = self._obter_objeto(file_name)
+                with open(local_path, "wb") as f:
+                    f.write(dados)
+            return True
+
+        except Exception as e:
+            logger.error(f"Erro no download do arquivo {file_name}: {str(e)}")
+            return False
+
+    def rename_file(self, src_name: str, dest_name: str) -> Optional[str]:
+        """
+        Renomeia um arquivo no R2 Storage (cópia no servidor seguida de deleção).
+
+        Args:
+            src_name (str): Nome atual do arquivo no Storage
+            dest_name (str): Novo nome do arquivo no Storage
+
+        Returns:
+            Optional[str]: URL pública do arquivo renomeado ou None se houver erro
+        """
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=dest_name,
+                CopySource={"Bucket": self.bucket, "Key": src_name},
+                # Mantém o tipo e o hash de conteúdo gravados no upload
+                MetadataDirective="COPY",
             )
+            self.client.delete_object(Bucket=self.bucket, Key=src_name)
+            self.index.remover([src_name])
+            self._indexar(dest_name)
 
-            # Gera a URL pública
             url = f"{self.public_url_prefix}/{dest_name}"
-            logger.info(f"Arquivo {dest_name} enviado com sucesso. URL: {url}")
+            logger.info(f"Arquivo {src_name} renomeado para {dest_name}. URL: {url}")
             return url
 
         except Exception as e:
-            logger.error(f"Erro no upload do arquivo: {str(e)}")
+            logger.error(f"Erro ao renomear arquivo {src_name}: {str(e)}")
             return None
 
-    def delete_files(self, file_names: List[str]) -> bool:
+    def presigned_url(self, file_name: str, ttl: Optional[int] = None) -> Optional[Dict]:
         """
-        Deleta múltiplos arquivos do R2 Storage.
+        Gera uma URL assinada para baixar o arquivo direto do R2.
+
+        A URL é reaproveitada para o mesmo arquivo e validade enquanto restar
+        mais de 20% do prazo, o que também mantém o cache do navegador.
 
         Args:
-            file_names (List[str]): Lista com os nomes dos arquivos a serem deletados
+            file_name (str): Nome do arquivo no Storage
+            ttl (Optional[int]): Validade em segundos (padrão: R2_PRESIGNED_TTL)
 
         Returns:
-            bool: True se todos os arquivos foram deletados com sucesso
+            Optional[Dict]: {"url", "expira_em"} (epoch) ou None se houver erro
         """
+        ttl = ttl or PRESIGNED_TTL
+        agora = time.time()
+        with self._presigned_lock:
+            cache = self._presigned_cache.get((file_name, ttl))
+            if cache and cache[1] - agora > ttl * PRESIGNED_MARGEM:
+                return {"url": cache[0], "expira_em": int(cache[1])}
+
         try:
-            if not file_names:
-                return True
+            url = self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": file_name},
+                ExpiresIn=ttl,
+            )
+        except Exception as e:
+            logger.error(f"Erro ao gerar URL assinada para {file_name}: {str(e)}")
+            return None
 
-            # Prepara o objeto de deleção em lote
-            objects = {"Objects": [{"Key": name} for name in file_names]}
+        expira_em = agora + ttl
+        with self._presigned_lock:
+            # Descarta entradas vencidas para o cache não crescer indefinidamente
+            if len(self._presigned_cache) > 10_000:
+                self._presigned_cache = {
+                    k: v for k, v in self._presigned_cache.items() if v[1] > agora
+                }
+            self._presigned_cache[(file_name, ttl)] = (url, expira_em)
+        return {"url": url, "expira_em": int(expira_em)}
+
+    def get_file_range(self, file_name: str, range_header: Optional[str] = None) -> Dict:
+        """
+        Lê um arquivo (ou um intervalo dele) do R2 para repassar ao cliente.
 
-            # Deleta os arquivos
-            response = self.client.delete_objects(Bucket=self.bucket, Delete=objects)
+        Args:
+            file_name (str): Nome do arquivo no Storage
+            range_header (Optional[str]): Cabeçalho Range da requisição (ex.: bytes=0-65535)
 
-            # Verifica se houve erros
-            if "Errors" in response and response["Errors"]:
-                logger.error(f"Erros na deleção: {response['Errors']}")
-                return False
+        Returns:
+            Dict: status HTTP (200, 206, 404 ou 416), headers e body (iterador de
+            bytes, None em caso de erro); no 416, headers traz o Content-Range
+            com o tamanho do arquivo
+        """
+        params = {"Bucket": self.bucket, "Key": file_name}
+        if range_header:
+            params["Range"] = range_header
 
-            logger.info(f"Arquivos deletados com sucesso: {file_names}")
-            return True
+        try:
+            response = self.client.get_object(**params)
+        except ClientError as e:
+            codigo = e.response.get("Error", {}).get("Code")
+            if codigo in ("NoSuchKey", "404"):
+                return {"status": 404, "headers": {}, "body": None}
+            if codigo == "InvalidRange":
+                # O 416 informa o tamanho para o cliente refazer o pedido
+                head = self.client.head_object(Bucket=self.bucket, Key=file_name)
+                return {
+                    "status": 416,
+                    "headers": {"Content-Range": f"bytes */{head['ContentLength']}"},
+                    "body": None,
+                }
+            raise
+
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(response["ContentLength"]),
+            "Content-Type": response.get("ContentType", "application/pdf"),
+            "ETag": response.get("ETag", ""),
+            "Last-Modified": response["LastModified"].strftime(
+                "%a, %d %b %Y %H:%M:%S GMT"
+            ),
+        }
+        status = 200
+        if response.get("ContentRange"):
+            headers["Content-Range"] = response["ContentRange"]
+            status = 206
+
+        return {
+            "status": status,
+            "headers": headers,
+            "body": response["Body"].iter_chunks(PROXY_CHUNK_SIZE),
+        }
+
+    def key_from_url(self, url: str) -> Optional[str]:
+        """
+        Obtém o nome do arquivo no bucket a partir da URL pública.
+
+        Args:
+            url (str): URL pública (ex.: fichas_presenca.arquivo_digitalizado)
+
+        Returns:
+            Optional[str]: Nome do arquivo ou None se a URL não for deste bucket
+        """
+        prefixo = f"{self.public_url_prefix}/"
+        if not url or not url.startswith(prefixo):
+            return None
+        return url[len(prefixo) :] or None
+
+    def _delete_chunk(self, chaves: List[str]) -> Dict:
+        try:
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": c} for c in chaves], "Quiet": False},
+            )
+        except Exception as e:
+            return {
+                "deletados": [],
+                "erros": [
+                    {"chave": c, "codigo": "Exception", "mensagem": str(e)}
+                    for c in chaves
+                ],
+            }
+
+        deletados = [d["Key"] for d in response.get("Deleted", [])]
+        if deletados:
+            # Remove do índice os arquivos efetivamente deletados
+            self.index.remover(deletados)
+        return {
+            "deletados": deletados,
+            "erros": [
+                {"chave": e["Key"], "codigo": e.get("Code"), "mensagem": e.get("Message")}
+                for e in response.get("Errors", [])
+            ],
+        }
+
+    def bulk_delete(
+        self,
+        file_names: Optional[List[str]] = None,
+        prefix: Optional[str] = None,
+        older_than: Optional[datetime] = None,
+        dry_run: bool = False,
+        max_workers: int = 8,
+    ) -> Dict:
+        """
+        Deleta arquivos em lotes de até 1000 chaves, enviados em paralelo.
+
+        Sem `file_names`, os arquivos são obtidos da listagem paginada do
+        bucket, filtrada por `prefix` e/ou `older_than` (LastModified anterior).
+
+        Args:
+            file_names (Optional[List[str]]): Arquivos a deletar
+            prefix (Optional[str]): Prefixo dos arquivos a deletar (sem file_names)
+            older_than (Optional[datetime]): Apenas arquivos modificados antes desta data
+            dry_run (bool): Apenas conta os arquivos que seriam deletados
+            max_workers (int): Chamadas de deleção simultâneas
+
+        Returns:
+            Dict: total, deletados, erros (lista com chave, codigo e mensagem) e dry_run
+        """
+        if file_names is None:
+            file_names = [
+                obj["Key"]
+                for obj in self.iter_objects(prefix)
+                if older_than is None or obj["LastModified"] < older_than
+            ]
+
+        resultado = {
+            "total": len(file_names),
+            "deletados": 0,
+            "erros": [],
+            "dry_run": dry_run,
+        }
+        if dry_run or not file_names:
+            return resultado
+
+        chunks = [
+            file_names[i : i + DELETE_CHUNK_SIZE]
+            for i in range(0, len(file_names), DELETE_CHUNK_SIZE)
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for parcial in executor.map(self._delete_chunk, chunks):
+                resultado["deletados"] += len(parcial["deletados"])
+                resultado["erros"].extend(parcial["erros"])
+
+        if resultado["erros"]:
+            logger.error(
+                f"{len(resultado['erros'])} erros na deleção, ex.: {resultado['erros'][:5]}"
+            )
+        logger.info(
+            f"{resultado['deletados']} de {resultado['total']} arquivos deletados"
+        )
+        return resultado
+
+    def delete_files(self, file_names: List[str]) -> bool:
+        """
+        Deleta múltiplos arquivos do R2 Storage.
+
+        Args:
+            file_names (List[str]): Lista com os nomes dos arquivos a serem deletados
+
+        Returns:
+            bool: True se todos os arquivos foram deletados com sucesso
+        """
+        try:
+            return not self.bulk_delete(file_names)["erros"]
 
         except Exception as e:
             logger.error(f"Erro ao deletar arquivos: {str(e)}")
             return False
 
-    def list_files(self) -> List[Dict]:
+    def iter_objects(self, prefix: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Percorre todos os objetos do bucket, página a página.
+
+        Args:
+            prefix (Optional[str]): Lista apenas objetos com este prefixo
+
+        Yields:
+            Dict: Objeto como retornado por list_objects_v2 (Key, Size, ETag, LastModified)
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+        params = {"Bucket": self.bucket}
+        if prefix:
+            params["Prefix"] = prefix
+        for page in paginator.paginate(**params):
+            yield from page.get("Contents", [])
+
+    def list_files(self, prefix: Optional[str] = None) -> List[Dict]:
         """
-        Lista todos os arquivos no bucket.
+        Lista todos os arquivos no bucket (consultando o R2).
+
+        Args:
+            prefix (Optional[str]): Lista apenas arquivos com este prefixo
 
         Returns:
             List[Dict]: Lista de arquivos com suas informações
         """
         try:
-            response = self.client.list_objects_v2(Bucket=self.bucket)
-            files = []
-
-            for obj in response.get("Contents", []):
-                files.append(
-                    {
-                        "nome": obj["Key"],
-                        "size": obj["Size"],
-                        "created_at": obj["LastModified"].isoformat(),
-                        "url": f"{self.public_url_prefix}/{obj['Key']}",
-                    }
-                )
-
-            return files
+            return [
+                {
+                    "nome": obj["Key"],
+                    "size": obj["Size"],
+                    "created_at": obj["LastModified"].isoformat(),
+                    "url": f"{self.public_url_prefix}/{obj['Key']}",
+                }
+                for obj in self.iter_objects(prefix)
+            ]
 
         except Exception as e:
             logger.error(f"Erro ao listar arquivos: {str(e)}")
             return []
 
+    def reconcile_index(self) -> Optional[int]:
+        """
+        Reconstrói o índice local a partir da listagem completa do bucket.
+
+        Returns:
+            Optional[int]: Número de objetos indexados ou None se houver erro
+        """
+        try:
+            total = self.index.substituir(self.iter_objects())
+            logger.info(f"Índice do R2 reconciliado: {total} objetos")
+            return total
+
+        except Exception as e:
+            logger.error(f"Erro ao reconciliar índice do R2: {str(e)}")
+            return None
+
+    def list_indexed_files(
+        self,
+        prefix: Optional[str] = None,
+        search: Optional[str] = None,
+        limit: int = 0,
+        offset: int = 0,
+        exclude_prefix: Optional[str] = None,
+    ) -> Dict:
+        """
+        Lista arquivos a partir do índice local, sem listar o bucket.
+
+        Na primeira chamada (índice nunca reconciliado) o índice é construído.
+
+        Args:
+            prefix (Optional[str]): Filtra por prefixo do nome
+            search (Optional[str]): Filtra por trecho do nome
+            limit (int): Máximo de arquivos retornados (0 = todos)
+            offset (int): Arquivos a pular
+            exclude_prefix (Optional[str]): Omite os arquivos com este prefixo
+
+        Returns:
+            Dict: {"items": [...], "total": int} com itens no formato de list_files
+        """
+        if self.index.ultima_reconciliacao() is None:
+            self.reconcile_index()
+
+        resultado = self.index.listar(prefix, search, limit, offset, exclude_prefix)
+        return {
+            "items": [
+                {
+                    "nome": obj["chave"],
+                    "size": obj["tamanho"],
+                    "created_at": obj["last_modified"],
+                    "url": f"{self.public_url_prefix}/{obj['chave']}",
+                }
+                for obj in resultado["items"]
+            ],
+            "total": resultado["total"],
+        }
+
+    def stream_files_as_zip(
+        self,
+        file_names: Optional[List[str]] = None,
+        max_workers: int = 8,
+        prefetch: int = 16,
+        exclude_prefix: Optional[str] = None,
+    ) -> Iterator[bytes]:
+        """
+        Gera um arquivo ZIP em blocos, à medida que os arquivos são baixados.
+
+        Os downloads rodam em paralelo, mas no máximo `prefetch` arquivos ficam
+        em memória; as entradas são gravadas na ordem da lista por um único
+        ZipFile, então a memória não depende do tamanho do bucket.
+
+        Args:
+            file_names (Optional[List[str]]): Arquivos a incluir (padrão: todos)
+            max_workers (int): Downloads simultâneos
+            prefetch (int): Máximo de arquivos baixados aguardando gravação
+            exclude_prefix (Optional[str]): Omite os arquivos com este prefixo
+                (apenas quando file_names não é informado)
+
+        Yields:
+            bytes: Blocos do arquivo ZIP
+        """
+        if file_names is None:
+            file_names = [
+                f["nome"]
+                for f in self.list_files()
+                if not (exclude_prefix and f["nome"].startswith(exclude_prefix))
+            ]
+
+        def baixar(file_name: str):
+            try:
+                return self._obter_objeto(file_name)
+            except Exception as e:
+                logger.error(f"Erro ao processar arquivo {file_name}: {str(e)}")
+                return None
+
+        buffer = _BufferZipStream()
+        nomes = iter(file_names)
+        pendentes = deque()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def agendar():
+                for file_name in nomes:
+                    pendentes.append((file_name, executor.submit(baixar, file_name)))
+                    if len(pendentes) >= prefetch:
+                        return
+
+            try:
+                with zipfile.ZipFile(buffer, "w") as zip_file:
+                    agendar()
+                    while pendentes:
+                        file_name, future = pendentes.popleft()
+                        resultado = future.result()
+                        agendar()
+                        if resultado is None:
+                            continue
+
+                        conteudo, last_modified = resultado
+                        info = zipfile.ZipInfo(
+                            file_name, date_time=last_modified.timetuple()[:6]
+                        )
+                        info.file_size = len(conteudo)
+                        info.compress_type = (
+                            zipfile.ZIP_STORED
+                            if file_name.lower().endswith(EXTENSOES_COMPRIMIDAS)
+                            else zipfile.ZIP_DEFLATED
+                        )
+
+                        with zip_file.open(info, "w") as entrada:
+                            for inicio in range(0, len(conteudo), ZIP_CHUNK_SIZE):
+                                entrada.write(conteudo[inicio : inicio + ZIP_CHUNK_SIZE])
+                                yield buffer.drenar()
+                        del conteudo
+
+                        yield buffer.drenar()
+
+                # Diretório central, gravado ao fechar o ZipFile
+                yield buffer.drenar()
+            finally:
+                for _, future in pendentes:
+                    future.cancel()
+
     def download_all_files_as_zip(self) -> Optional[bytes]:
         """
         Baixa todos os arquivos do bucket e os compacta em um arquivo ZIP.
 
+        Prefira stream_files_as_zip, que não mantém o ZIP inteiro em memória.
+
         Returns:
             Optional[bytes]: Conteúdo do arquivo ZIP em bytes ou None se houver erro
         """
         try:
-            import io
-            import zipfile
-            from concurrent.futures import ThreadPoolExecutor, as_completed
-
-            # Criar um buffer em memória para o ZIP
-            zip_buffer = io.BytesIO()
-            
-            # Listar todos os arquivos no bucket
-            files = self.list_files()
-            
-            # Criar o arquivo ZIP
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                def download_and_add_to_zip(file_info):
-                    try:
-                        # Baixar o arquivo do R2
-                        response = self.client.get_object(Bucket=self.bucket, Key=file_info['nome'])
-                        file_content = response['Body'].read()
-                        
-                        # Adicionar ao ZIP
-                        zip_file.writestr(file_info['nome'], file_content)
-                        return True
-                    except Exception as e:
-                        logger.error(f"Erro ao processar arquivo {file_info['nome']}: {str(e)}")
-                        return False
-
-                # Usar ThreadPoolExecutor para baixar arquivos em paralelo
-                with ThreadPoolExecutor(max_workers=5) as executor:
-                    futures = [executor.submit(download_and_add_to_zip, file) for file in files]
-                    for future in as_completed(futures):
-                        future.result()
-
-            # Retornar o conteúdo do ZIP
-            return zip_buffer.getvalue()
+            return b"".join(self.stream_files_as_zip())
 
         except Exception as e:
             logger.error(f"Erro ao criar arquivo ZIP: {str(e)}")
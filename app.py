@@ -1,5 +1,10 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Query, Body
-from fastapi.responses import RedirectResponse
+from fastapi.responses import (
+    RedirectResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.middleware.cors import CORSMiddleware
 import database_supabase
 from auditoria import realizar_auditoria, realizar_auditoria_fichas_execucoes
@@ -24,6 +29,7 @@ from database_supabase import (
     excluir_ficha_presenca,
     listar_fichas_presenca,
     limpar_fichas_presenca,
+    listar_arquivos_fichas,
     listar_guias_paciente,
     listar_planos,
     criar_plano,
@@ -45,6 +51,10 @@ from auditoria_repository import (
 )
 from config import supabase  # Importar o cliente Supabase já inicializado
 from storage_r2 import storage  # Nova importação do R2
+import fila_fichas
+import miniaturas
+from metricas import MedicaoExtracao, registro_metricas
+import gzip
 import json
 import asyncio
 import base64
@@ -57,6 +67,8 @@ import uvicorn
 import sqlite3  # Adicionando importação do sqlite3
 import traceback
 import uuid  # Adicionar esta importação
+import hashlib
+import pymupdf
 
 from google import genai
 from google.genai import types
@@ -64,6 +76,24 @@ from google.genai import types
 claude_api_key = os.environ["ANTHROPIC_API_KEY"]
 gemini_api_key = os.environ["GEMINI_API_KEY"]
 
+# Cliente assíncrono compartilhado, para que várias páginas sejam extraídas em paralelo
+claude_client = anthropic.AsyncAnthropic(api_key=claude_api_key)
+
+# Número máximo de páginas/fichas extraídas simultaneamente
+EXTRACAO_CONCORRENCIA = int(os.getenv("EXTRACAO_CONCORRENCIA", "8"))
+
+# Erros do provedor de IA que justificam uma nova tentativa
+ERROS_TRANSITORIOS_PROVEDOR = (
+    anthropic.APIConnectionError,
+    anthropic.RateLimitError,
+    anthropic.InternalServerError,
+)
+
+# Tamanho dos blocos lidos do upload e prefixo dos arquivos brutos no R2
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+PREFIXO_ORIGINAIS = "originais"
+R2_INDEX_RECONCILE_SECONDS = int(os.getenv("R2_INDEX_RECONCILE_SECONDS", "900"))
+
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="PDF Processor API")
@@ -268,6 +298,13 @@ async def deletar_plano_route(plano_id: str):  # Mudado para str
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def reconciliar_indice_r2_periodicamente():
+    """Reconcilia o índice local de arquivos do R2 a cada R2_INDEX_RECONCILE_SECONDS"""
+    while True:
+        await asyncio.to_thread(storage.reconcile_index)
+        await asyncio.sleep(R2_INDEX_RECONCILE_SECONDS)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Inicializa recursos necessários para a aplicação"""
@@ -283,6 +320,9 @@ async def startup_event():
             logger.error("Erro: Cliente Supabase não inicializado")
             raise Exception("Cliente Supabase não inicializado")
 
+        # Mantém o índice local do R2 em sincronia com o bucket
+        asyncio.create_task(reconciliar_indice_r2_periodicamente())
+
     except Exception as e:
         logger.error(f"Erro na inicialização: {str(e)}")
         raise e
@@ -452,42 +492,51 @@ class AuditoriaRequest(BaseModel):
     data_fim: str | None = None
 
 
-async def extract_info_from_pdf(pdf_path: str):
+async def extract_info_from_pdf(
+    pdf_path: str, medicao: Optional[MedicaoExtracao] = None
+):
     if not os.path.isfile(pdf_path):
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
+    medicao = medicao or MedicaoExtracao()
     pdf_data = None
     try:
-        with open(pdf_path, "rb") as pdf_file:
-            pdf_data = base64.b64encode(pdf_file.read()).decode("utf-8")
+        with medicao.etapa("leitura_pdf"):
+            with open(pdf_path, "rb") as pdf_file:
+                conteudo = pdf_file.read()
+        with medicao.etapa("codificacao_base64"):
+            pdf_data = base64.b64encode(conteudo).decode("utf-8")
+        medicao.tamanho("pdf", len(conteudo))
+        medicao.tamanho("base64", len(pdf_data))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao ler PDF: {str(e)}")
 
     if not pdf_data:
         raise HTTPException(status_code=500, detail="Erro ao ler PDF: arquivo vazio")
 
-    client = anthropic.Anthropic(api_key=claude_api_key)
-
     try:
-        response = client.beta.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            betas=["pdfs-2024-09-25"],
-            max_tokens=4096,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "document",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "application/pdf",
-                                "data": pdf_data,
+        # Registrada mesmo quando a chamada falha (tempo até o erro)
+        response = await medicao.medir(
+            "chamada_modelo",
+            claude_client.beta.messages.create(
+                model="claude-3-5-sonnet-20241022",
+                betas=["pdfs-2024-09-25"],
+                max_tokens=4096,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "document",
+                                "source": {
+                                    "type": "base64",
+                                    "media_type": "application/pdf",
+                                    "data": pdf_data,
+                                },
                             },
-                        },
-                        {
-                            "type": "text",
-                            "text": """
+                            {
+                                "type": "text",
+                                "text": """
                         Analise este documento PDF e extraia as seguintes informações em JSON válido:
 
                         {
@@ -512,21 +561,28 @@ async def extract_info_from_pdf(pdf_path: str):
                         6. Assinale se houver assinaturas válidas. Para considerar uma linha com assinatura válida, basta verificar um pequeno quadrado no final da linha. Caso este quadrado esteja marcado ou pintado, é um campo que deveria ter uma assinatura na linha à esquerda. 
                         7. Retorne APENAS o JSON, sem texto adicional
                     """,
-                        },
-                    ],
-                }
-            ],
+                            },
+                        ],
+                    }
+                ],
+            ),
         )
+        medicao.registrar_tokens(
+            "anthropic", response.usage.input_tokens, response.usage.output_tokens
+        )
+        medicao.tamanho("resposta", len(response.content[0].text))
 
         # Parse a resposta JSON
-        dados_extraidos = json.loads(response.content[0].text)
+        with medicao.etapa("parse_json"):
+            dados_extraidos = json.loads(response.content[0].text)
 
-        # Garantir que todas as datas estejam no formato correto
-        for registro in dados_extraidos["registros"]:
-            registro["data_execucao"] = formatar_data(registro["data_execucao"])
+        with medicao.etapa("validacao"):
+            # Garantir que todas as datas estejam no formato correto
+            for registro in dados_extraidos["registros"]:
+                registro["data_execucao"] = formatar_data(registro["data_execucao"])
 
-        # Validar usando Pydantic
-        dados_validados = DadosGuia(**dados_extraidos)
+            # Validar usando Pydantic
+            dados_validados = DadosGuia(**dados_extraidos)
 
         # Criar DataFrame dos registros
         df = pd.DataFrame([registro.dict() for registro in dados_validados.registros])
@@ -537,6 +593,9 @@ async def extract_info_from_pdf(pdf_path: str):
             "status_validacao": "sucesso",
         }
 
+    except ERROS_TRANSITORIOS_PROVEDOR:
+        # Propaga para que a fila de ingestão possa tentar novamente
+        raise
     except json.JSONDecodeError as e:
         return {
             "erro": f"Erro ao processar JSON: {str(e)}",
@@ -729,12 +788,15 @@ async def test_pdf_extraction(
         }
 
 
-async def extract_info_from_pdf_gemini(pdf_path: str):
+async def extract_info_from_pdf_gemini(
+    pdf_path: str, medicao: Optional[MedicaoExtracao] = None
+):
     """
     Extrai informações de um arquivo PDF usando o Google Gemini.
 
     Args:
         pdf_path: Caminho do arquivo PDF
+        medicao: Medição onde registrar tempos, tamanhos e tokens (opcional)
 
     Returns:
         Dict contendo as informações extraídas em formato JSON
@@ -753,10 +815,16 @@ async def extract_info_from_pdf_gemini(pdf_path: str):
     if not os.path.isfile(pdf_path):
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
+    medicao = medicao or MedicaoExtracao()
     pdf_data = None
     try:
-        with open(pdf_path, "rb") as pdf_file:
-            pdf_data = base64.b64encode(pdf_file.read()).decode("utf-8")
+        with medicao.etapa("leitura_pdf"):
+            with open(pdf_path, "rb") as pdf_file:
+                conteudo = pdf_file.read()
+        with medicao.etapa("codificacao_base64"):
+            pdf_data = base64.b64encode(conteudo).decode("utf-8")
+        medicao.tamanho("pdf", len(conteudo))
+        medicao.tamanho("base64", len(pdf_data))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao ler PDF: {str(e)}")
 
@@ -802,24 +870,34 @@ async def extract_info_from_pdf_gemini(pdf_path: str):
         )
 
         # Faz a requisição ao Gemini
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",  # Usando o modelo mais rápido do Gemini
-            contents=[
-                types.Part.from_data(mime_type="application/pdf", data=pdf_data),
-                types.Part.from_text(prompt),
-            ],
-            config=config,
-        )
+        with medicao.etapa("chamada_modelo"):
+            response = client.models.generate_content(
+                model="gemini-2.0-flash-exp",  # Usando o modelo mais rápido do Gemini
+                contents=[
+                    types.Part.from_data(mime_type="application/pdf", data=pdf_data),
+                    types.Part.from_text(prompt),
+                ],
+                config=config,
+            )
+        if response.usage_metadata:
+            medicao.registrar_tokens(
+                "gemini",
+                response.usage_metadata.prompt_token_count,
+                response.usage_metadata.candidates_token_count,
+            )
+        medicao.tamanho("resposta", len(response.text))
 
         # Parse da resposta JSON
-        dados_extraidos = json.loads(response.text)
+        with medicao.etapa("parse_json"):
+            dados_extraidos = json.loads(response.text)
 
-        # Garantir que todas as datas estejam no formato correto
-        for registro in dados_extraidos["registros"]:
-            registro["data_execucao"] = formatar_data(registro["data_execucao"])
+        with medicao.etapa("validacao"):
+            # Garantir que todas as datas estejam no formato correto
+            for registro in dados_extraidos["registros"]:
+                registro["data_execucao"] = formatar_data(registro["data_execucao"])
 
-        # Validar usando Pydantic
-        dados_validados = DadosGuia(**dados_extraidos)
+            # Validar usando Pydantic
+            dados_validados = DadosGuia(**dados_extraidos)
 
         # Criar DataFrame dos registros
         df = pd.DataFrame([registro.dict() for registro in dados_validados.registros])
@@ -850,11 +928,330 @@ async def extract_info_from_pdf_gemini(pdf_path: str):
         }
 
 
+def dividir_pdf_por_pagina(pdf_path: str) -> List[str]:
+    """
+    Divide um PDF com várias fichas (uma por página) em arquivos de uma página.
+
+    Páginas em branco (sem texto e sem imagens) são descartadas. Se o PDF tiver
+    uma única página, retorna o próprio caminho recebido.
+    """
+    with pymupdf.open(pdf_path) as doc:
+        if doc.page_count <= 1:
+            return [pdf_path]
+
+        base = os.path.splitext(pdf_path)[0]
+        paginas = []
+        for indice, page in enumerate(doc):
+            if not page.get_text().strip() and not page.get_images():
+                logger.info(f"Página {indice + 1} de {pdf_path} em branco, ignorada")
+                continue
+
+            destino = f"{base}_p{indice + 1:03d}.pdf"
+            with pymupdf.open() as pagina_doc:
+                pagina_doc.insert_pdf(doc, from_page=indice, to_page=indice)
+                pagina_doc.save(destino, garbage=3, deflate=True)
+            paginas.append(destino)
+
+        return paginas
+
+
+def calcular_sha256(path: str) -> str:
+    """Calcula o hash SHA-256 de um arquivo lendo-o em blocos."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+async def salvar_upload_temporario(file: UploadFile) -> tuple[str, str]:
+    """
+    Grava o upload em blocos num arquivo temporário de nome único, calculando
+    o SHA-256 durante a gravação.
+
+    Returns:
+        tuple[str, str]: Caminho do arquivo temporário e hash do conteúdo
+    """
+    temp_pdf_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}.pdf")
+    hasher = hashlib.sha256()
+    tamanho = 0
+
+    try:
+        with open(temp_pdf_path, "wb") as temp_file:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                temp_file.write(chunk)
+                tamanho += len(chunk)
+
+        if not tamanho:
+            raise Exception("Arquivo PDF vazio")
+    except BaseException:
+        # Upload interrompido ou vazio: não deixa o arquivo parcial no disco
+        if os.path.exists(temp_pdf_path):
+            os.remove(temp_pdf_path)
+        raise
+
+    return temp_pdf_path, hasher.hexdigest()
+
+
+async def enviar_arquivo_ficha(
+    pdf_path: str,
+    chave_bruta: str,
+    upload_bruto: asyncio.Task,
+    novo_nome: str,
+    medicao: MedicaoExtracao,
+) -> Optional[str]:
+    """
+    Dá o nome final ao arquivo já enviado ao R2 pelo hash do conteúdo.
+
+    Se o envio antecipado falhou (ou o objeto sumiu no meio do caminho), faz o
+    upload normal com o nome final.
+    """
+    with medicao.etapa("espera_upload_r2"):
+        # shield: se a requisição for cancelada, a thread do upload continua e
+        # quem a espera é o finally de _processar_ficha_pdf
+        enviado = await asyncio.shield(upload_bruto)
+
+    if enviado:
+        with medicao.etapa("renomear_r2"):
+            arquivo_url = await asyncio.to_thread(
+                storage.rename_file, chave_bruta, novo_nome
+            )
+        if arquivo_url:
+            return arquivo_url
+
+    with medicao.etapa("upload_r2"):
+        return await asyncio.to_thread(
+            storage.upload_file, pdf_path, novo_nome, dedup=True
+        )
+
+
+async def processar_ficha_pdf(
+    pdf_path: str,
+    filename: str,
+    sha256: Optional[str] = None,
+    medicao: Optional[MedicaoExtracao] = None,
+) -> Dict:
+    """
+    Extrai os dados de uma ficha (PDF de uma página), envia o arquivo para o R2
+    e cria a ficha de presença com suas sessões.
+
+    O upload do arquivo para o R2 começa junto com a extração, sob uma chave
+    derivada do hash do conteúdo, e o objeto é renomeado para o nome final
+    (código da ficha) quando a extração termina. Os tempos de cada etapa vão
+    em result["metricas"] e para os histogramas de /metricas.
+    """
+    medicao = medicao or MedicaoExtracao()
+    try:
+        result = await _processar_ficha_pdf(pdf_path, filename, sha256, medicao)
+    finally:
+        registro_metricas.registrar(medicao)
+
+    result["metricas"] = medicao.as_dict()
+    return result
+
+
+async def _processar_ficha_pdf(
+    pdf_path: str, filename: str, sha256: Optional[str], medicao: MedicaoExtracao
+) -> Dict:
+    if sha256 is None:
+        with medicao.etapa("hash"):
+            sha256 = await asyncio.to_thread(calcular_sha256, pdf_path)
+
+    def upload_medido() -> Optional[str]:
+        with medicao.etapa("upload_r2_bruto"):
+            return storage.upload_file(pdf_path, chave_bruta, sha256, dedup=True)
+
+    chave_bruta = f"{PREFIXO_ORIGINAIS}/{sha256}.pdf"
+    upload_bruto = asyncio.create_task(asyncio.to_thread(upload_medido))
+
+    try:
+        return await _concluir_ficha_pdf(
+            pdf_path, filename, chave_bruta, upload_bruto, medicao
+        )
+    finally:
+        # O chamador remove o PDF temporário assim que retornamos, então a
+        # thread do upload (que não pode ser cancelada) precisa ter terminado
+        if not upload_bruto.done():
+            await asyncio.wait([upload_bruto])
+
+
+async def _concluir_ficha_pdf(
+    pdf_path: str,
+    filename: str,
+    chave_bruta: str,
+    upload_bruto: asyncio.Task,
+    medicao: MedicaoExtracao,
+) -> Dict:
+    try:
+        info = await extract_info_from_pdf(pdf_path, medicao)
+
+        if info.get("status_validacao") == "falha":
+            raise Exception(info.get("erro", "Erro desconhecido ao processar PDF"))
+
+        if not info["json"]["registros"]:
+            raise Exception("Nenhum registro encontrado no PDF")
+
+        dados_guia = info["json"]
+        primeira_linha = dados_guia["registros"][0]
+        data_formatada = primeira_linha["data_execucao"].replace("/", "-")
+        nome_paciente = primeira_linha["paciente_nome"].strip()
+        nome_paciente = "".join(c for c in nome_paciente if c.isalnum() or c.isspace())
+        nome_paciente = nome_paciente.replace(" ", "-")
+        novo_nome = f"{dados_guia['codigo_ficha']}-{nome_paciente}-{data_formatada}.pdf"
+    except Exception:
+        # Extração falhou: remove o arquivo bruto para não deixar órfãos no R2
+        if await asyncio.shield(upload_bruto):
+            await asyncio.to_thread(storage.delete_files, [chave_bruta])
+        raise
+
+    result = {
+        "status": "success",
+        "filename": filename,
+        "ficha_id": None,
+        "uploaded_file": None,
+        "num_sessoes": 0,
+    }
+
+    # Upload do arquivo PDF
+    arquivo_url = await enviar_arquivo_ficha(
+        pdf_path, chave_bruta, upload_bruto, novo_nome, medicao
+    )
+
+    miniaturas_task = None
+    if arquivo_url:
+        result["uploaded_file"] = {"nome": novo_nome, "url": arquivo_url}
+
+        # Miniaturas para a conferência, renderizadas enquanto a ficha é salva
+        def miniaturas_medidas() -> Dict[str, bytes]:
+            with medicao.etapa("miniaturas"):
+                return miniaturas.renderizar_miniaturas(pdf_path)
+
+        miniaturas_task = asyncio.create_task(asyncio.to_thread(miniaturas_medidas))
+
+    # Preparar dados da ficha e sessões
+    ficha_data = {
+        "codigo_ficha": dados_guia["codigo_ficha"],
+        "numero_guia": primeira_linha["guia_id"],
+        "paciente_nome": primeira_linha["paciente_nome"],
+        "paciente_carteirinha": primeira_linha["paciente_carteirinha"],
+        "arquivo_digitalizado": arquivo_url,
+        "data_atendimento": primeira_linha["data_execucao"],
+        "status": "pendente",
+        "sessoes": [],
+    }
+
+    # Criar sessões para cada registro
+    for registro in dados_guia["registros"]:
+        data_sessao = datetime.strptime(
+            registro["data_execucao"], "%d/%m/%Y"
+        ).strftime("%Y-%m-%d")
+
+        sessao = {
+            "data_sessao": data_sessao,
+            "possui_assinatura": registro["possui_assinatura"],
+            "status": "pendente",
+            "tipo_terapia": None,
+            "profissional_executante": None,
+            "valor_sessao": None,
+            "observacoes_sessao": None,
+        }
+
+        ficha_data["sessoes"].append(sessao)
+
+    renderizadas = None
+    try:
+        with medicao.etapa("salvar_ficha"):
+            ficha_id = await asyncio.to_thread(salvar_ficha_presenca, ficha_data)
+    finally:
+        # O PDF temporário é removido pelo chamador, então esperamos as miniaturas
+        if miniaturas_task:
+            try:
+                renderizadas = await miniaturas_task
+            except Exception as e:
+                logger.error(f"Erro ao renderizar miniaturas de {novo_nome}: {str(e)}")
+
+    if not ficha_id:
+        raise Exception("Erro ao criar ficha de presença")
+
+    # Só gravadas depois da ficha, para não deixar miniaturas de fichas não salvas
+    if renderizadas:
+        with medicao.etapa("upload_miniaturas"):
+            await asyncio.to_thread(
+                miniaturas.guardar_miniaturas, novo_nome, renderizadas
+            )
+
+    result["ficha_id"] = ficha_id
+    result["num_sessoes"] = len(ficha_data["sessoes"])
+
+    return result
+
+
+async def processar_paginas_pdf(
+    pdf_path: str,
+    filename: str,
+    sha256: Optional[str] = None,
+    medicao: Optional[MedicaoExtracao] = None,
+) -> List[Dict]:
+    """
+    Processa um PDF que pode conter várias fichas, uma por página.
+
+    Cada página vira uma ficha própria (com seu próprio objeto no R2) e as
+    páginas são extraídas em paralelo, limitadas por EXTRACAO_CONCORRENCIA.
+    O hash informado só vale para o arquivo inteiro, então é usado apenas
+    quando o PDF tem uma única página.
+    """
+    medicao = medicao or MedicaoExtracao()
+    with medicao.etapa("divisao_paginas"):
+        paginas = await asyncio.to_thread(dividir_pdf_por_pagina, pdf_path)
+    registro_metricas.registrar(medicao)
+    if not paginas:
+        raise Exception("Nenhuma página com conteúdo encontrada no PDF")
+
+    multipaginas = paginas != [pdf_path]
+    semaforo = asyncio.Semaphore(EXTRACAO_CONCORRENCIA)
+
+    async def processar_pagina(numero: int, pagina_path: str) -> Dict:
+        async with semaforo:
+            try:
+                result = await processar_ficha_pdf(
+                    pagina_path,
+                    filename,
+                    sha256 if pagina_path == pdf_path else None,
+                    medicao.filha(),
+                )
+            except Exception as e:
+                logger.error(
+                    f"Erro ao processar arquivo {filename} (página {numero}): {str(e)}"
+                )
+                result = {"status": "error", "filename": filename, "message": str(e)}
+
+        if multipaginas:
+            result["pagina"] = numero
+        return result
+
+    try:
+        return await asyncio.gather(
+            *(
+                processar_pagina(numero, pagina_path)
+                for numero, pagina_path in enumerate(paginas, start=1)
+            )
+        )
+    finally:
+        for pagina_path in paginas:
+            if pagina_path != pdf_path and os.path.exists(pagina_path):
+                os.remove(pagina_path)
+
+
 @app.post("/upload-pdf")
 async def upload_pdf(
     files: list[UploadFile] = File(description="Múltiplos arquivos PDF"),
 ):
-    """Processa PDFs de fichas de presença e cria registros com sessões"""
+    """Processa PDFs de fichas de presença e cria registros com sessões.
+
+    PDFs com várias páginas são divididos e cada página é tratada como uma
+    ficha independente.
+    """
     if not files:
         raise HTTPException(status_code=400, detail="Nenhum arquivo enviado")
 
@@ -876,88 +1273,21 @@ async def upload_pdf(
             continue
         processed_files.add(file.filename)
 
+        temp_pdf_path = None
+        medicao = MedicaoExtracao()
         try:
-            # Salvar o arquivo temporariamente
-            temp_pdf_path = os.path.join(TEMP_DIR, file.filename)
-            with open(temp_pdf_path, "wb") as temp_file:
-                content = await file.read()
-                temp_file.write(content)
+            # Salvar o arquivo temporariamente, em blocos e com nome único
+            with medicao.etapa("gravacao_temporaria"):
+                temp_pdf_path, sha256 = await salvar_upload_temporario(file)
+            medicao.tamanho("upload", os.path.getsize(temp_pdf_path))
 
             logger.info(f"Iniciando processamento do arquivo {file.filename}")
 
-            # Extrair informações do PDF
-            info = await extract_info_from_pdf(temp_pdf_path)
-
-            if info.get("status_validacao") == "falha":
-                raise Exception(info.get("erro", "Erro desconhecido ao processar PDF"))
-
-            result = {
-                "status": "success",
-                "filename": file.filename,
-                "ficha_id": None,
-                "uploaded_file": None,
-                "num_sessoes": 0,
-            }
-
-            dados_guia = info["json"]
-            if not dados_guia["registros"]:
-                raise Exception("Nenhum registro encontrado no PDF")
-
-            # Upload do arquivo PDF
-            primeira_linha = dados_guia["registros"][0]
-            data_formatada = primeira_linha["data_execucao"].replace("/", "-")
-            nome_paciente = primeira_linha["paciente_nome"].strip()
-            nome_paciente = "".join(
-                c for c in nome_paciente if c.isalnum() or c.isspace()
-            )
-            nome_paciente = nome_paciente.replace(" ", "-")
-
-            novo_nome = (
-                f"{dados_guia['codigo_ficha']}-{nome_paciente}-{data_formatada}.pdf"
+            results.extend(
+                await processar_paginas_pdf(
+                    temp_pdf_path, file.filename, sha256, medicao
+                )
             )
-            arquivo_url = storage.upload_file(temp_pdf_path, novo_nome)
-
-            if arquivo_url:
-                result["uploaded_file"] = {"nome": novo_nome, "url": arquivo_url}
-
-            # Preparar dados da ficha e sessões
-            ficha_data = {
-                "codigo_ficha": dados_guia["codigo_ficha"],
-                "numero_guia": primeira_linha["guia_id"],
-                "paciente_nome": primeira_linha["paciente_nome"],
-                "paciente_carteirinha": primeira_linha["paciente_carteirinha"],
-                "arquivo_digitalizado": arquivo_url,
-                "data_atendimento": primeira_linha["data_execucao"],
-                "status": "pendente",
-                "sessoes": [],
-            }
-
-            # Criar sessões para cada registro
-            for registro in dados_guia["registros"]:
-                data_sessao = datetime.strptime(
-                    registro["data_execucao"], "%d/%m/%Y"
-                ).strftime("%Y-%m-%d")
-
-                sessao = {
-                    "data_sessao": data_sessao,
-                    "possui_assinatura": registro["possui_assinatura"],
-                    "status": "pendente",
-                    "tipo_terapia": None,
-                    "profissional_executante": None,
-                    "valor_sessao": None,
-                    "observacoes_sessao": None,
-                }
-
-                ficha_data["sessoes"].append(sessao)
-
-            ficha_id = salvar_ficha_presenca(ficha_data)
-            if not ficha_id:
-                raise Exception("Erro ao criar ficha de presença")
-
-            result["ficha_id"] = ficha_id
-            result["num_sessoes"] = len(ficha_data["sessoes"])
-
-            results.append(result)
 
         except Exception as e:
             logger.error(f"Erro ao processar arquivo {file.filename}: {str(e)}")
@@ -970,12 +1300,117 @@ async def upload_pdf(
             )
         finally:
             # Limpar arquivo temporário
-            if os.path.exists(temp_pdf_path):
+            if temp_pdf_path and os.path.exists(temp_pdf_path):
                 os.remove(temp_pdf_path)
 
     return results
 
 
+@app.post("/upload-pdf/fila")
+async def upload_pdf_fila(
+    files: list[UploadFile] = File(description="Múltiplos arquivos PDF"),
+):
+    """
+    Recebe PDFs de fichas de presença e enfileira o processamento.
+
+    Os arquivos são guardados no R2 e processados pelos workers da fila
+    (fila_fichas.py); a resposta traz o id do lote para consultar o progresso
+    em /upload-pdf/fila/{lote_id}.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="Nenhum arquivo enviado")
+
+    lote_id = uuid.uuid4().hex
+    arquivos = []
+    rejeitados = []
+
+    for file in files:
+        if not file.filename.endswith(".pdf"):
+            rejeitados.append(
+                {
+                    "status": "error",
+                    "filename": file.filename,
+                    "message": "Apenas arquivos PDF são permitidos",
+                }
+            )
+            continue
+
+        temp_pdf_path = None
+        paginas = []
+        try:
+            temp_pdf_path, _ = await salvar_upload_temporario(file)
+            paginas = await asyncio.to_thread(dividir_pdf_por_pagina, temp_pdf_path)
+            if not paginas:
+                raise Exception("Nenhuma página com conteúdo encontrada no PDF")
+
+            arquivos.append(
+                await asyncio.to_thread(
+                    fila_fichas.enfileirar_arquivo,
+                    lote_id,
+                    len(arquivos),
+                    file.filename,
+                    paginas,
+                )
+            )
+        except Exception as e:
+            logger.error(f"Erro ao enfileirar arquivo {file.filename}: {str(e)}")
+            rejeitados.append(
+                {"status": "error", "filename": file.filename, "message": str(e)}
+            )
+        finally:
+            for path in {temp_pdf_path, *paginas}:
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    if arquivos:
+        await asyncio.to_thread(fila_fichas.registrar_lote, lote_id, arquivos)
+
+    return {
+        "lote_id": lote_id if arquivos else None,
+        "total_arquivos": len(arquivos),
+        "total_paginas": sum(arquivo["paginas"] for arquivo in arquivos),
+        "rejeitados": rejeitados,
+    }
+
+
+@app.get("/upload-pdf/fila/{lote_id}")
+async def status_upload_pdf_fila(lote_id: str):
+    """Retorna o progresso de um lote enfileirado, por arquivo e página"""
+    try:
+        status = await asyncio.to_thread(fila_fichas.obter_status_lote, lote_id)
+    except Exception as e:
+        logger.error(f"Erro ao consultar lote {lote_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not status:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    return status
+
+
+@app.get("/metricas")
+async def metricas_extracao(
+    formato: str = Query("json", description="Formato de saída (json ou prometheus)")
+):
+    """
+    Histogramas de tempo por etapa, tamanho de payload e tokens da extração,
+    e contadores do cache de leitura do storage (quando habilitado)
+    """
+    cache = storage.cache.estatisticas() if storage.cache else None
+
+    if formato == "prometheus":
+        texto = registro_metricas.exportar_prometheus()
+        if cache:
+            texto += "".join(
+                f"storage_cache_{nome} {valor}\n" for nome, valor in cache.items()
+            )
+        return PlainTextResponse(texto, media_type="text/plain; version=0.0.4")
+
+    metricas = registro_metricas.exportar()
+    if cache:
+        metricas["storage_cache"] = cache
+    return metricas
+
+
 @app.post("/excel/upload")
 async def upload_excel(file: UploadFile = File(...)):
     """Processa o upload de arquivo Excel"""
@@ -1347,46 +1782,201 @@ async def delete_files(files: list[str]):
 
 
 @app.get("/storage-files")
-async def list_storage_files_endpoint():
+async def list_storage_files_endpoint(
+    page: Optional[int] = Query(None, ge=1),
+    per_page: int = Query(50, ge=1, le=1000),
+    search: Optional[str] = None,
+    prefix: Optional[str] = None,
+):
     """
-    Lista todos os arquivos no storage.
+    Lista os arquivos no storage a partir do índice local.
+
+    Sem `page`, retorna a lista completa; com `page`, retorna
+    {items, total, pages, page}.
     """
     try:
-        files = storage.list_files()
-        return files
+        # As miniaturas geradas para a conferência não aparecem na listagem
+        sem_miniaturas = f"{miniaturas.PREFIXO_MINIATURAS}/"
+        if page is None:
+            resultado = await asyncio.to_thread(
+                storage.list_indexed_files,
+                prefix=prefix,
+                search=search,
+                exclude_prefix=sem_miniaturas,
+            )
+            return resultado["items"]
+
+        resultado = await asyncio.to_thread(
+            storage.list_indexed_files,
+            prefix=prefix,
+            search=search,
+            limit=per_page,
+            offset=(page - 1) * per_page,
+            exclude_prefix=sem_miniaturas,
+        )
+        return {
+            "items": resultado["items"],
+            "total": resultado["total"],
+            "pages": ceil(resultado["total"] / per_page),
+            "page": page,
+        }
     except Exception as e:
         logger.error(f"Erro ao listar arquivos do storage: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/storage-files/reindexar")
+async def reindexar_storage_files():
+    """
+    Reconstrói o índice local de arquivos a partir do bucket.
+    """
+    total = await asyncio.to_thread(storage.reconcile_index)
+    if total is None:
+        raise HTTPException(status_code=500, detail="Erro ao reindexar o storage")
+    return {"message": f"{total} arquivos indexados"}
+
+
 @app.delete("/storage-files/")
-async def delete_all_storage_files():
+async def delete_all_storage_files(
+    prefix: Optional[str] = None,
+    antes_de: Optional[str] = Query(
+        None, description="Apenas arquivos modificados antes desta data (YYYY-MM-DD)"
+    ),
+    dry_run: bool = False,
+):
     """
-    Deleta todos os arquivos do storage.
+    Deleta todos os arquivos do storage (ou os que atendem aos filtros).
+
+    Com dry_run=true, apenas informa quantos arquivos seriam deletados.
     """
     try:
-        # Primeiro lista todos os arquivos
-        files = storage.list_files()
-        if not files:
-            return {"message": "Nenhum arquivo para deletar"}
+        older_than = None
+        if antes_de:
+            try:
+                older_than = datetime.strptime(antes_de, "%Y-%m-%d").replace(
+                    tzinfo=timezone.utc
+                )
+            except ValueError:
+                raise HTTPException(
+                    status_code=400, detail="antes_de inválida, use o formato YYYY-MM-DD"
+                )
 
-        # Pega os nomes dos arquivos
-        file_names = [f["nome"] for f in files]
+        resultado = await asyncio.to_thread(
+            storage.bulk_delete,
+            prefix=prefix,
+            older_than=older_than,
+            dry_run=dry_run,
+        )
+        # A resposta traz só uma amostra dos erros
+        resultado["total_erros"] = len(resultado["erros"])
+        resultado["erros"] = resultado["erros"][:100]
 
-        # Deleta todos os arquivos
-        success = storage.delete_files(file_names)
-        if not success:
+        if not resultado["total"]:
+            return {"message": "Nenhum arquivo para deletar", **resultado}
+
+        if dry_run:
+            return {
+                "message": f"{resultado['total']} arquivos seriam deletados",
+                **resultado,
+            }
+
+        if resultado["erros"]:
             raise HTTPException(
-                status_code=500, detail="Erro ao deletar alguns arquivos"
+                status_code=500,
+                detail={
+                    "message": f"Erro ao deletar {resultado['total_erros']} arquivos",
+                    **resultado,
+                },
             )
 
-        return {"message": f"{len(file_names)} arquivos deletados com sucesso"}
+        return {
+            "message": f"{resultado['deletados']} arquivos deletados com sucesso",
+            **resultado,
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao deletar todos os arquivos: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/storage-files/{file_name:path}/url")
+async def presigned_storage_file_url(
+    file_name: str, ttl: Optional[int] = Query(None, ge=60, le=7 * 24 * 3600)
+):
+    """
+    Retorna uma URL assinada para o navegador baixar o arquivo direto do R2.
+    """
+    resultado = await asyncio.to_thread(storage.presigned_url, file_name, ttl)
+    if not resultado:
+        raise HTTPException(status_code=500, detail="Erro ao gerar URL do arquivo")
+    return resultado
+
+
+@app.get("/storage-files/{file_name:path}/conteudo")
+async def proxy_storage_file(file_name: str, request: Request):
+    """
+    Repassa o arquivo do R2 respeitando o cabeçalho Range, para que
+    visualizadores de PDF no navegador baixem apenas as partes necessárias.
+    """
+    try:
+        resultado = await asyncio.to_thread(
+            storage.get_file_range, file_name, request.headers.get("range")
+        )
+    except Exception as e:
+        logger.error(f"Erro ao ler arquivo {file_name}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if resultado["status"] == 404:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    if resultado["status"] == 416:
+        return Response(status_code=416, headers=resultado["headers"])
+
+    return StreamingResponse(
+        resultado["body"],
+        status_code=resultado["status"],
+        headers={
+            **resultado["headers"],
+            "Content-Disposition": f'inline; filename="{os.path.basename(file_name)}"',
+            "Cache-Control": "private, max-age=3600",
+        },
+    )
+
+
+async def _servir_miniatura(chave_pdf: str, tamanho: str, request: Request) -> Response:
+    """Responde com a miniatura WebP de um PDF do storage, usando ETag para revalidação"""
+    if tamanho not in miniaturas.TAMANHOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"tamanho deve ser um de {list(miniaturas.TAMANHOS)}",
+        )
+
+    # A miniatura muda quando o PDF muda, então o ETag é derivado do ETag do PDF
+    etag_pdf = await asyncio.to_thread(storage.get_etag, chave_pdf)
+    if etag_pdf is None:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    etag = f'"{hashlib.sha256(f"{etag_pdf}:{tamanho}".encode()).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    dados = await asyncio.to_thread(
+        miniaturas.obter_miniatura, chave_pdf, etag_pdf, tamanho
+    )
+    if dados is None:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    return Response(content=dados, media_type="image/webp", headers=headers)
+
+
+@app.get("/storage-files/{file_name:path}/miniatura")
+async def miniatura_storage_file(file_name: str, request: Request, tamanho: str = "p"):
+    """
+    Retorna a miniatura WebP da primeira página de um PDF do storage.
+    """
+    return await _servir_miniatura(file_name, tamanho, request)
+
+
 @app.delete("/storage-files/{file_name}")
 async def delete_storage_file(file_name: str):
     """
@@ -1408,27 +1998,97 @@ async def delete_storage_file(file_name: str):
 @app.get("/download-all-files")
 async def download_all_files():
     """
-    Endpoint para baixar todos os arquivos do storage em um único arquivo ZIP
+    Endpoint para baixar todos os arquivos do storage em um único arquivo ZIP.
+
+    O ZIP é gerado e enviado em blocos, à medida que os arquivos são baixados.
     """
     try:
-        # Gerar o arquivo ZIP
-        zip_content = storage.download_all_files_as_zip()
+        return StreamingResponse(
+            # As miniaturas são derivadas dos PDFs e ficam fora do ZIP
+            storage.stream_files_as_zip(
+                exclude_prefix=f"{miniaturas.PREFIXO_MINIATURAS}/"
+            ),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="fichas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+            },
+        )
+    except Exception as e:
+        logger.error(f"Erro ao baixar arquivos: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if not zip_content:
-            raise HTTPException(status_code=500, detail="Erro ao gerar arquivo ZIP")
 
-        # Retornar o arquivo ZIP como resposta
-        from fastapi.responses import Response
+@app.get("/exportar-fichas")
+async def exportar_fichas(
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    paciente_carteirinha: Optional[str] = None,
+    numero_guia: Optional[str] = None,
+    since: Optional[str] = None,
+):
+    """
+    Exporta em ZIP apenas os arquivos das fichas que atendem aos filtros.
 
-        return Response(
-            content=zip_content,
+    - data_inicio / data_fim: intervalo de data_atendimento (YYYY-MM-DD)
+    - paciente_carteirinha / numero_guia: filtros exatos
+    - since: apenas fichas criadas ou alteradas após este instante (ISO 8601);
+      use o valor do cabeçalho X-Export-Cursor da exportação anterior
+    """
+    try:
+        for nome, valor in (("data_inicio", data_inicio), ("data_fim", data_fim)):
+            if valor:
+                try:
+                    datetime.strptime(valor, "%Y-%m-%d")
+                except ValueError:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"{nome} inválida, use o formato YYYY-MM-DD",
+                    )
+        if since:
+            try:
+                datetime.fromisoformat(since.replace("Z", "+00:00"))
+            except ValueError:
+                raise HTTPException(
+                    status_code=400, detail="since inválido, use o formato ISO 8601"
+                )
+
+        # Cursor registrado antes da consulta para não perder fichas salvas durante a exportação;
+        # sufixo Z em vez de +00:00, que viraria espaço se colado sem codificação em ?since=
+        cursor = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+        fichas = await asyncio.to_thread(
+            listar_arquivos_fichas,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            paciente_carteirinha=paciente_carteirinha,
+            numero_guia=numero_guia,
+            desde=since,
+        )
+
+        # Várias fichas (páginas) podem apontar para o mesmo arquivo
+        arquivos = list(
+            dict.fromkeys(
+                chave
+                for chave in (
+                    storage.key_from_url(f["arquivo_digitalizado"]) for f in fichas
+                )
+                if chave
+            )
+        )
+
+        return StreamingResponse(
+            storage.stream_files_as_zip(arquivos),
             media_type="application/zip",
             headers={
-                "Content-Disposition": f'attachment; filename="fichas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+                "Content-Disposition": f'attachment; filename="fichas_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"',
+                "X-Export-Cursor": cursor,
+                "X-Export-Total": str(len(arquivos)),
             },
         )
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Erro ao baixar arquivos: {str(e)}")
+        logger.error(f"Erro ao exportar fichas: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -1486,6 +2146,23 @@ async def criar_ficha(ficha: FichaPresenca):
         raise HTTPException(status_code=500, detail="Erro ao criar ficha de presença")
 
 
+@app.get("/fichas-presenca/{ficha_id}/miniatura")
+async def miniatura_ficha_presenca(ficha_id: str, request: Request, tamanho: str = "p"):
+    """
+    Retorna a miniatura WebP da primeira página da ficha digitalizada,
+    para as telas de conferência não precisarem baixar o PDF inteiro.
+    """
+    ficha = await asyncio.to_thread(buscar_ficha_presenca, ficha_id, "id")
+    if not ficha:
+        raise HTTPException(status_code=404, detail="Ficha não encontrada")
+
+    chave_pdf = storage.key_from_url(ficha.get("arquivo_digitalizado"))
+    if not chave_pdf:
+        raise HTTPException(status_code=404, detail="Ficha sem arquivo digitalizado")
+
+    return await _servir_miniatura(chave_pdf, tamanho, request)
+
+
 @app.get("/fichas-presenca/{ficha_id}")
 async def buscar_ficha(ficha_id: str):
     """Busca uma ficha de presença específica"""
@@ -2044,6 +2721,34 @@ class Guia(BaseModel):
     }
 
 
+# Rota para receber guias da Unimed em lote (serviço de scraping)
+@app.post("/guias-unimed/lote")
+async def salvar_guias_unimed_lote(request: Request):
+    """
+    Recebe uma lista de guias da Unimed (JSON, opcionalmente com
+    Content-Encoding: gzip) e grava todas com um único upsert por numero_guia.
+    """
+    try:
+        corpo = await request.body()
+        if request.headers.get("content-encoding") == "gzip":
+            corpo = gzip.decompress(corpo)
+        guias = json.loads(corpo)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Corpo inválido: {str(e)}")
+
+    if not isinstance(guias, list):
+        raise HTTPException(status_code=400, detail="Esperada uma lista de guias")
+
+    try:
+        resultado = await asyncio.to_thread(
+            database_supabase.save_unimed_guides_bulk, guias
+        )
+        return {"received": len(guias), **resultado}
+    except Exception as e:
+        logging.error(f"Erro ao salvar guias da Unimed em lote: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Rota para listar guias
 @app.get("/guias", response_model=Dict)
 def listar_guias_route(
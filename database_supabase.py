@@ -1929,6 +1929,42 @@ def listar_planos():
         raise
 
 
+GUIA_UNIMED_CAMPOS_OBRIGATORIOS = [
+    "numero_guia",
+    "carteira",
+    "nome_beneficiario",
+    "codigo_procedimento",
+    "data_atendimento",
+    "nome_profissional",
+    "conselho_profissional",
+    "numero_conselho",
+    "uf_conselho",
+    "codigo_cbo",
+]
+
+
+def _preparar_guia_unimed(guide_data: Dict) -> Dict:
+    """Valida os campos obrigatórios e converte as datas de DD/MM/YYYY para ISO"""
+    for field in GUIA_UNIMED_CAMPOS_OBRIGATORIOS:
+        if field not in guide_data:
+            raise ValueError(f"Required field missing: {field}")
+
+    # Format dates
+    if isinstance(guide_data["data_atendimento"], str):
+        guide_data["data_atendimento"] = datetime.strptime(
+            guide_data["data_atendimento"], "%d/%m/%Y"
+        ).strftime("%Y-%m-%d")
+
+    if "data_execucao" in guide_data and guide_data["data_execucao"]:
+        guide_data["data_execucao"] = datetime.strptime(
+            guide_data["data_execucao"], "%d/%m/%Y"
+        ).strftime("%Y-%m-%d")
+
+    # Add timestamps
+    guide_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    return guide_data
+
+
 def save_unimed_guide(guide_data: Dict) -> Optional[Dict]:
     """Save or update a Unimed guide record in the database.
 
@@ -1939,37 +1975,7 @@ def save_unimed_guide(guide_data: Dict) -> Optional[Dict]:
         The saved guide record if successful, None if failed
     """
     try:
-        # Validate required fields
-        required_fields = [
-            "numero_guia",
-            "carteira",
-            "nome_beneficiario",
-            "codigo_procedimento",
-            "data_atendimento",
-            "nome_profissional",
-            "conselho_profissional",
-            "numero_conselho",
-            "uf_conselho",
-            "codigo_cbo",
-        ]
-
-        for field in required_fields:
-            if field not in guide_data:
-                raise ValueError(f"Required field missing: {field}")
-
-        # Format dates
-        if isinstance(guide_data["data_atendimento"], str):
-            guide_data["data_atendimento"] = datetime.strptime(
-                guide_data["data_atendimento"], "%d/%m/%Y"
-            ).strftime("%Y-%m-%d")
-
-        if "data_execucao" in guide_data and guide_data["data_execucao"]:
-            guide_data["data_execucao"] = datetime.strptime(
-                guide_data["data_execucao"], "%d/%m/%Y"
-            ).strftime("%Y-%m-%d")
-
-        # Add timestamps
-        guide_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+        guide_data = _preparar_guia_unimed(guide_data)
 
         # Check if guide exists
         existing = (
@@ -1999,6 +2005,42 @@ def save_unimed_guide(guide_data: Dict) -> Optional[Dict]:
         return None
 
 
+def save_unimed_guides_bulk(guides: List[Dict]) -> Dict:
+    """Save or update many Unimed guides with a single upsert on numero_guia.
+
+    Args:
+        guides: List of dictionaries with fields matching guias_unimed table
+
+    Returns:
+        Dictionary with the number of saved guides and the per-guide errors
+    """
+    rows = {}
+    errors = []
+    for i, guide in enumerate(guides):
+        try:
+            row = _preparar_guia_unimed(dict(guide))
+        except Exception as e:
+            errors.append(
+                {"index": i, "numero_guia": guide.get("numero_guia"), "error": str(e)}
+            )
+            continue
+        # Postgres rejects an upsert that touches the same row twice; last one wins
+        rows[row["numero_guia"]] = row
+
+    if not rows:
+        return {"saved": 0, "errors": errors}
+
+    try:
+        supabase.table("guias_unimed").upsert(
+            list(rows.values()), on_conflict="numero_guia", returning="minimal"
+        ).execute()
+        return {"saved": len(rows), "errors": errors}
+
+    except Exception as e:
+        logging.error(f"Error saving Unimed guides in bulk: {str(e)}")
+        raise
+
+
 def get_unimed_guides(
     limit: int = 100, offset: int = 0, filters: Optional[Dict] = None
 ) -> Dict:
@@ -2119,3 +2161,69 @@ def listar_fichas_presenca(
     except Exception as e:
         logging.error(f"Erro ao listar fichas de presença: {str(e)}")
         return {"items": [], "total": 0, "pages": 0}
+
+
+def listar_arquivos_fichas(
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    paciente_carteirinha: Optional[str] = None,
+    numero_guia: Optional[str] = None,
+    desde: Optional[str] = None,
+    page_size: int = 1000,
+) -> List[Dict]:
+    """
+    Lista os arquivos digitalizados das fichas de presença que atendem aos filtros.
+
+    Args:
+        data_inicio: Data de atendimento inicial (YYYY-MM-DD)
+        data_fim: Data de atendimento final (YYYY-MM-DD)
+        paciente_carteirinha: Carteirinha do paciente
+        numero_guia: Número da guia
+        desde: Apenas fichas criadas ou alteradas depois deste instante (ISO 8601)
+        page_size: Registros buscados por requisição
+
+    Returns:
+        Lista de dicts com id, arquivo_digitalizado, data_atendimento e updated_at
+
+    Erros da consulta são propagados: uma lista incompleta faria a exportação
+    avançar o cursor sem os arquivos.
+    """
+
+    def consulta():
+        # O builder acumula parâmetros a cada chamada de .range(); cada página
+        # precisa de uma consulta nova
+        query = (
+            supabase.table("fichas_presenca")
+            .select("id,arquivo_digitalizado,data_atendimento,updated_at")
+            .not_.is_("arquivo_digitalizado", "null")
+        )
+
+        if data_inicio:
+            query = query.gte("data_atendimento", data_inicio)
+        if data_fim:
+            query = query.lte("data_atendimento", data_fim)
+        if paciente_carteirinha:
+            query = query.eq("paciente_carteirinha", paciente_carteirinha)
+        if numero_guia:
+            query = query.eq("numero_guia", numero_guia)
+        if desde:
+            query = query.or_(f"created_at.gt.{desde},updated_at.gt.{desde}")
+
+        return query.order("data_atendimento").order("id")
+
+    try:
+        # O Supabase limita o número de linhas por requisição
+        fichas = []
+        offset = 0
+        while True:
+            response = consulta().range(offset, offset + page_size - 1).execute()
+            fichas.extend(response.data)
+            if len(response.data) < page_size:
+                break
+            offset += page_size
+
+        return fichas
+
+    except Exception as e:
+        logging.error(f"Erro ao listar arquivos das fichas: {str(e)}")
+        raise
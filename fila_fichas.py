@@ -0,0 +1,255 @@
+"""
+Fila de ingestão de fichas de presença em PDF.
+
+Os PDFs recebidos em /upload-pdf/fila são divididos em páginas, guardados no
+R2 e cada página vira um job na fila "fichas" do RQ. Os workers
+(``python fila_fichas.py``) extraem os dados e salvam as fichas, com novas
+tentativas e intervalo crescente quando o provedor de IA falha de forma
+transitória. O progresso de cada lote fica num hash do Redis.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from redis import Redis
+from rq import Queue, Retry, Worker, get_current_job
+
+from storage_r2 import storage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FILA_FICHAS = "fichas"
+PREFIXO_FILA = "fila"
+TTL_LOTE = 7 * 24 * 60 * 60  # Status dos lotes ficam disponíveis por 7 dias
+INTERVALOS_TENTATIVA = [15, 60, 180]  # Segundos entre as novas tentativas
+TIMEOUT_JOB = 10 * 60
+
+redis_conn = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+fila = Queue(FILA_FICHAS, connection=redis_conn)
+
+
+def _chave_lote(lote_id: str) -> str:
+    return f"lote_fichas:{lote_id}"
+
+
+def atualizar_pagina(lote_id: str, indice_arquivo: int, pagina: int, dados: Dict):
+    """Atualiza o status de uma página do lote no Redis"""
+    chave = _chave_lote(lote_id)
+    campo = f"{indice_arquivo}:{pagina}"
+
+    atual = redis_conn.hget(chave, campo)
+    registro = json.loads(atual) if atual else {}
+    registro.update(dados)
+    registro["atualizado_em"] = datetime.now().isoformat()
+
+    pipe = redis_conn.pipeline()
+    pipe.hset(chave, campo, json.dumps(registro, ensure_ascii=False))
+    pipe.expire(chave, TTL_LOTE)
+    pipe.execute()
+
+
+def enfileirar_arquivo(
+    lote_id: str, indice_arquivo: int, filename: str, paginas: List[str]
+) -> Dict:
+    """
+    Envia as páginas de um arquivo para o R2 e cria um job por página.
+
+    Args:
+        lote_id: Identificador do lote
+        indice_arquivo: Posição do arquivo no lote
+        filename: Nome original do arquivo enviado
+        paginas: Caminhos locais dos PDFs de uma página
+
+    Returns:
+        Dict com o nome do arquivo e o número de páginas enfileiradas
+    """
+    chaves = [
+        f"{PREFIXO_FILA}/{lote_id}/{indice_arquivo}-{pagina}.pdf"
+        for pagina in range(1, len(paginas) + 1)
+    ]
+    resultados = storage.upload_files(list(zip(paginas, chaves)), dedup=False)
+    falhas = [
+        pagina
+        for pagina, r in enumerate(resultados, start=1)
+        if r["status"] == "erro"
+    ]
+    if falhas:
+        raise Exception(f"Erro ao guardar as páginas {falhas} no storage")
+
+    for pagina, chave in enumerate(chaves, start=1):
+        atualizar_pagina(
+            lote_id,
+            indice_arquivo,
+            pagina,
+            {"filename": filename, "pagina": pagina, "status": "na_fila"},
+        )
+        fila.enqueue(
+            processar_pagina_fila,
+            lote_id,
+            indice_arquivo,
+            pagina,
+            filename,
+            chave,
+            retry=Retry(max=len(INTERVALOS_TENTATIVA), interval=INTERVALOS_TENTATIVA),
+            job_timeout=TIMEOUT_JOB,
+            result_ttl=TTL_LOTE,
+            failure_ttl=TTL_LOTE,
+        )
+
+    return {"filename": filename, "paginas": len(paginas)}
+
+
+def registrar_lote(lote_id: str, arquivos: List[Dict]):
+    """Grava os dados gerais do lote (arquivos e total de páginas)"""
+    meta = {
+        "criado_em": datetime.now().isoformat(),
+        "arquivos": arquivos,
+    }
+    pipe = redis_conn.pipeline()
+    pipe.hset(_chave_lote(lote_id), "meta", json.dumps(meta, ensure_ascii=False))
+    pipe.expire(_chave_lote(lote_id), TTL_LOTE)
+    pipe.execute()
+
+
+def obter_status_lote(lote_id: str) -> Optional[Dict]:
+    """
+    Retorna o progresso do lote, agrupado por arquivo.
+
+    Returns:
+        Dict com o status geral e de cada arquivo, ou None se o lote não existe
+    """
+    dados = {
+        k.decode("utf-8"): json.loads(v)
+        for k, v in redis_conn.hgetall(_chave_lote(lote_id)).items()
+    }
+    if not dados:
+        return None
+
+    meta = dados.pop("meta", {"arquivos": []})
+    arquivos = [
+        {
+            "indice": indice,
+            "filename": arquivo["filename"],
+            "total_paginas": arquivo["paginas"],
+            "concluidas": 0,
+            "erros": 0,
+            "paginas": [],
+        }
+        for indice, arquivo in enumerate(meta["arquivos"])
+    ]
+    por_indice = {arquivo["indice"]: arquivo for arquivo in arquivos}
+
+    for campo, pagina in sorted(
+        dados.items(), key=lambda item: tuple(map(int, item[0].split(":")))
+    ):
+        indice = int(campo.split(":")[0])
+        arquivo = por_indice.get(indice)
+        if arquivo is None:
+            # Lote ainda sendo registrado
+            continue
+        arquivo["paginas"].append(pagina)
+        if pagina["status"] in ("sucesso", "erro"):
+            arquivo["concluidas"] += 1
+        if pagina["status"] == "erro":
+            arquivo["erros"] += 1
+
+    total_paginas = sum(arquivo["total_paginas"] for arquivo in arquivos)
+    concluidas = sum(arquivo["concluidas"] for arquivo in arquivos)
+
+    return {
+        "lote_id": lote_id,
+        "criado_em": meta.get("criado_em"),
+        "status": (
+            "concluido" if arquivos and concluidas >= total_paginas else "processando"
+        ),
+        "total_arquivos": len(arquivos),
+        "total_paginas": total_paginas,
+        "concluidas": concluidas,
+        "erros": sum(arquivo["erros"] for arquivo in arquivos),
+        "arquivos": arquivos,
+    }
+
+
+def processar_pagina_fila(
+    lote_id: str, indice_arquivo: int, pagina: int, filename: str, chave: str
+) -> Dict:
+    """Job do RQ: baixa a página do R2, extrai os dados e salva a ficha"""
+    # Importação tardia: o app importa este módulo para enfileirar os jobs
+    from app import ERROS_TRANSITORIOS_PROVEDOR, TEMP_DIR, processar_ficha_pdf
+
+    job = get_current_job()
+    atualizar_pagina(lote_id, indice_arquivo, pagina, {"status": "processando"})
+
+    temp_pdf_path = os.path.join(TEMP_DIR, f"{uuid.uuid4().hex}.pdf")
+    try:
+        if not storage.download_file(chave, temp_pdf_path):
+            raise Exception("Arquivo da fila não encontrado no storage")
+
+        result = asyncio.run(processar_ficha_pdf(temp_pdf_path, filename))
+
+    except ERROS_TRANSITORIOS_PROVEDOR as e:
+        vai_repetir = bool(job and job.retries_left)
+        logger.warning(
+            f"Erro transitório no lote {lote_id}, arquivo {filename} "
+            f"(página {pagina}): {str(e)}"
+        )
+        atualizar_pagina(
+            lote_id,
+            indice_arquivo,
+            pagina,
+            {
+                "status": "tentando_novamente" if vai_repetir else "erro",
+                "message": str(e),
+            },
+        )
+        if not vai_repetir:
+            storage.delete_files([chave])
+        raise
+
+    except Exception as e:
+        logger.error(
+            f"Erro ao processar lote {lote_id}, arquivo {filename} "
+            f"(página {pagina}): {str(e)}"
+        )
+        atualizar_pagina(
+            lote_id, indice_arquivo, pagina, {"status": "erro", "message": str(e)}
+        )
+        storage.delete_files([chave])
+        return {"status": "erro", "filename": filename, "message": str(e)}
+
+    finally:
+        if os.path.exists(temp_pdf_path):
+            os.remove(temp_pdf_path)
+
+    result["status"] = "sucesso"
+    atualizar_pagina(lote_id, indice_arquivo, pagina, result)
+    storage.delete_files([chave])
+    return result
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+    try:
+        redis_conn.ping()
+        logger.info("Conectado ao Redis, aguardando fichas na fila...")
+        Worker([fila], connection=redis_conn).work()
+    except Exception as e:
+        logger.error(f"Erro ao iniciar worker de fichas: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
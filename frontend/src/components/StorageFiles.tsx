@@ -57,7 +57,7 @@ const StorageFiles = ({ onDownloadAll, onClearStorage, loading }: StorageFilesPr
 
       console.log('Dados normalizados:', files);
       setFiles(files);
-      setTotalPages(Math.ceil(files.length / itemsPerPage));
+      setTotalPages(data.pages ?? Math.ceil(files.length / itemsPerPage));
     } catch (error) {
       console.error('Error:', error);
       setError('Erro ao carregar arquivos');
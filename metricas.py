@@ -0,0 +1,194 @@
+"""
+Instrumentação do pipeline de extração de fichas.
+
+MedicaoExtracao coleta, para um arquivo/página, o tempo de cada etapa, o
+tamanho dos payloads e os tokens consumidos no provedor de IA. As medições são
+agregadas em histogramas em memória (por processo) e expostas pelo endpoint
+/metricas em JSON ou no formato texto do Prometheus.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, List, Optional, Tuple, TypeVar
+
+BUCKETS_SEGUNDOS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+BUCKETS_BYTES = [
+    10_000,
+    50_000,
+    100_000,
+    250_000,
+    500_000,
+    1_000_000,
+    2_500_000,
+    5_000_000,
+    10_000_000,
+    25_000_000,
+]
+BUCKETS_TOKENS = [100, 250, 500, 1000, 2500, 5000, 10_000, 25_000, 50_000]
+
+T = TypeVar("T")
+
+
+class MedicaoExtracao:
+    """
+    Tempos, tamanhos e tokens de uma extração.
+
+    Etapas que rodam em threads (upload, miniaturas) registram na mesma
+    medição que o event loop, então os contadores ficam sob um lock.
+    """
+
+    def __init__(self, herdadas: Optional[Dict] = None):
+        self.etapas: Dict[str, float] = {}
+        self.tamanhos: Dict[str, int] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        # Medições do arquivo de origem (ex.: gravação temporária), apenas exibidas
+        self._herdadas = herdadas or {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def etapa(self, nome: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar_etapa(nome, time.perf_counter() - inicio)
+
+    async def medir(self, nome: str, aguardavel: Awaitable[T]) -> T:
+        """Aguarda `aguardavel` registrando o tempo como etapa, mesmo se falhar"""
+        with self.etapa(nome):
+            return await aguardavel
+
+    def registrar_etapa(self, nome: str, segundos: float):
+        with self._lock:
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos
+
+    def tamanho(self, nome: str, valor: int):
+        with self._lock:
+            self.tamanhos[nome] = valor
+
+    def registrar_tokens(self, provedor: str, entrada: int, saida: int):
+        with self._lock:
+            self.tokens[provedor] = {"entrada": entrada or 0, "saida": saida or 0}
+
+    def proprias(self) -> Tuple[Dict[str, float], Dict[str, int], Dict[str, Dict[str, int]]]:
+        """Cópia das etapas, tamanhos e tokens desta medição (sem as herdadas)"""
+        with self._lock:
+            return (
+                dict(self.etapas),
+                dict(self.tamanhos),
+                {provedor: dict(t) for provedor, t in self.tokens.items()},
+            )
+
+    def filha(self) -> "MedicaoExtracao":
+        """Nova medição (ex.: uma página) que exibe também as medições desta"""
+        return MedicaoExtracao(herdadas=self.as_dict())
+
+    def as_dict(self) -> Dict:
+        etapas, tamanhos, tokens = self.proprias()
+        etapas_ms = {
+            **self._herdadas.get("etapas_ms", {}),
+            **{nome: round(valor * 1000, 1) for nome, valor in etapas.items()},
+        }
+        return {
+            "etapas_ms": etapas_ms,
+            "tamanhos_bytes": {
+                **self._herdadas.get("tamanhos_bytes", {}),
+                **tamanhos,
+            },
+            "tokens": {**self._herdadas.get("tokens", {}), **tokens},
+        }
+
+
+class Histograma:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.contagens = [0] * len(buckets)
+        self.total = 0
+        self.soma = 0.0
+
+    def observar(self, valor: float):
+        self.total += 1
+        self.soma += valor
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.contagens[i] += 1
+
+    def as_dict(self) -> Dict:
+        return {
+            "count": self.total,
+            "sum": self.soma,
+            "buckets": {str(b): c for b, c in zip(self.buckets, self.contagens)},
+        }
+
+
+class RegistroMetricas:
+    """Agrega as medições em histogramas, de forma segura entre threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histograma] = {}
+
+    def observar(
+        self, nome: str, valor: float, buckets: List[float], **labels: str
+    ):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(buckets)
+            histograma.observar(valor)
+
+    def registrar(self, medicao: MedicaoExtracao):
+        """Registra apenas as medições próprias (não as herdadas)"""
+        etapas, tamanhos, tokens_por_provedor = medicao.proprias()
+        for etapa, segundos in etapas.items():
+            self.observar(
+                "extracao_etapa_segundos", segundos, BUCKETS_SEGUNDOS, etapa=etapa
+            )
+        for tipo, valor in tamanhos.items():
+            self.observar("extracao_payload_bytes", valor, BUCKETS_BYTES, tipo=tipo)
+        for provedor, tokens in tokens_por_provedor.items():
+            for tipo, valor in tokens.items():
+                self.observar(
+                    "extracao_tokens",
+                    valor,
+                    BUCKETS_TOKENS,
+                    provedor=provedor,
+                    tipo=tipo,
+                )
+
+    def exportar(self) -> Dict:
+        with self._lock:
+            metricas: Dict[str, List[Dict]] = {}
+            for (nome, labels), histograma in sorted(self._histogramas.items()):
+                metricas.setdefault(nome, []).append(
+                    {"labels": dict(labels), **histograma.as_dict()}
+                )
+            return metricas
+
+    def exportar_prometheus(self) -> str:
+        linhas = []
+        with self._lock:
+            nomes_vistos = set()
+            for (nome, labels), histograma in sorted(self._histogramas.items()):
+                if nome not in nomes_vistos:
+                    linhas.append(f"# TYPE {nome} histogram")
+                    nomes_vistos.add(nome)
+
+                base = ",".join(f'{k}="{v}"' for k, v in labels)
+                sep = "," if base else ""
+                for limite, contagem in zip(histograma.buckets, histograma.contagens):
+                    linhas.append(
+                        f'{nome}_bucket{{{base}{sep}le="{limite}"}} {contagem}'
+                    )
+                linhas.append(
+                    f'{nome}_bucket{{{base}{sep}le="+Inf"}} {histograma.total}'
+                )
+                linhas.append(f"{nome}_sum{{{base}}} {histograma.soma}")
+                linhas.append(f"{nome}_count{{{base}}} {histograma.total}")
+        return "\n".join(linhas) + "\n"
+
+
+# Instância global usada pelo app
+registro_metricas = RegistroMetricas()
@@ -0,0 +1,158 @@
+"""
+Miniaturas da primeira página das fichas digitalizadas.
+
+As telas de conferência mostram a ficha em tamanho reduzido; em vez de baixar
+o PDF escaneado inteiro, servimos imagens WebP da primeira página em alguns
+tamanhos. As miniaturas são geradas no upload (ou na primeira requisição),
+guardadas no R2 sob uma chave derivada da chave e do ETag do PDF e mantidas
+também em um cache em disco local. Um PDF regravado na mesma chave tem outro
+ETag, então nunca recebe a miniatura da versão anterior.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+from typing import Dict, Optional
+
+import pymupdf
+
+from storage_r2 import storage
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_MINIATURAS = "miniaturas"
+TAMANHOS = {"p": 240, "m": 720}  # Largura em pixels
+QUALIDADE_WEBP = 75
+MINIATURAS_DIR = os.getenv("MINIATURAS_DIR", os.path.join("cache", "miniaturas"))
+
+
+def chave_miniatura(chave_pdf: str, etag_pdf: str, tamanho: str) -> str:
+    """Chave no R2 da miniatura de um PDF (ex.: miniaturas/ficha.pdf.<etag>.p.webp)"""
+    return f"{PREFIXO_MINIATURAS}/{chave_pdf}.{etag_pdf}.{tamanho}.webp"
+
+
+def _caminho_cache(chave_pdf: str, etag_pdf: str, tamanho: str) -> str:
+    nome = hashlib.sha256(f"{chave_pdf}\0{etag_pdf}".encode()).hexdigest()
+    return os.path.join(MINIATURAS_DIR, f"{nome}.{tamanho}.webp")
+
+
+def _ler_cache(chave_pdf: str, etag_pdf: str, tamanho: str) -> Optional[bytes]:
+    try:
+        with open(_caminho_cache(chave_pdf, etag_pdf, tamanho), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _gravar_cache(chave_pdf: str, etag_pdf: str, tamanho: str, dados: bytes):
+    os.makedirs(MINIATURAS_DIR, exist_ok=True)
+    caminho = _caminho_cache(chave_pdf, etag_pdf, tamanho)
+    temp_path = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(dados)
+    os.replace(temp_path, caminho)
+
+
+def renderizar_miniaturas(pdf_path: str) -> Dict[str, bytes]:
+    """
+    Renderiza a primeira página do PDF em WebP, em cada tamanho de TAMANHOS.
+
+    Args:
+        pdf_path: Caminho local do PDF
+
+    Returns:
+        Dict com o conteúdo WebP por tamanho
+    """
+    miniaturas = {}
+    with pymupdf.open(pdf_path) as doc:
+        page = doc[0]
+        for tamanho, largura in TAMANHOS.items():
+            zoom = largura / page.rect.width
+            pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            miniaturas[tamanho] = pix.pil_tobytes(format="WEBP", quality=QUALIDADE_WEBP)
+    return miniaturas
+
+
+def guardar_miniaturas(
+    chave_pdf: str, miniaturas: Dict[str, bytes], etag_pdf: Optional[str] = None
+) -> bool:
+    """
+    Guarda no R2 e no cache em disco as miniaturas já renderizadas de um PDF.
+
+    Args:
+        chave_pdf: Chave do PDF no R2
+        miniaturas: Conteúdo WebP por tamanho (de renderizar_miniaturas)
+        etag_pdf: ETag do PDF; consultado no R2 se omitido
+
+    Returns:
+        True se todas as miniaturas foram guardadas
+    """
+    etag_pdf = etag_pdf or storage.get_etag(chave_pdf)
+    if etag_pdf is None:
+        logger.error(f"PDF {chave_pdf} não encontrado para guardar as miniaturas")
+        return False
+
+    sucesso = True
+    for tamanho, dados in miniaturas.items():
+        _gravar_cache(chave_pdf, etag_pdf, tamanho, dados)
+        if not storage.upload_bytes(
+            dados, chave_miniatura(chave_pdf, etag_pdf, tamanho), content_type="image/webp"
+        ):
+            sucesso = False
+    return sucesso
+
+
+def gerar_miniaturas(pdf_path: str, chave_pdf: str, etag_pdf: Optional[str] = None) -> bool:
+    """
+    Gera as miniaturas de um PDF local e as guarda no R2 e no cache em disco.
+
+    Args:
+        pdf_path: Caminho local do PDF
+        chave_pdf: Chave do PDF no R2
+        etag_pdf: ETag do PDF; consultado no R2 se omitido
+
+    Returns:
+        True se todas as miniaturas foram geradas e guardadas
+    """
+    try:
+        miniaturas = renderizar_miniaturas(pdf_path)
+    except Exception as e:
+        logger.error(f"Erro ao renderizar miniaturas de {chave_pdf}: {str(e)}")
+        return False
+    return guardar_miniaturas(chave_pdf, miniaturas, etag_pdf)
+
+
+def obter_miniatura(chave_pdf: str, etag_pdf: str, tamanho: str) -> Optional[bytes]:
+    """
+    Retorna a miniatura de um PDF do R2, gerando-a se ainda não existir.
+
+    Procura primeiro no cache em disco, depois no R2 e, por último, baixa o
+    PDF e renderiza as miniaturas.
+
+    Args:
+        chave_pdf: Chave do PDF no R2
+        etag_pdf: ETag atual do PDF (StorageR2.get_etag)
+        tamanho: Uma das chaves de TAMANHOS
+
+    Returns:
+        Conteúdo WebP ou None se o PDF não existir ou não puder ser renderizado
+    """
+    dados = _ler_cache(chave_pdf, etag_pdf, tamanho)
+    if dados is not None:
+        return dados
+
+    dados = storage.read_file(chave_miniatura(chave_pdf, etag_pdf, tamanho))
+    if dados is not None:
+        _gravar_cache(chave_pdf, etag_pdf, tamanho, dados)
+        return dados
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "ficha.pdf")
+        if not storage.download_file(chave_pdf, pdf_path):
+            return None
+        # O ETag é consultado de novo: o PDF pode ter mudado desde a requisição
+        gerar_miniaturas(pdf_path, chave_pdf)
+
+    return _ler_cache(chave_pdf, etag_pdf, tamanho)
@@ -1,14 +1,22 @@
 import mysql.connector
 from mysql.connector import Error
-from typing import Dict, List, Optional
-from datetime import datetime
+from mysql.connector.errors import PoolError
+from mysql.connector.pooling import MySQLConnectionPool
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import logging
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
-import traceback  # Added for detailed error tracking
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Database configuration
 DB_CONFIG = {
     "host": "64.23.148.2",
@@ -18,110 +26,332 @@ DB_CONFIG = {
     "database": "abalarissa_db",
 }
 
+# Connections kept open to MySQL, shared by all requests of the process
+POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "5"))
+# Seconds to wait for a free pooled connection before giving up
+POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
+# Identical schedule queries within this many seconds are served from memory
+CACHE_TTL = float(os.getenv("MYSQL_CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = 256
+# Totals change slowly and cost a scan of the filtered range, so they live longer
+COUNT_CACHE_TTL = float(os.getenv("MYSQL_COUNT_CACHE_TTL", "300"))
+# Patient name search: "prefix" (B-tree index on client_nome, matches the start
+# of the name) or "fulltext" (FULLTEXT index, matches the start of any word)
+NAME_SEARCH = os.getenv("MYSQL_NAME_SEARCH", "prefix")
+
+DATE_FORMAT = "%d/%m/%Y"
+COUNT_MODES = ("exact", "estimate", "none")
+
+SCHEDULE_COLUMNS = """
+    ps.schedule_id,
+    ps.schedule_date_start,
+    ps.schedule_date_end,
+    ps.schedule_pacient_id,
+    ps.schedule_pagamento_id,
+    ps.schedule_room_id,
+    ps.schedule_qtd_sessions,
+    ps.schedule_status,
+    ps.schedule_room_rent_value,
+    ps.schedule_fixed,
+    ps.schedule_especialidade_id,
+    ps.schedule_local_id,
+    ps.schedule_saldo_sessoes,
+    ps.schedule_elegibilidade,
+    ps.schedule_falta_do_profissional,
+    ps.schedule_parent_id,
+    ps.schedule_registration_date,
+    ps.schedule_lastupdate,
+    ps.parent_id,
+    ps.schedule_codigo_faturamento,
+    c.client_nome as paciente_nome,
+    c.client_numero_carteirinha as carteirinha
+"""
+
+_pool: Optional[MySQLConnectionPool] = None
+_pool_lock = threading.Lock()
+
+_cache: Dict[Tuple, Tuple[float, object]] = {}
+_cache_lock = threading.Lock()
+
+
+def _get_pool() -> MySQLConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MySQLConnectionPool(
+                pool_name="schedule",
+                pool_size=POOL_SIZE,
+                # Resetting the session would drop the prepared statements
+                pool_reset_session=False,
+                **DB_CONFIG,
+            )
+            logger.info(f"MySQL pool created with {POOL_SIZE} connections")
+        return _pool
+
+
 def get_mysql_connection():
-    """Create a connection to MySQL database"""
+    """
+    Take a connection from the pool; close() returns it to the pool.
+
+    The pool checks the connection is alive and reconnects it if needed.
+    Waits up to POOL_TIMEOUT seconds when every connection is in use.
+    """
     try:
-        print("Attempting to connect to MySQL database...")
-        connection = mysql.connector.connect(**DB_CONFIG)
-        if connection.is_connected():
-            print("Successfully connected to MySQL database")
-            return connection
-        else:
-            print("Failed to connect to MySQL database")
-            return None
+        pool = _get_pool()
+        deadline = time.monotonic() + POOL_TIMEOUT
+        while True:
+            try:
+                return pool.get_connection()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
     except Error as e:
-        print(f"Error connecting to MySQL database: {e}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.error(f"Error connecting to MySQL database: {e}")
+        return None
+
+
+@contextmanager
+def mysql_connection():
+    """Pooled connection for a `with` block (None if MySQL is unavailable)"""
+    connection = get_mysql_connection()
+    try:
+        yield connection
+    finally:
+        if connection:
+            connection.close()
+
+
+def _execute(connection, query: str, params: List) -> List[Dict]:
+    """Run a statement through a prepared cursor reused across calls"""
+    # The pool wraps the same MySQL connection on every checkout and reconnects
+    # it in place, so the cursors live on that connection, tagged with the
+    # server connection id: a reconnect gives a new id and drops them
+    cnx = getattr(connection, "_cnx", connection)
+    connection_id, statements = getattr(cnx, "_prepared_statements", (None, {}))
+    if connection_id != connection.connection_id:
+        statements = {}
+        cnx._prepared_statements = (connection.connection_id, statements)
+    cursor = statements.get(query)
+    if cursor is None:
+        cursor = connection.cursor(prepared=True, dictionary=True)
+        statements[query] = cursor
+    try:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    except Error:
+        # The connection may be broken; let the pool reconnect it
+        cnx._prepared_statements = (None, {})
+        raise
+
+
+def _cached(key: Tuple):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+    return None
+
+
+def _store(key: Tuple, result, ttl: float = CACHE_TTL):
+    now = time.monotonic()
+    with _cache_lock:
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            for k in [k for k, (expires, _) in _cache.items() if expires <= now]:
+                del _cache[k]
+            # Still full: drop the oldest entries
+            while len(_cache) >= CACHE_MAX_ENTRIES:
+                del _cache[next(iter(_cache))]
+        _cache[key] = (now + ttl, result)
+
+
+def clear_schedule_cache():
+    """Forget cached schedule results (e.g. after the schedule changed)"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _name_filter(paciente_nome: str) -> Tuple[Optional[str], List]:
+    """Index-friendly predicate on the patient name"""
+    if NAME_SEARCH == "fulltext":
+        words = re.findall(r"\w+", paciente_nome)
+        if not words:
+            return None, []
+        # Every word must match the start of a word of the name
+        return "MATCH(c.client_nome) AGAINST (%s IN BOOLEAN MODE)", [
+            " ".join(f"+{word}*" for word in words)
+        ]
+
+    # The column collation is case-insensitive, so no LOWER() is needed
+    escaped = re.sub(r"([\\%_])", r"\\\1", paciente_nome.strip())
+    return "c.client_nome LIKE %s", [f"{escaped}%"]
+
+
+def build_schedule_filters(
+    paciente_nome: Optional[str] = None,
+    data_inicial: Optional[str] = None,
+    data_final: Optional[str] = None,
+) -> Tuple[List[str], List, bool]:
+    """
+    WHERE predicates for the schedule filters, as (predicates, params,
+    needs the ps_clients join). Dates (dd/mm/yyyy) become a half-open range on
+    the raw schedule_date_start column, so its index can be used.
+    """
+    predicates, params = [], []
+    needs_clients = False
+
+    if paciente_nome:
+        predicate, name_params = _name_filter(paciente_nome)
+        if predicate:
+            predicates.append(predicate)
+            params.extend(name_params)
+            needs_clients = True
+
+    if data_inicial:
+        predicates.append("ps.schedule_date_start >= %s")
+        params.append(datetime.strptime(data_inicial, DATE_FORMAT))
+
+    if data_final:
+        predicates.append("ps.schedule_date_start < %s")
+        params.append(datetime.strptime(data_final, DATE_FORMAT) + timedelta(days=1))
+
+    return predicates, params, needs_clients
+
+
+def encode_cursor(registro: Dict) -> str:
+    """Keyset cursor pointing after a record (raw schedule_date_start)"""
+    return f"{registro['schedule_date_start']:%Y-%m-%dT%H:%M:%S}_{registro['schedule_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    date_start, schedule_id = cursor.rsplit("_", 1)
+    return datetime.strptime(date_start, "%Y-%m-%dT%H:%M:%S"), int(schedule_id)
+
+
+def build_schedule_query(
+    limit: int = 100,
+    offset: int = 0,
+    paciente_nome: Optional[str] = None,
+    data_inicial: Optional[str] = None,
+    data_final: Optional[str] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[str, List]:
+    """
+    Page query, newest first. With a cursor (keyset paging on
+    (schedule_date_start, schedule_id)) the offset is ignored.
+    """
+    predicates, params, _ = build_schedule_filters(paciente_nome, data_inicial, data_final)
+    if cursor:
+        date_start, schedule_id = decode_cursor(cursor)
+        predicates.append(
+            "(ps.schedule_date_start < %s"
+            " OR (ps.schedule_date_start = %s AND ps.schedule_id < %s))"
+        )
+        params.extend([date_start, date_start, schedule_id])
+        offset = 0
+
+    query = f"""
+        SELECT {SCHEDULE_COLUMNS}
+        FROM ps_schedule ps
+        LEFT JOIN ps_clients c ON ps.schedule_pacient_id = c.client_id
+        {"WHERE " + " AND ".join(predicates) if predicates else ""}
+        ORDER BY ps.schedule_date_start DESC, ps.schedule_id DESC
+        LIMIT %s OFFSET %s
+    """
+    return query, params + [limit, offset]
+
+
+def build_count_query(
+    paciente_nome: Optional[str] = None,
+    data_inicial: Optional[str] = None,
+    data_final: Optional[str] = None,
+) -> Tuple[str, List]:
+    """Count query; joins ps_clients only when filtering by name"""
+    predicates, params, needs_clients = build_schedule_filters(
+        paciente_nome, data_inicial, data_final
+    )
+    query = "SELECT COUNT(*) AS total FROM ps_schedule ps"
+    if needs_clients:
+        query += " JOIN ps_clients c ON ps.schedule_pacient_id = c.client_id"
+    if predicates:
+        query += " WHERE " + " AND ".join(predicates)
+    return query, params
+
+
+def _count(connection, filters: Tuple, mode: str) -> Optional[int]:
+    """Total for the filters: exact (cached for COUNT_CACHE_TTL), estimated or none"""
+    if mode == "none":
         return None
 
+    key = ("count", mode) + filters
+    total = _cached(key) if COUNT_CACHE_TTL > 0 else None
+    if total is not None:
+        return total
+
+    query, params = build_count_query(*filters)
+    if mode == "estimate":
+        # Optimizer row estimates: no scan, but can be off by a wide margin
+        total = 1
+        for row in _execute(connection, f"EXPLAIN {query}", params):
+            total *= (row["rows"] or 0) * float(row["filtered"] or 100) / 100
+        total = int(total)
+    else:
+        total = _execute(connection, query, params)[0]["total"]
+
+    if COUNT_CACHE_TTL > 0:
+        _store(key, total, COUNT_CACHE_TTL)
+    return total
+
+
 def fetch_schedule_data(
     limit: int = 100,
     offset: int = 0,
     paciente_nome: Optional[str] = None,
     data_inicial: Optional[str] = None,
-    data_final: Optional[str] = None
+    data_final: Optional[str] = None,
+    cursor: Optional[str] = None,
+    count: str = "exact",
 ) -> Dict:
     """
     Fetch data from ps_schedule table with pagination and filters
+
+    Pages are newest first. Pass the previous page's "next_cursor" as `cursor`
+    for keyset paging (constant cost at any depth); `offset` still works for
+    jumping to a page number. `count` is "exact", "estimate" (from the query
+    plan) or "none" (total and total_pages come back as None).
+
+    Results are cached for CACHE_TTL seconds per combination of arguments and
+    shared between callers, so they must not be modified.
     """
+    if count not in COUNT_MODES:
+        raise ValueError(f"count must be one of {COUNT_MODES}")
+
+    filters = (paciente_nome, data_inicial, data_final)
+    cache_key = (limit, offset, cursor, count) + filters
+    if CACHE_TTL > 0:
+        cached = _cached(cache_key)
+        if cached is not None:
+            return cached
+
     try:
-        print(f"\nFetching schedule data with parameters:")
-        print(f"limit: {limit}, offset: {offset}")
-        print(f"paciente_nome: {paciente_nome}")
-        print(f"data_inicial: {data_inicial}")
-        print(f"data_final: {data_final}")
-
-        connection = get_mysql_connection()
-        if not connection:
-            print("No database connection available")
-            return {"registros": [], "total": 0, "total_pages": 1}
-
-        cursor = connection.cursor(dictionary=True)
-
-        # Base query
-        query = """
-            SELECT 
-                ps.schedule_id,
-                ps.schedule_date_start,
-                ps.schedule_date_end,
-                ps.schedule_pacient_id,
-                ps.schedule_pagamento_id,
-                ps.schedule_room_id,
-                ps.schedule_qtd_sessions,
-                ps.schedule_status,
-                ps.schedule_room_rent_value,
-                ps.schedule_fixed,
-                ps.schedule_especialidade_id,
-                ps.schedule_local_id,
-                ps.schedule_saldo_sessoes,
-                ps.schedule_elegibilidade,
-                ps.schedule_falta_do_profissional,
-                ps.schedule_parent_id,
-                ps.schedule_registration_date,
-                ps.schedule_lastupdate,
-                ps.parent_id,
-                ps.schedule_codigo_faturamento,
-                c.client_nome as paciente_nome,
-                c.client_numero_carteirinha as carteirinha
-            FROM ps_schedule ps
-            LEFT JOIN ps_clients c ON ps.schedule_pacient_id = c.client_id
-            WHERE 1=1
-        """
-        params = []
-
-        # Add filters
-        if paciente_nome:
-            query += " AND LOWER(c.client_nome) LIKE LOWER(%s)"
-            params.append(f"%{paciente_nome}%")
-
-        if data_inicial:
-            query += " AND DATE(ps.schedule_date_start) >= STR_TO_DATE(%s, '%d/%m/%Y')"
-            params.append(data_inicial)
-
-        if data_final:
-            query += " AND DATE(ps.schedule_date_start) <= STR_TO_DATE(%s, '%d/%m/%Y')"
-            params.append(data_final)
-
-        # Count total records
-        count_query = f"SELECT COUNT(*) as total FROM ({query}) as subquery"
-        print(f"\nExecuting count query: {count_query}")
-        print(f"With parameters: {params}")
-        
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()["total"]
-        print(f"Total records found: {total}")
-
-        # Add pagination
-        query += " ORDER BY ps.schedule_date_start DESC LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
-
-        # Execute main query
-        print(f"\nExecuting main query: {query}")
-        print(f"With parameters: {params}")
-        
-        cursor.execute(query, params)
-        registros = cursor.fetchall()
-        print(f"Records fetched: {len(registros)}")
+        query, params = build_schedule_query(limit, offset, *filters, cursor=cursor)
+
+        with mysql_connection() as connection:
+            if not connection:
+                logger.error("No database connection available")
+                return {"registros": [], "total": 0, "total_pages": 1}
+
+            started = time.monotonic()
+            total = _count(connection, filters, count)
+            registros = _execute(connection, query, params)
+            logger.debug(
+                f"Schedule query {cache_key}: {len(registros)}/{total} records "
+                f"in {time.monotonic() - started:.3f}s"
+            )
+
+        next_cursor = (
+            encode_cursor(registros[-1]) if limit > 0 and len(registros) == limit else None
+        )
 
         # Format dates and decimals
         for registro in registros:
@@ -131,21 +361,23 @@ def fetch_schedule_data(
                 elif isinstance(value, float):
                     registro[key] = float(value)
 
-        cursor.close()
-        connection.close()
-        print("Database connection closed")
-
-        return {
+        result = {
             "registros": registros,
             "total": total,
-            "total_pages": (total + limit - 1) // limit if limit > 0 else 1
+            "total_pages": (
+                None
+                if total is None
+                else (total + limit - 1) // limit if limit > 0 else 1
+            ),
+            "next_cursor": next_cursor,
         }
+        if CACHE_TTL > 0:
+            _store(cache_key, result)
+        return result
 
     except Error as e:
-        print(f"MySQL Error: {e}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception(f"MySQL Error: {e}")
         return {"registros": [], "total": 0, "total_pages": 1}
     except Exception as e:
-        print(f"General Error: {e}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception(f"General Error: {e}")
         return {"registros": [], "total": 0, "total_pages": 1}
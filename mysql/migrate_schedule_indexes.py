@@ -0,0 +1,89 @@
+"""
+Create the MySQL indexes used by fetch_schedule_data (database_mysql.py) and
+the agendamentos sync.
+
+An index is only created when no existing index of the same kind already
+starts with its columns, so the script can be run any number of times:
+
+    python migrate_schedule_indexes.py            # create what is missing
+    python migrate_schedule_indexes.py --dry-run  # only print the statements
+"""
+
+import argparse
+from typing import Dict, List
+
+import mysql.connector
+
+from database_mysql import DB_CONFIG
+
+# (table, index name, columns, kind)
+SCHEDULE_INDEXES = [
+    # Date range filters and keyset paging. InnoDB appends the primary key to
+    # secondary indexes, so this also orders by (schedule_date_start, schedule_id)
+    ("ps_schedule", "idx_schedule_date_start", ["schedule_date_start"], "BTREE"),
+    # Joins from a patient name search back to the schedule
+    ("ps_schedule", "idx_schedule_pacient_id", ["schedule_pacient_id"], "BTREE"),
+    # Name search by prefix (MYSQL_NAME_SEARCH=prefix)
+    ("ps_clients", "idx_client_nome", ["client_nome"], "BTREE"),
+    # Name search by word (MYSQL_NAME_SEARCH=fulltext)
+    ("ps_clients", "ft_client_nome", ["client_nome"], "FULLTEXT"),
+    # Incremental agendamentos sync (scripts/import_agendamentos_sistema_aba.py)
+    ("ps_schedule", "idx_schedule_lastupdate", ["schedule_lastupdate"], "BTREE"),
+]
+
+
+def existing_indexes(cursor, table: str) -> Dict[str, Dict]:
+    """Indexes of a table: name -> {"kind", "columns"}"""
+    cursor.execute(
+        """
+        SELECT index_name, index_type, column_name
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        ORDER BY index_name, seq_in_index
+        """,
+        (table,),
+    )
+    indexes = {}
+    for name, kind, column in cursor.fetchall():
+        index = indexes.setdefault(name, {"kind": kind, "columns": []})
+        index["columns"].append(column)
+    return indexes
+
+
+def missing_statements(cursor) -> List[str]:
+    statements = []
+    for table, name, columns, kind in SCHEDULE_INDEXES:
+        covered = any(
+            index["kind"] == kind and index["columns"][: len(columns)] == columns
+            for index in existing_indexes(cursor, table).values()
+        )
+        if not covered:
+            prefix = "FULLTEXT INDEX" if kind == "FULLTEXT" else "INDEX"
+            statements.append(
+                f"CREATE {prefix} {name} ON {table} ({', '.join(columns)})"
+            )
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    connection = mysql.connector.connect(**DB_CONFIG)
+    try:
+        cursor = connection.cursor()
+        statements = missing_statements(cursor)
+        if not statements:
+            print("All schedule indexes already exist")
+        for statement in statements:
+            print(statement)
+            if not args.dry_run:
+                cursor.execute(statement)
+        cursor.close()
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark UnimedScraper against the local fake portal (no network access).
+
+Reports guides per minute, seconds per phase (browser start, login, listing,
+HTTP details, Selenium fallback), the portal's injected errors (each one a
+client retry) and the pacing totals. Needs Chrome and chromedriver.
+
+    python benchmark.py --days 3 --guides-per-day 40 --latency 0.05 --json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from fake_portal import DATE_FORMAT, FakePortal
+
+
+def run_benchmark(args) -> dict:
+    with FakePortal(
+        guides_per_day=args.guides_per_day,
+        page_size=args.page_size,
+        latency=args.latency,
+        transient_errors=args.transient_errors,
+    ) as portal:
+        # Read at import time by portal.py and pacing.py
+        os.environ["UNIMED_BASE_URL"] = portal.base_url
+        os.environ["UNIMED_MAX_RATE"] = str(args.max_rate)
+        os.environ["UNIMED_RATE"] = str(args.rate or args.max_rate)
+        os.environ.setdefault("SCRAPER_HEADLESS", "true")
+        from scraper import UnimedScraper
+
+        start = date(2024, 1, 15)
+        end = start + timedelta(days=args.days - 1)
+        profile_dir = tempfile.mkdtemp(prefix="unimed-bench-")
+        scraper = UnimedScraper(chrome_profile_path=profile_dir)
+        phases = {}
+        try:
+            started = time.monotonic()
+            scraper.setup_driver()
+            phases["browser_seconds"] = time.monotonic() - started
+
+            started = time.monotonic()
+            if not scraper.login(portal.username, portal.password):
+                raise RuntimeError("Login on the fake portal failed")
+            phases["login_seconds"] = time.monotonic() - started
+
+            started = time.monotonic()
+            guides = scraper.extract_guides(
+                start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+            )
+            scrape_seconds = time.monotonic() - started + phases["login_seconds"]
+            phases.update(scraper.phase_stats)
+            pacing = scraper.pacer.report()
+        finally:
+            scraper.close()
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+        expected = len(portal.guides_between(start, end))
+        return {
+            "guides": len(guides),
+            "expected_guides": expected,
+            "guides_per_minute": round(len(guides) / scrape_seconds * 60, 1),
+            "phases": {
+                k: round(v, 3) if isinstance(v, float) else v for k, v in phases.items()
+            },
+            "retries": portal.stats["injected_errors"],
+            "portal_requests": portal.stats["requests"],
+            "pacing": pacing,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper offline")
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--guides-per-day", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per response")
+    parser.add_argument(
+        "--transient-errors",
+        type=int,
+        default=0,
+        help="503s served per detail URL before it succeeds",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=50,
+        help="Pacing ceiling in requests/s (the real portal default is much lower)",
+    )
+    parser.add_argument(
+        "--rate", type=float, help="Initial pacing rate (default: --max-rate)"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Guides: {report['guides']}/{report['expected_guides']}")
+    print(f"Guides per minute: {report['guides_per_minute']}")
+    for phase, value in report["phases"].items():
+        print(f"  {phase}: {value}")
+    print(f"Retries: {report['retries']}")
+    print(f"Pacing: {report['pacing']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import atexit
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from pacing import get_pacer
+from scraper import UnimedScraper
+
+logger = logging.getLogger(__name__)
+
+# How long saved login cookies are reused before logging in again
+COOKIE_TTL_SECONDS = int(os.getenv("UNIMED_COOKIE_TTL", str(30 * 60)))
+# A browser is closed and replaced after this many jobs
+MAX_JOBS_PER_BROWSER = int(os.getenv("SCRAPER_MAX_JOBS_PER_BROWSER", "20"))
+MAX_IDLE_BROWSERS = int(os.getenv("SCRAPER_MAX_IDLE_BROWSERS", "4"))
+
+
+class CookieStore:
+    """Login cookies for an account, kept in Redis with an expiry"""
+
+    def __init__(self, redis_conn, account: str):
+        self.redis = redis_conn
+        self.key = f"scraper:cookies:{account}"
+
+    def load(self) -> Optional[Dict]:
+        data = self.redis.get(self.key)
+        return json.loads(data) if data else None
+
+    def save(self, cookies: List[Dict], home_url: str):
+        self.redis.set(
+            self.key,
+            json.dumps({"cookies": cookies, "home_url": home_url}),
+            ex=COOKIE_TTL_SECONDS,
+        )
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+class BrowserPool:
+    """
+    Warm, logged-in browsers kept alive in the worker process between jobs.
+
+    Only useful when jobs run in the worker process itself (RQ SimpleWorker);
+    a forking worker would start every job with an empty pool. Idle browsers
+    are kept per account, so a job never gets another account's session.
+    """
+
+    def __init__(self, max_idle: int = MAX_IDLE_BROWSERS):
+        self.max_idle = max_idle
+        self._idle: Dict[str, List[UnimedScraper]] = {}
+        self._lock = threading.Lock()
+
+    def _new_browser(self) -> UnimedScraper:
+        profile_dir = tempfile.mkdtemp(prefix="unimed-profile-")
+        scraper = UnimedScraper(chrome_profile_path=profile_dir)
+        scraper.setup_driver()
+        return scraper
+
+    def _close(self, scraper: UnimedScraper):
+        try:
+            scraper.close()
+        except Exception as e:
+            logger.error(f"Error closing browser: {str(e)}")
+        shutil.rmtree(scraper.chrome_profile_path, ignore_errors=True)
+
+    def acquire(
+        self, username: str, password: str, cookie_store: Optional[CookieStore] = None
+    ) -> UnimedScraper:
+        """
+        Return a logged-in browser: a warm one if available, otherwise a new
+        one that reuses saved cookies or, failing that, logs in.
+        """
+        while True:
+            with self._lock:
+                idle = self._idle.get(username)
+                scraper = idle.pop() if idle else None
+            if scraper is None:
+                scraper = self._new_browser()
+                break
+            if scraper.is_healthy():
+                break
+            logger.info("Discarding unresponsive browser")
+            self._close(scraper)
+
+        try:
+            self._ensure_logged_in(scraper, username, password, cookie_store)
+        except Exception:
+            self._close(scraper)
+            raise
+        return scraper
+
+    def _ensure_logged_in(
+        self,
+        scraper: UnimedScraper,
+        username: str,
+        password: str,
+        cookie_store: Optional[CookieStore],
+    ):
+        scraper.pacer = get_pacer(username)
+        if scraper.account == username and scraper.home_url and scraper.is_logged_in():
+            return
+
+        saved = cookie_store.load() if cookie_store else None
+        if saved and scraper.restore_session(saved["cookies"], saved["home_url"]):
+            scraper.account = username
+            logger.info("Reused saved login session")
+            return
+        if saved:
+            cookie_store.clear()
+
+        if not scraper.login(username, password):
+            raise Exception("Login failed")
+        if cookie_store:
+            cookie_store.save(scraper.get_cookies(), scraper.home_url)
+
+    def release(self, scraper: UnimedScraper, healthy: bool = True):
+        """Return a browser after a job; recycle it if worn out or broken"""
+        scraper.jobs_done += 1
+        scraper.reset()
+
+        if not healthy or not scraper.account or scraper.jobs_done >= MAX_JOBS_PER_BROWSER:
+            self._close(scraper)
+            return
+
+        with self._lock:
+            total = sum(len(browsers) for browsers in self._idle.values())
+            if total < self.max_idle:
+                self._idle.setdefault(scraper.account, []).append(scraper)
+                return
+        self._close(scraper)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for browsers in idle.values():
+            for scraper in browsers:
+                self._close(scraper)
+
+
+# Shared by every job that runs in this worker process
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close_all)
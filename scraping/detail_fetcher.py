@@ -0,0 +1,170 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+from lxml import etree, html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import portal
+from pacing import AccountPacer, PortalBlocked, looks_blocked
+
+logger = logging.getLogger(__name__)
+
+DETAIL_FETCH_CONCURRENCY = int(os.getenv("SCRAPER_DETAIL_CONCURRENCY", "8"))
+REQUEST_TIMEOUT = 20
+
+CARD_NUMBER_XPATH = etree.XPath(f"normalize-space({portal.CARD_NUMBER})")
+GUIDE_DETAIL_XPATHS = {
+    key: etree.XPath(f"normalize-space({xpath})")
+    for key, xpath in portal.GUIDE_DETAIL_FIELDS.items()
+}
+EXECUTION_DATE_CELLS_XPATH = etree.XPath(portal.EXECUTION_DATE_CELLS)
+EXECUTION_DATE_CELLS_FALLBACK_XPATH = etree.XPath(portal.EXECUTION_DATE_CELLS_FALLBACK)
+BIOMETRIC_ROWS_XPATH = etree.XPath(portal.BIOMETRIC_ROWS)
+BIOMETRIC_DATE_XPATH = etree.XPath(f"normalize-space({portal.BIOMETRIC_ROW_DATE})")
+BIOMETRIC_TEXT_XPATH = etree.XPath(f"normalize-space({portal.BIOMETRIC_ROW_TEXT})")
+LOGIN_FIELD_XPATH = etree.XPath(f'boolean(//*[@id="{portal.LOGIN_FIELD}"])')
+
+POPUP_URL_RE = re.compile(r"""['"]([^'"]+\.do[^'"]*)['"]""")
+
+
+class SessionExpired(Exception):
+    pass
+
+
+def resolve_link(href: Optional[str], base_url: str) -> Optional[str]:
+    """Turn a link href (plain or a javascript: popup call) into an absolute URL"""
+    if not href:
+        return None
+    if href.startswith("javascript:"):
+        match = POPUP_URL_RE.search(href)
+        if not match:
+            return None
+        href = match.group(1)
+    return urljoin(base_url, href)
+
+
+def parse_guide_details(page_html: bytes) -> Dict:
+    tree = html.fromstring(page_html)
+    if LOGIN_FIELD_XPATH(tree):
+        raise SessionExpired("Redirected to the login page")
+    cells = EXECUTION_DATE_CELLS_XPATH(tree) or EXECUTION_DATE_CELLS_FALLBACK_XPATH(tree)
+    return {
+        "card_number": CARD_NUMBER_XPATH(tree),
+        **{key: xpath(tree) for key, xpath in GUIDE_DETAIL_XPATHS.items()},
+        "execution_dates": portal.parse_execution_dates(
+            [cell.text_content() for cell in cells]
+        ),
+    }
+
+
+def parse_biometric_data(page_html: bytes, execution_date: str) -> str:
+    tree = html.fromstring(page_html)
+    if LOGIN_FIELD_XPATH(tree):
+        raise SessionExpired("Redirected to the login page")
+    rows = BIOMETRIC_ROWS_XPATH(tree)
+    for i, row in enumerate(rows[:-1]):
+        if BIOMETRIC_DATE_XPATH(row) == execution_date:
+            return BIOMETRIC_TEXT_XPATH(rows[i + 1])
+    return ""
+
+
+class DetailFetcher:
+    """
+    Fetch guide detail pages over plain HTTP with the browser's login cookies.
+
+    Selenium is still used to log in and walk the listing; the detail and
+    biometric pages are fetched concurrently through a pooled requests
+    Session and parsed with lxml.
+    """
+
+    def __init__(self, driver, max_workers: int = None, pacer: AccountPacer = None):
+        self.max_workers = max_workers or DETAIL_FETCH_CONCURRENCY
+        self.pacer = pacer
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_workers,
+            max_retries=Retry(
+                total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = driver.execute_script(
+            "return navigator.userAgent"
+        )
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain"),
+                path=cookie.get("path", "/"),
+            )
+
+    def _request(self, url: str) -> bytes:
+        response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+        if response.status_code == 429:
+            raise PortalBlocked(f"Rate limited at {url}")
+        response.raise_for_status()
+        if looks_blocked(response.text):
+            raise PortalBlocked(f"Blocked page at {url}")
+        return response.content
+
+    def _get(self, url: str) -> bytes:
+        if self.pacer is None:
+            return self._request(url)
+        with self.pacer.step():
+            return self._request(url)
+
+    def fetch_guide(self, guide: Dict) -> Dict:
+        if not guide.get("detail_url"):
+            raise ValueError(f"Guide {guide['guide_number']} has no detail URL")
+
+        details = parse_guide_details(self._get(guide["detail_url"]))
+        biometric_data = ""
+        if guide.get("biometric_url"):
+            biometric_data = parse_biometric_data(
+                self._get(guide["biometric_url"]), guide["date"]
+            )
+
+        return {
+            "date": guide["date"],
+            "guide_number": guide["guide_number"],
+            "card_number": details.pop("card_number"),
+            "biometric_data": biometric_data,
+            **details,
+        }
+
+    def fetch_all(self, guides: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Fetch all guides concurrently.
+
+        Returns:
+            Tuple[List[Dict], List[Dict]]: Extracted guides (in input order) and
+            the input guides that failed, for a Selenium fallback
+        """
+
+        def fetch(guide: Dict):
+            try:
+                return self.fetch_guide(guide)
+            except Exception as e:
+                logger.warning(
+                    f"HTTP fetch failed for guide {guide['guide_number']}: {str(e)}"
+                )
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(fetch, guides))
+
+        fetched = [r for r in results if r is not None]
+        failed = [g for g, r in zip(guides, results) if r is None]
+        return fetched, failed
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,358 @@
+"""
+Local fake of the Unimed portal, for running the scrapers offline.
+
+Serves the recorded, anonymized pages in fixtures/portal (login, home,
+finished-exams listing with pagination, guide details and the biometric
+popup) filled with deterministic synthetic guides. Point a scraper at it
+with UNIMED_BASE_URL=<base_url>.
+
+    python fake_portal.py --port 8765 --guides-per-day 40
+"""
+
+import argparse
+import math
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "portal")
+DATE_FORMAT = "%d/%m/%Y"
+SESSION_COOKIE = "JSESSIONID"
+# Pages that fail with transient errors when transient_errors is set
+FLAKY_PAGES = {"Guia.do", "Biometria.do"}
+
+
+def _load_templates() -> Dict[str, Template]:
+    templates = {}
+    for name in os.listdir(FIXTURES_DIR):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+                templates[name[:-5]] = Template(f.read())
+    return templates
+
+
+def make_guide(day: date, index: int) -> Dict:
+    """Synthetic guide number `index` of a day; the same inputs give the same guide"""
+    number = f"{day:%y%m%d}{index:04d}"
+    attended = f"{day.strftime(DATE_FORMAT)} {7 + index % 11:02d}:{index * 7 % 60:02d}"
+    professional = index % 5 + 1
+    return {
+        "guide_number": number,
+        "date": attended,
+        "card_number": f"0064.8000.{index:06d}.{day:%m}-{index % 10}",
+        "beneficiary": f"BENEFICIARIO {number}",
+        "procedure_code": "2250005189",
+        "therapy_code": "50000470",
+        "sessions": 10,
+        "professional_name": f"PROFISSIONAL {professional:02d}",
+        "council_name": "CRP",
+        "council_number": str(10000 + professional),
+        "council_state": "GO",
+        "cbo_code": "251510",
+        "biometric_data": f"Biometria confirmada - {attended}",
+        "execution_dates": [
+            (day + timedelta(days=7 * i)).strftime(DATE_FORMAT) for i in range(3)
+        ],
+    }
+
+
+class FakePortal:
+    """
+    The fake portal server. Runs in a background thread:
+
+        with FakePortal(guides_per_day=20) as portal:
+            os.environ["UNIMED_BASE_URL"] = portal.base_url
+
+    Args:
+        guides_per_day: Guides finished on each day
+        page_size: Rows per listing page
+        latency: Seconds added to every response
+        transient_errors: Times each detail/biometric URL answers 503 before
+            succeeding, to exercise the clients' retries
+        blocked: Answer every logged-in page with the captcha page (status
+            200), like the portal does once it locks an account out
+    """
+
+    def __init__(
+        self,
+        guides_per_day: int = 20,
+        page_size: int = 10,
+        latency: float = 0.0,
+        transient_errors: int = 0,
+        blocked: bool = False,
+        username: str = "usuario",
+        password: str = "senha",
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.guides_per_day = guides_per_day
+        self.page_size = page_size
+        self.latency = latency
+        self.transient_errors = transient_errors
+        self.blocked = blocked
+        self.username = username
+        self.password = password
+        self.templates = _load_templates()
+        self.sessions = set()
+        self.stats = {"requests": {}, "injected_errors": 0, "logins": 0}
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        handler = type("Handler", (_PortalHandler,), {"portal": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/cmagnet"
+
+    def start(self) -> "FakePortal":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakePortal":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Data
+
+    def guides_between(self, start: date, end: date) -> List[Dict]:
+        guides = []
+        day = start
+        while day <= end:
+            guides.extend(make_guide(day, i) for i in range(1, self.guides_per_day + 1))
+            day += timedelta(days=1)
+        return guides
+
+    def guide(self, number: str) -> Optional[Dict]:
+        try:
+            day = datetime.strptime(number[:6], "%y%m%d").date()
+            index = int(number[6:])
+        except ValueError:
+            return None
+        if len(number) != 10 or not 1 <= index <= self.guides_per_day:
+            return None
+        return make_guide(day, index)
+
+    # Bookkeeping
+
+    def count_request(self, page: str):
+        with self._lock:
+            self.stats["requests"][page] = self.stats["requests"].get(page, 0) + 1
+
+    def should_fail(self, path: str) -> bool:
+        if not self.transient_errors:
+            return False
+        with self._lock:
+            attempts = self._attempts.get(path, 0) + 1
+            self._attempts[path] = attempts
+            if attempts <= self.transient_errors:
+                self.stats["injected_errors"] += 1
+                return True
+        return False
+
+    # Pages
+
+    def render(self, name: str, **values) -> str:
+        return self.templates[name].substitute(menu=self.templates["menu"].template, **values)
+
+    def render_guide_tables(self, guide: Dict) -> str:
+        cells = "\n".join(
+            f'    <tr><td class="MagnetoDataTD">{i} - {d}</td></tr>'
+            for i, d in enumerate(guide["execution_dates"], start=1)
+        )
+        return self.templates["guide_tables"].substitute(execution_cells=cells, **guide)
+
+    def render_listing(self, query: Dict[str, str]) -> str:
+        start_text = query.get("s_dt_ini", "")
+        end_text = query.get("s_dt_fim", "")
+        guide_number = query.get("s_nr_guia", "").strip()
+        try:
+            start = datetime.strptime(start_text, DATE_FORMAT).date()
+            end = datetime.strptime(end_text, DATE_FORMAT).date()
+        except ValueError:
+            start = end = None
+
+        guide_tables = ""
+        if guide_number:
+            found = self.guide(guide_number)
+            guides = [found] if found else []
+            if found:
+                # A search by guide number also shows the guide's summary
+                guide_tables = self.render_guide_tables(found)
+        elif start and end:
+            guides = self.guides_between(start, end)
+        else:
+            guides = []
+
+        pages = max(1, math.ceil(len(guides) / self.page_size))
+        try:
+            page = min(max(int(query.get("pagina", "1")), 1), pages)
+        except ValueError:
+            page = 1
+        rows = guides[(page - 1) * self.page_size : page * self.page_size]
+
+        if page < pages:
+            params = {k: v for k, v in query.items() if k.startswith("s_")}
+            next_class = ""
+            next_href = f"ExamesFinalizados.do?{urlencode({**params, 'pagina': page + 1})}"
+        else:
+            next_class, next_href = "disabled", "#"
+
+        return self.render(
+            "listing",
+            start_date=start_text,
+            end_date=end_text,
+            guide_number=guide_number,
+            rows="\n".join(self.templates["listing_row"].substitute(**g) for g in rows),
+            page=page,
+            pages=pages,
+            next_class=next_class,
+            next_href=next_href,
+            guide_tables=guide_tables,
+        )
+
+    def render_biometric(self, guide: Dict) -> str:
+        rows = (
+            f'    <tr><td>Data</td><td><span>{guide["date"]}</span></td></tr>\n'
+            f'    <tr><td colspan="2"><span>{guide["biometric_data"]}</span></td></tr>'
+        )
+        return self.render("biometric", guide_number=guide["guide_number"], rows=rows)
+
+
+class _PortalHandler(BaseHTTPRequestHandler):
+    portal: FakePortal
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str = "", headers: Dict[str, str] = None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _session(self) -> Optional[str]:
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        morsel = cookie.get(SESSION_COOKIE)
+        return morsel.value if morsel else None
+
+    def _route(self):
+        url = urlparse(self.path)
+        if not url.path.startswith("/cmagnet/"):
+            return None, {}
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        return url.path[len("/cmagnet/") :], query
+
+    def do_POST(self):
+        page, _ = self._route()
+        if page != "Login.do":
+            return self._send(404, "Not found")
+        portal = self.portal
+        portal.count_request(page)
+        if portal.latency:
+            time.sleep(portal.latency)
+
+        length = int(self.headers.get("Content-Length", 0))
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        if form.get("login") != portal.username or form.get("passwordTemp") != portal.password:
+            return self._send(200, portal.render("login", message="Usuário ou senha inválidos"))
+
+        session = uuid.uuid4().hex
+        with portal._lock:
+            portal.sessions.add(session)
+            portal.stats["logins"] += 1
+        self._send(
+            302,
+            headers={
+                "Location": "Home.do",
+                "Set-Cookie": f"{SESSION_COOKIE}={session}; Path=/cmagnet; HttpOnly",
+            },
+        )
+
+    def do_GET(self):
+        page, query = self._route()
+        portal = self.portal
+        if page is None:
+            return self._send(404, "Not found")
+        portal.count_request(page)
+        if portal.latency:
+            time.sleep(portal.latency)
+
+        if page == "Login.do" or self._session() not in portal.sessions:
+            # Like the real portal, an expired session lands on the login page
+            return self._send(200, portal.render("login", message=""))
+        if portal.blocked:
+            return self._send(200, portal.templates["captcha"].template)
+        if page in FLAKY_PAGES and portal.should_fail(self.path):
+            return self._send(503, "Service Unavailable")
+
+        if page == "Home.do":
+            return self._send(200, portal.render("home"))
+        if page == "ExamesFinalizados.do":
+            return self._send(200, portal.render_listing(query))
+
+        guide = portal.guide(query.get("guia", ""))
+        if page == "Guia.do" and guide:
+            return self._send(
+                200,
+                portal.render(
+                    "guide",
+                    guide_number=guide["guide_number"],
+                    guide_tables=portal.render_guide_tables(guide),
+                ),
+            )
+        if page == "Biometria.do" and guide:
+            return self._send(200, portal.render_biometric(guide))
+        self._send(404, "Not found")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Unimed portal for offline scraping")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--guides-per-day", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--transient-errors", type=int, default=0)
+    args = parser.parse_args()
+
+    portal = FakePortal(
+        guides_per_day=args.guides_per_day,
+        page_size=args.page_size,
+        latency=args.latency,
+        transient_errors=args.transient_errors,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Fake portal at {portal.base_url} (user {portal.username} / {portal.password})")
+    try:
+        portal.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        portal.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
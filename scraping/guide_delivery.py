@@ -0,0 +1,113 @@
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from portal import split_card_number
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("SCRAPER_BATCH_SIZE", "500"))
+REQUEST_TIMEOUT = 60
+
+
+def to_guia_unimed(guide: Dict) -> Dict:
+    """Map a scraped guide to the fields of the guias_unimed table"""
+    carteira, nome = split_card_number(guide.get("card_number", ""))
+    return {
+        "numero_guia": guide["guide_number"],
+        "carteira": carteira,
+        "nome_beneficiario": nome,
+        "codigo_procedimento": guide.get("therapy_code", ""),
+        # The listing date may carry a time ("dd/mm/yyyy hh:mm")
+        "data_atendimento": guide["date"][:10],
+        "nome_profissional": guide.get("professional_name", ""),
+        "conselho_profissional": guide.get("council_name", ""),
+        "numero_conselho": guide.get("council_number", ""),
+        "uf_conselho": guide.get("council_state", ""),
+        "codigo_cbo": guide.get("cbo_code", ""),
+    }
+
+
+class ThrottledProgress:
+    """Call `update` at most once every `interval` seconds (plus when forced)"""
+
+    def __init__(self, update: Callable[..., None], interval: float = 2.0):
+        self.update = update
+        self.interval = interval
+        self._last = 0.0
+
+    def __call__(self, *args, force: bool = False, **kwargs):
+        now = time.monotonic()
+        if force or now - self._last >= self.interval:
+            self._last = now
+            self.update(*args, **kwargs)
+
+
+class GuideSender:
+    """
+    Send guides to the main backend's bulk endpoint in gzip-compressed
+    batches over a keep-alive session, retrying transient failures.
+    """
+
+    def __init__(self, api_url: str, batch_size: int = None):
+        self.api_url = api_url
+        self.batch_size = batch_size or BATCH_SIZE
+        self.session = requests.Session()
+        # The endpoint upserts by numero_guia, so retrying a POST is safe
+        retry = Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+        )
+        self.session.mount("https://", HTTPAdapter(max_retries=retry))
+        self.session.mount("http://", HTTPAdapter(max_retries=retry))
+
+    def send_batch(self, guides: List[Dict]) -> Dict:
+        body = gzip.compress(json.dumps([to_guia_unimed(g) for g in guides]).encode())
+        response = self.session.post(
+            self.api_url,
+            data=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+            timeout=REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def send_all(
+        self,
+        guides: List[Dict],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict:
+        """
+        Send all guides in batches.
+
+        Returns:
+            Dict: sent (guides saved by the backend), errors (per-guide
+            validation errors) and failed_batches (batches that failed after retries)
+        """
+        summary = {"sent": 0, "errors": [], "failed_batches": 0}
+        for start in range(0, len(guides), self.batch_size):
+            batch = guides[start : start + self.batch_size]
+            try:
+                result = self.send_batch(batch)
+                summary["sent"] += result.get("saved", 0)
+                summary["errors"].extend(result.get("errors", []))
+            except Exception as e:
+                summary["failed_batches"] += 1
+                logger.error(
+                    f"Failed to send guides {start + 1}-{start + len(batch)}: {str(e)}"
+                )
+            if on_progress:
+                on_progress(start + len(batch), len(guides))
+        return summary
+
+    def close(self):
+        self.session.close()
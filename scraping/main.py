@@ -1,5 +1,6 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, List
@@ -8,6 +9,8 @@ import time
 from dotenv import load_dotenv
 from rq import Queue
 from redis import Redis
+from redis import asyncio as aioredis
+from task_events import client_is_done, publish_status, status_key, stream_events
 from worker import process_scraping
 import json
 import logging
@@ -45,6 +48,8 @@ def init_redis(max_retries=3):
     raise Exception("Não foi possível conectar ao Redis após várias tentativas")
 
 redis_conn = init_redis()
+# Cliente assíncrono para os streams de eventos (XREAD bloqueante, sem timeout de socket)
+async_redis = aioredis.Redis(host='0.0.0.0', port=6379)
 
 # Inicializa a fila
 task_queue = Queue(connection=redis_conn)
@@ -75,6 +80,8 @@ class ScrapingTask(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
     max_guides: Optional[int] = None
+    # Ignora o índice de guias conhecidas e os checkpoints (refaz o período todo)
+    force: bool = False
 
 
 class ScrapingResult(BaseModel):
@@ -97,7 +104,7 @@ async def start_scraping(task: ScrapingTask,
     
     # Inicializa o status no Redis
     try:
-        redis_conn.hset(f"task:{task_id}", mapping={"status": "processing"})
+        publish_status(redis_conn, task_id, {"status": "processing"})
         logger.info("✅ Status inicial salvo no Redis")
     except Exception as e:
         logger.error(f"❌ Erro ao salvar status no Redis: {str(e)}")
@@ -121,7 +128,7 @@ async def get_status(task_id: str):
     try:
         result = {
             k.decode('utf-8'): v.decode('utf-8') 
-            for k, v in redis_conn.hgetall(f"task:{task_id}").items()
+            for k, v in redis_conn.hgetall(status_key(task_id)).items()
         }
         logger.debug(f"📋 Status da tarefa {task_id}: {result}")
         
@@ -140,6 +147,25 @@ async def get_status(task_id: str):
         raise HTTPException(status_code=500, detail=f"Erro ao buscar status: {str(e)}")
 
 
+@app.get("/events/{task_id}")
+async def stream_task_events(
+    task_id: str, last_event_id: Optional[str] = Header(None)
+):
+    """Progresso da tarefa em tempo real (Server-Sent Events)"""
+    if not await async_redis.exists(status_key(task_id)):
+        raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+
+    # 204 faz o EventSource do navegador parar de reconectar
+    if last_event_id and await client_is_done(async_redis, task_id, last_event_id):
+        return Response(status_code=204)
+
+    return StreamingResponse(
+        stream_events(async_redis, task_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
 
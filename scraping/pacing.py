@@ -0,0 +1,172 @@
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Requests per second to the portal, per account. The rate starts at
+# UNIMED_RATE, grows while responses are fast and is cut on slow responses
+# or errors (AIMD), always within [UNIMED_MIN_RATE, UNIMED_MAX_RATE].
+INITIAL_RATE = float(os.getenv("UNIMED_RATE", "2"))
+MIN_RATE = float(os.getenv("UNIMED_MIN_RATE", "0.2"))
+MAX_RATE = float(os.getenv("UNIMED_MAX_RATE", "8"))
+BURST = int(os.getenv("UNIMED_BURST", "4"))
+RATE_STEP = 0.25
+# A response slower than this counts as the portal struggling
+SLOW_RESPONSE_SECONDS = float(os.getenv("UNIMED_SLOW_RESPONSE_SECONDS", "5"))
+# Pause after a captcha or lockout page before trying again
+BLOCK_COOLDOWN_SECONDS = float(os.getenv("UNIMED_BLOCK_COOLDOWN_SECONDS", "120"))
+# Politeness budget: portal requests allowed per run (0 = unlimited)
+MAX_REQUESTS_PER_RUN = int(os.getenv("UNIMED_MAX_REQUESTS_PER_RUN", "0"))
+
+BLOCK_MARKERS_RE = re.compile(
+    r"captcha|recaptcha|acesso bloqueado|usu[aá]rio bloqueado|"
+    r"excedeu o n[uú]mero de tentativas|too many requests",
+    re.IGNORECASE,
+)
+
+
+class PortalBlocked(Exception):
+    """The portal answered with a captcha or lockout page"""
+
+
+class PolitenessBudgetExceeded(Exception):
+    pass
+
+
+def looks_blocked(page_text: str) -> bool:
+    return bool(page_text) and bool(BLOCK_MARKERS_RE.search(page_text))
+
+
+class AccountPacer:
+    """
+    Token-bucket limiter for the requests made to the portal with one account.
+
+    Every navigation, form submit or HTTP fetch takes a token; tokens refill
+    at the current rate, which adapts to how the portal responds. All browser
+    sessions and HTTP fetchers of the account in this process share it (see
+    get_pacer), and it keeps per-run totals of time spent waiting for tokens
+    versus doing the requests.
+    """
+
+    def __init__(
+        self,
+        account: str,
+        rate: float = None,
+        min_rate: float = None,
+        max_rate: float = None,
+        burst: int = None,
+        slow_seconds: float = None,
+    ):
+        self.account = account
+        self.min_rate = min_rate or MIN_RATE
+        self.max_rate = max_rate or MAX_RATE
+        self.rate = min(max(rate or INITIAL_RATE, self.min_rate), self.max_rate)
+        self.burst = burst or BURST
+        self.slow_seconds = slow_seconds or SLOW_RESPONSE_SECONDS
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self.begin_run()
+
+    def begin_run(self, max_requests: Optional[int] = None):
+        """Reset the per-run totals and set the run's request budget"""
+        with self._lock:
+            self.max_requests = (
+                max_requests if max_requests is not None else MAX_REQUESTS_PER_RUN
+            )
+            self._stats = {
+                "requests": 0,
+                "wait_seconds": 0.0,
+                "work_seconds": 0.0,
+                "slow_responses": 0,
+                "errors": 0,
+                "blocks": 0,
+            }
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be made"""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                if self.max_requests and self._stats["requests"] >= self.max_requests:
+                    raise PolitenessBudgetExceeded(
+                        f"Run budget of {self.max_requests} portal requests used up"
+                    )
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._stats["requests"] += 1
+                    self._stats["wait_seconds"] += now - start
+                    return
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+
+    def observe(self, seconds: float, ok: bool = True, blocked: bool = False):
+        """Adapt the rate to the outcome of a request"""
+        with self._lock:
+            self._stats["work_seconds"] += seconds
+            if blocked:
+                self._stats["blocks"] += 1
+                self.rate = self.min_rate
+                self._tokens = 0
+                self._paused_until = time.monotonic() + BLOCK_COOLDOWN_SECONDS
+                logger.warning(
+                    f"Portal blocked account {self.account}; pausing "
+                    f"{BLOCK_COOLDOWN_SECONDS:.0f}s"
+                )
+            elif not ok or seconds > self.slow_seconds:
+                self._stats["errors" if not ok else "slow_responses"] += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+            else:
+                self.rate = min(self.max_rate, self.rate + RATE_STEP)
+
+    @contextmanager
+    def step(self):
+        """
+        Pace one request: wait for a token, then time the work done in the
+        block. An exception counts as an error, PortalBlocked as a block.
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except PortalBlocked:
+            self.observe(time.monotonic() - start, ok=False, blocked=True)
+            raise
+        except Exception:
+            self.observe(time.monotonic() - start, ok=False)
+            raise
+        self.observe(time.monotonic() - start)
+
+    def report(self) -> Dict:
+        """Totals of the current run"""
+        with self._lock:
+            return {
+                **self._stats,
+                "wait_seconds": round(self._stats["wait_seconds"], 2),
+                "work_seconds": round(self._stats["work_seconds"], 2),
+                "rate": round(self.rate, 2),
+            }
+
+
+_pacers: Dict[str, AccountPacer] = {}
+_pacers_lock = threading.Lock()
+
+
+def get_pacer(account: str) -> AccountPacer:
+    """The process-wide pacer of a portal account"""
+    with _pacers_lock:
+        if account not in _pacers:
+            _pacers[account] = AccountPacer(account)
+        return _pacers[account]
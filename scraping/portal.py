@@ -0,0 +1,91 @@
+"""
+Where the Unimed portal is and how its pages are laid out.
+
+Shared by the scraping engine (scraper.py, Selenium) and the HTTP detail
+fetcher (detail_fetcher.py, lxml). The XPaths match rows with "//tr[n]" so
+they work both on the browser DOM (which inserts <tbody>) and on raw HTML.
+"""
+
+import os
+from datetime import datetime
+from typing import List, Tuple
+
+# Root of the Unimed portal. Point it at a local fake portal (fake_portal.py)
+# to run the scrapers offline, e.g. UNIMED_BASE_URL=http://127.0.0.1:8765/cmagnet
+BASE_URL = os.getenv(
+    "UNIMED_BASE_URL", "https://sgucard.unimedgoiania.coop.br/cmagnet"
+).rstrip("/")
+LOGIN_URL = f"{BASE_URL}/Login.do"
+
+# Login page (element ids)
+LOGIN_FIELD = "login"
+PASSWORD_FIELD = "passwordTemp"
+LOGIN_BUTTON = "Button_DoLogin"
+
+# Home menu
+FINISHED_EXAMS_LINK = '//*[@id="centro_21"]/a'
+
+# Finished-exams listing (form field names)
+START_DATE_FIELD = "s_dt_ini"
+END_DATE_FIELD = "s_dt_fim"
+GUIDE_NUMBER_FIELD = "s_nr_guia"
+FILTER_BUTTON = "Button_FIltro"
+# The grid is the first table of the results form; the second one is the
+# navigator with the "Próxima" link
+LISTING_ROWS = '//*[@id="conteudo"]/form[2]/table[1]//tr'
+# Relative to a listing row
+ROW_DATE = "./td[1]"
+ROW_GUIDE_LINK = "./td[2]/a"
+ROW_BIOMETRIC_LINK = "./td[7]/span[2]/a"
+NEXT_PAGE_TEXT = "Próxima"
+
+# Guide details (also shown on the listing after a search by guide number)
+CARD_NUMBER = '//*[@id="conteudo"]/table[1]//tr[6]/td[1]/span'
+GUIDE_DETAIL_FIELDS = {
+    "professional_name": '//*[@id="conteudo"]/table[5]//tr[3]/td[4]',
+    "council_name": '//*[@id="conteudo"]/table[5]//tr[3]/td[5]',
+    "council_number": '//*[@id="conteudo"]/table[5]//tr[3]/td[6]',
+    "council_state": '//*[@id="conteudo"]/table[5]//tr[3]/td[7]',
+    "cbo_code": '//*[@id="conteudo"]/table[5]//tr[3]/td[8]',
+    "therapy_code": '//*[@id="conteudo"]/table[2]//tr[2]/td[2]',
+    "procedure_code": '//*[@id="conteudo"]/table[4]//tr[2]/td[5]',
+}
+EXECUTION_DATE_CELLS = (
+    "//td[contains(text(), 'Data de Procedimentos em Série')]/ancestor::table[1]"
+    "//td[contains(@class, 'MagnetoDataTD')]"
+)
+# Used when the table title is not found
+EXECUTION_DATE_CELLS_FALLBACK = (
+    '//*[@id="conteudo"]/table[6]//td[contains(@class, "MagnetoDataTD")]'
+)
+
+# Biometric popup
+BIOMETRIC_ROWS = '//*[@id="conteudo-submenu"]/table[2]//tr'
+BIOMETRIC_ROW_DATE = "./td[2]/span"
+BIOMETRIC_ROW_TEXT = "./td/span"
+
+DATE_FORMAT = "%d/%m/%Y"
+
+
+def split_card_number(card_number: str) -> Tuple[str, str]:
+    """"0064.8000... - NOME" -> (carteira, nome do beneficiário)"""
+    if " - " not in card_number:
+        return card_number.strip(), ""
+    card, name = card_number.split(" - ", 1)
+    return card.strip(), name.strip()
+
+
+def parse_execution_dates(cell_texts: List[str]) -> List[str]:
+    """Dates of the "Procedimentos em Série" cells ("1 - dd/mm/yyyy")"""
+    dates = []
+    for text in cell_texts:
+        text = text.strip().replace("\xa0", " ")
+        if "Observação" in text or " - " not in text:
+            continue
+        candidate = text.split(" - ", 1)[1].strip()
+        try:
+            datetime.strptime(candidate, DATE_FORMAT)
+        except ValueError:
+            continue
+        dates.append(candidate)
+    return dates
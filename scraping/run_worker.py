@@ -2,7 +2,7 @@ import os
 import sys
 import logging
 from redis import Redis
-from rq import Queue, Worker
+from rq import Queue, SimpleWorker
 from dotenv import load_dotenv
 
 # Configuração de logs
@@ -30,9 +30,10 @@ def main():
         redis_conn.ping()
         logger.info("✅ Conectado ao Redis com sucesso!")
 
-        # Inicia o worker
+        # Inicia o worker sem fork por tarefa, para manter os navegadores
+        # (já logados) abertos entre as tarefas
         queue = Queue(connection=redis_conn)
-        worker = Worker([queue], connection=redis_conn)
+        worker = SimpleWorker([queue], connection=redis_conn)
         logger.info("🚀 Worker iniciado e aguardando tarefas...")
         worker.work()
     except Exception as e:
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+from typing import Dict, List
+
+CHECKPOINT_TTL_SECONDS = int(os.getenv("SCRAPER_CHECKPOINT_TTL", str(24 * 60 * 60)))
+
+
+def guide_key(guide: Dict) -> str:
+    # The listing date may carry a time ("dd/mm/yyyy hh:mm")
+    return f"{guide['guide_number']}|{guide['date'][:10]}"
+
+
+class KnownGuidesIndex:
+    """Redis set of guides (numero_guia + date) already scraped and delivered"""
+
+    def __init__(self, redis_conn, account: str):
+        self.redis = redis_conn
+        self.key = f"scraper:known_guides:{account}"
+
+    def is_known(self, guides: List[Dict]) -> List[bool]:
+        if not guides:
+            return []
+        flags = self.redis.smismember(self.key, [guide_key(g) for g in guides])
+        return [bool(f) for f in flags]
+
+    def add(self, guides: List[Dict]):
+        if guides:
+            self.redis.sadd(self.key, *[guide_key(g) for g in guides])
+
+
+class ScrapeCheckpoint:
+    """
+    Progress of a scrape of one account and date range: days fully done and,
+    for the day in progress, how many listing pages were fully delivered.
+
+    A failed or interrupted run of the same range resumes from here. The
+    current day is never marked done, since new guides may still appear.
+    """
+
+    def __init__(self, redis_conn, account: str, start_date: str, end_date: str):
+        self.redis = redis_conn
+        suffix = f"{account}:{start_date}:{end_date}".replace("/", "")
+        self.days_key = f"scraper:checkpoint:days:{suffix}"
+        self.pages_key = f"scraper:checkpoint:pages:{suffix}"
+
+    def is_day_done(self, day: str) -> bool:
+        return bool(self.redis.sismember(self.days_key, day))
+
+    def mark_day_done(self, day: str):
+        if datetime.strptime(day, "%d/%m/%Y").date() >= datetime.now().date():
+            return
+        pipe = self.redis.pipeline()
+        pipe.sadd(self.days_key, day)
+        pipe.hdel(self.pages_key, day)
+        pipe.expire(self.days_key, CHECKPOINT_TTL_SECONDS)
+        pipe.execute()
+
+    def pages_done(self, day: str) -> int:
+        return int(self.redis.hget(self.pages_key, day) or 0)
+
+    def mark_page_done(self, day: str, page: int):
+        pipe = self.redis.pipeline()
+        pipe.hset(self.pages_key, day, page)
+        pipe.expire(self.pages_key, CHECKPOINT_TTL_SECONDS)
+        pipe.execute()
+
+    def clear(self):
+        self.redis.delete(self.days_key, self.pages_key)
@@ -5,24 +5,52 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import pandas as pd
-import random
 import time
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import functools
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import portal
+from detail_fetcher import DetailFetcher, resolve_link
+from pacing import AccountPacer, PortalBlocked, get_pacer, looks_blocked
 
 
 class UnimedScraper:
 
-    def __init__(self, chrome_profile_path: str = None):
+    def __init__(
+        self,
+        chrome_profile_path: str = None,
+        headless: bool = None,
+        pacer: AccountPacer = None,
+    ):
+        # Concurrent sessions need separate profiles; Chrome locks a profile dir
         self.chrome_profile_path = chrome_profile_path or os.path.join(
-            os.environ["USERPROFILE"], "AppData/Local/Google/Chrome/User Data"
+            os.environ.get("USERPROFILE", os.path.expanduser("~")),
+            "AppData/Local/Google/Chrome/User Data",
+        )
+        self.headless = (
+            headless
+            if headless is not None
+            else os.getenv("SCRAPER_HEADLESS", "false").lower() == "true"
         )
+        # Fetch guide details over HTTP (lxml) instead of Selenium navigation
+        self.http_details = os.getenv("SCRAPER_HTTP_DETAILS", "true").lower() == "true"
+        # Paces portal requests; login() switches to the account's shared pacer
+        self.pacer = pacer or get_pacer("default")
         self.driver = None
         self.wait = None
+        self.home_url = None
+        # Portal account the browser session belongs to
+        self.account = None
+        self.jobs_done = 0
         self.captured_guides = []
         self.protocol_data = []
+        self.phase_stats = {}
+        self.reset()
         self.setup_logging()
 
     def setup_logging(self):
@@ -38,188 +66,369 @@ class UnimedScraper:
         options.add_argument("--disable-blink-features=AutomationControlled")
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-infobars")
+        if self.headless:
+            options.add_argument("--headless=new")
+            options.add_argument("--window-size=1920,1080")
 
         self.driver = webdriver.Chrome(options=options)
         self.wait = WebDriverWait(self.driver, 10)
         self.driver.maximize_window()
 
-    def random_wait(self, min_seconds: float = 1, max_seconds: float = 3):
-        """Add random wait time to simulate human behavior"""
-        time.sleep(random.uniform(min_seconds, max_seconds))
+    def paced(self, action: Callable[[], None], ready=None):
+        """
+        Perform one portal request (a navigation or a click that loads a page)
+        under the account's pacer, then wait until `ready` holds.
+        """
+        with self.pacer.step():
+            action()
+            try:
+                if ready is not None:
+                    self.wait.until(ready)
+            except TimeoutException:
+                # A captcha/lockout page never shows what `ready` waits for
+                self._raise_if_blocked()
+                raise
+            self._raise_if_blocked()
+
+    def _raise_if_blocked(self):
+        body = self.driver.find_elements(By.TAG_NAME, "body")
+        if body and looks_blocked(body[0].text):
+            raise PortalBlocked(f"Blocked page at {self.driver.current_url}")
 
     def login(self, username: str, password: str):
         """Login to Unimed system"""
         try:
-            self.driver.get("https://sgucard.unimedgoiania.coop.br/cmagnet/Login.do")
-            self.random_wait()
+            self.pacer = get_pacer(username)
+            self.paced(
+                lambda: self.driver.get(portal.LOGIN_URL),
+                EC.presence_of_element_located((By.ID, portal.LOGIN_FIELD)),
+            )
 
             # Login fields
             login_field = self.wait.until(
-                EC.presence_of_element_located((By.ID, "login"))
+                EC.presence_of_element_located((By.ID, portal.LOGIN_FIELD))
             )
             password_field = self.wait.until(
-                EC.presence_of_element_located((By.ID, "passwordTemp"))
+                EC.presence_of_element_located((By.ID, portal.PASSWORD_FIELD))
             )
 
             # Clear and fill login fields
             login_field.clear()
             login_field.send_keys(username)
-            self.random_wait(0.5, 1)
 
             password_field.clear()
             password_field.send_keys(password)
-            self.random_wait(0.5, 1)
 
             # Click login button
             login_button = self.wait.until(
-                EC.element_to_be_clickable((By.ID, "Button_DoLogin"))
+                EC.element_to_be_clickable((By.ID, portal.LOGIN_BUTTON))
             )
-            login_button.click()
-            self.random_wait()
-
+            self.paced(
+                login_button.click,
+                EC.presence_of_element_located((By.XPATH, portal.FINISHED_EXAMS_LINK)),
+            )
+            self.home_url = self.driver.current_url
+            self.account = username
             return True
         except Exception as e:
             self.logger.error(f"Login failed: {str(e)}")
             return False
 
-    def capture_guides(self, start_date: str, end_date: str):
-        """Capture all guides within the specified date range"""
+    def is_logged_in(self) -> bool:
+        """Check whether the current session reaches the logged-in home page"""
         try:
-            # Navigate to finished exams
-            finished_exams = self.wait.until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="centro_21"]/a'))
-            )
-            finished_exams.click()
-            self.random_wait()
+            if self.home_url:
+                self.paced(lambda: self.driver.get(self.home_url))
+            self.driver.find_element(By.XPATH, portal.FINISHED_EXAMS_LINK)
+            return True
+        except Exception:
+            return False
 
-            # Set date range
-            start_date_field = self.wait.until(
-                EC.presence_of_element_located((By.NAME, "s_dt_ini"))
-            )
-            end_date_field = self.wait.until(
-                EC.presence_of_element_located((By.NAME, "s_dt_fim"))
-            )
+    def get_cookies(self) -> List[Dict]:
+        return self.driver.get_cookies()
 
-            start_date_field.clear()
-            start_date_field.send_keys(start_date)
+    def restore_session(self, cookies: List[Dict], home_url: str) -> bool:
+        """Load saved login cookies into the browser and check they are still valid"""
+        try:
+            # Cookies can only be set for the domain currently loaded
+            self.paced(lambda: self.driver.get(home_url))
+            self.driver.delete_all_cookies()
+            for cookie in cookies:
+                cookie.pop("sameSite", None)
+                self.driver.add_cookie(cookie)
+            self.home_url = home_url
+            return self.is_logged_in()
+        except Exception as e:
+            self.logger.error(f"Session restore failed: {str(e)}")
+            return False
 
-            end_date_field.clear()
-            end_date_field.send_keys(end_date)
+    def is_healthy(self) -> bool:
+        """Check that the browser process still responds"""
+        try:
+            _ = self.driver.current_url
+            return True
+        except Exception:
+            return False
 
-            # Click filter button
-            filter_button = self.wait.until(
-                EC.element_to_be_clickable((By.NAME, "Button_FIltro"))
+    def reset(self):
+        """Clear per-job state so a warm browser can be reused for another job"""
+        self.captured_guides = []
+        self.protocol_data = []
+        # Seconds spent per phase of the last extract_guides call
+        self.phase_stats = {
+            "listing_seconds": 0.0,
+            "details_seconds": 0.0,
+            "fallback_seconds": 0.0,
+            "pages": 0,
+            "fallback_guides": 0,
+        }
+
+    def open_finished_exams(self):
+        """Go from the home page to the finished-exams listing"""
+        if self.home_url and not self.driver.find_elements(
+            By.XPATH, portal.FINISHED_EXAMS_LINK
+        ):
+            self.paced(
+                lambda: self.driver.get(self.home_url),
+                EC.presence_of_element_located((By.XPATH, portal.FINISHED_EXAMS_LINK)),
             )
-            filter_button.click()
-            self.random_wait()
-
-            # Capture guides from all pages
-            while True:
-                guides_table = self.wait.until(
-                    EC.presence_of_element_located(
-                        (By.XPATH, '//*[@id="conteudo"]/form[2]/table/tbody')
+        finished_exams = self.wait.until(
+            EC.element_to_be_clickable((By.XPATH, portal.FINISHED_EXAMS_LINK))
+        )
+        self.paced(
+            finished_exams.click,
+            EC.presence_of_element_located((By.NAME, portal.START_DATE_FIELD)),
+        )
+
+    def _fill_field(self, name: str, value: str):
+        field = self.wait.until(EC.presence_of_element_located((By.NAME, name)))
+        field.clear()
+        if value:
+            field.send_keys(value)
+
+    def _filter(self, start_date: str = "", end_date: str = "", guide_number: str = ""):
+        """Fill the listing filter and submit it"""
+        self._fill_field(portal.START_DATE_FIELD, start_date)
+        self._fill_field(portal.END_DATE_FIELD, end_date)
+        self._fill_field(portal.GUIDE_NUMBER_FIELD, guide_number)
+
+        filter_button = self.wait.until(
+            EC.element_to_be_clickable((By.NAME, portal.FILTER_BUTTON))
+        )
+        self.paced(filter_button.click, EC.staleness_of(filter_button))
+
+    def _read_listing_rows(self) -> List[Dict]:
+        """Guides on the listing page currently loaded"""
+        self.wait.until(EC.presence_of_element_located((By.XPATH, portal.LISTING_ROWS)))
+        guides = []
+        for row in self.driver.find_elements(By.XPATH, portal.LISTING_ROWS):
+            try:
+                date = row.find_element(By.XPATH, portal.ROW_DATE).text
+                guide_link = row.find_element(By.XPATH, portal.ROW_GUIDE_LINK)
+                guide_number = guide_link.text
+            except NoSuchElementException:
+                # Header row
+                continue
+
+            # Links used to fetch the detail pages over HTTP
+            biometric_links = row.find_elements(By.XPATH, portal.ROW_BIOMETRIC_LINK)
+            guides.append(
+                {
+                    "date": date,
+                    "guide_number": guide_number,
+                    "detail_url": resolve_link(
+                        guide_link.get_attribute("href"), self.driver.current_url
+                    ),
+                    "biometric_url": resolve_link(
+                        biometric_links[0].get_attribute("href"),
+                        self.driver.current_url,
                     )
-                )
-                rows = guides_table.find_elements(By.TAG_NAME, "tr")[
-                    1:
-                ]  # Skip header row
+                    if biometric_links
+                    else None,
+                }
+            )
+        return guides
 
-                for row in rows:
-                    try:
-                        date = row.find_element(By.XPATH, "./td[1]").text
-                        guide_number = row.find_element(By.XPATH, "./td[2]/a").text
+    def iter_guide_pages(
+        self, start_date: str, end_date: str, skip_pages: int = 0
+    ) -> Iterator[Tuple[int, List[Dict]]]:
+        """
+        Walk the finished-exams listing for the date range, yielding
+        (page number, guides on that page).
 
-                        self.captured_guides.append(
-                            {"date": date, "guide_number": guide_number}
-                        )
-                    except NoSuchElementException:
-                        continue
+        The portal has no direct page jump, so the first `skip_pages` pages are
+        still visited but their rows are not read (they yield empty lists).
+        """
+        self.open_finished_exams()
+        self._filter(start_date, end_date)
 
-                # Try to go to next page
-                try:
-                    next_button = self.driver.find_element(By.LINK_TEXT, "Próxima")
-                    if "disabled" in next_button.get_attribute("class"):
-                        break
-                    next_button.click()
-                    self.random_wait()
-                except NoSuchElementException:
+        page = 1
+        while True:
+            yield page, self._read_listing_rows() if page > skip_pages else []
+
+            # Try to go to next page
+            try:
+                next_button = self.driver.find_element(
+                    By.LINK_TEXT, portal.NEXT_PAGE_TEXT
+                )
+                if "disabled" in next_button.get_attribute("class"):
                     break
+                self.paced(next_button.click, EC.staleness_of(next_button))
+            except NoSuchElementException:
+                break
+            page += 1
+
+    def search_guide(self, guide_number: str) -> List[Dict]:
+        """Listing rows of one guide (one per attendance), found by its number"""
+        if not self.driver.find_elements(By.NAME, portal.GUIDE_NUMBER_FIELD):
+            self.open_finished_exams()
+        self._filter(guide_number=guide_number)
+        return self._read_listing_rows()
+
+    def capture_guides(self, start_date: str, end_date: str):
+        """Capture all guides within the specified date range"""
+        try:
+            for _, guides in self.iter_guide_pages(start_date, end_date):
+                self.captured_guides.extend(guides)
 
         except Exception as e:
             self.logger.error(f"Error capturing guides: {str(e)}")
             raise
 
-    def extract_guides(self, start_date: str, end_date: str, max_guides: Optional[int] = None) -> List[Dict]:
+    def _fetch_details(self, guides: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Fetch details over HTTP; returns (extracted guides, guides left for Selenium)"""
+        if not self.http_details or not guides:
+            return [], guides
+
+        fetcher = DetailFetcher(self.driver, pacer=self.pacer)
+        try:
+            return fetcher.fetch_all(guides)
+        finally:
+            fetcher.close()
+
+    def extract_guides(
+        self,
+        start_date: str,
+        end_date: str,
+        max_guides: Optional[int] = None,
+        is_known: Optional[Callable[[List[Dict]], List[bool]]] = None,
+        skip_pages: int = 0,
+        on_page: Optional[Callable[[Optional[int], List[Dict], bool], None]] = None,
+    ) -> List[Dict]:
         """
         Extract guides from Unimed system within the specified date range
-        
+
         Args:
             start_date (str): Start date in format dd/mm/yyyy
             end_date (str): End date in format dd/mm/yyyy
             max_guides (Optional[int]): Maximum number of guides to extract. If None, extracts all guides.
-        
+            is_known (Optional[Callable]): Flags guides already scraped, which are skipped
+            skip_pages (int): Listing pages already handled in a previous run
+            on_page (Optional[Callable]): Called with (page, extracted guides, complete)
+                as each listing page is done, so results can be flushed incrementally.
+                `complete` is False when some guides of the page were left for the
+                Selenium fallback, which is reported last with page None.
+
         Returns:
             List[Dict]: List of extracted guides
         """
         try:
-            self.setup_driver()
-            self.capture_guides(start_date, end_date)
-            
-            # Se max_guides for especificado, limita o número de guias
-            if max_guides is not None and max_guides > 0:
-                self.captured_guides = self.captured_guides[:max_guides]
-                self.protocol_data = self.protocol_data[:max_guides]
-            
-            # Processa e retorna as guias capturadas
-            guides_data = []
-            for guide, protocol in zip(self.captured_guides, self.protocol_data):
-                guide_info = self.process_guide_data(guide, protocol)
-                if guide_info:
-                    guides_data.append(guide_info)
-                    
-                    # Se atingiu o limite, para o processamento
-                    if max_guides is not None and len(guides_data) >= max_guides:
+            if self.driver is None:
+                self.setup_driver()
+            self.reset()
+
+            stats = self.phase_stats
+            fallback = []
+            remaining = max_guides if max_guides and max_guides > 0 else None
+            listing_started = time.monotonic()
+            for page, guides in self.iter_guide_pages(start_date, end_date, skip_pages):
+                stats["listing_seconds"] += time.monotonic() - listing_started
+                stats["pages"] += 1
+                if is_known and guides:
+                    guides = [g for g, known in zip(guides, is_known(guides)) if not known]
+                if remaining is not None:
+                    guides = guides[:remaining]
+                self.captured_guides.extend(guides)
+
+                details_started = time.monotonic()
+                fetched, pending = self._fetch_details(guides)
+                stats["details_seconds"] += time.monotonic() - details_started
+                self.protocol_data.extend(fetched)
+                fallback.extend(pending)
+                if on_page:
+                    on_page(page, fetched, not pending)
+
+                if remaining is not None:
+                    remaining -= len(guides)
+                    if remaining <= 0:
                         break
-            
-            return guides_data
+                listing_started = time.monotonic()
+
+            # Selenium fallback navigates away from the listing, so it runs last
+            if fallback:
+                self.logger.info(f"Falling back to Selenium for {len(fallback)} guides")
+                first = len(self.protocol_data)
+                fallback_started = time.monotonic()
+                for guide in fallback:
+                    self.process_guide(guide)
+                stats["fallback_seconds"] += time.monotonic() - fallback_started
+                stats["fallback_guides"] += len(fallback)
+                if on_page:
+                    on_page(None, self.protocol_data[first:], True)
+
+            return self.protocol_data
         except Exception as e:
             self.logger.error(f"Error extracting guides: {str(e)}")
             raise
 
+    def guide_details(self, guide_number: str) -> List[Dict]:
+        """
+        Details of one guide found by its number, one entry per attendance,
+        in the same schema as extract_guides
+        """
+        if self.driver is None:
+            self.setup_driver()
+        rows = self.search_guide(guide_number)
+        fetched, pending = self._fetch_details(rows)
+        if pending:
+            first = len(self.protocol_data)
+            for guide in pending:
+                self.process_guide(guide)
+            fetched.extend(self.protocol_data[first:])
+        return fetched
+
     def process_guide(self, guide_data: Dict):
         """Process individual guide and extract detailed information"""
         try:
-            # Search for the guide
-            guide_search = self.wait.until(
-                EC.presence_of_element_located((By.NAME, "s_nr_guia"))
-            )
-            guide_search.clear()
-            guide_search.send_keys(guide_data["guide_number"])
-
-            filter_button = self.wait.until(
-                EC.element_to_be_clickable((By.NAME, "Button_FIltro"))
-            )
-            filter_button.click()
-            self.random_wait()
+            rows = self.search_guide(guide_data["guide_number"])
+            if not rows:
+                raise NoSuchElementException(
+                    f"Guide {guide_data['guide_number']} not found"
+                )
 
             # Extract guide information
             card_number = self.wait.until(
-                EC.presence_of_element_located(
-                    (By.XPATH, '//*[@id="conteudo"]/table[1]/tbody/tr[6]/td[1]/span')
-                )
+                EC.presence_of_element_located((By.XPATH, portal.CARD_NUMBER))
             ).text
 
-            # Get biometric information
-            biometric_icon = self.wait.until(
-                EC.element_to_be_clickable(
-                    (
-                        By.XPATH,
-                        '//*[@id="conteudo"]/form[2]/table/tbody/tr[2]/td[7]/span[2]/a',
-                    )
-                )
+            # Get biometric information from the row of this attendance
+            row_index = next(
+                (i for i, row in enumerate(rows) if row["date"] == guide_data["date"]),
+                0,
+            )
+            listing_rows = [
+                row
+                for row in self.driver.find_elements(By.XPATH, portal.LISTING_ROWS)
+                if row.find_elements(By.XPATH, portal.ROW_GUIDE_LINK)
+            ]
+            biometric_icon = listing_rows[row_index].find_element(
+                By.XPATH, portal.ROW_BIOMETRIC_LINK
+            )
+            windows = len(self.driver.window_handles)
+            self.paced(
+                biometric_icon.click,
+                lambda driver: len(driver.window_handles) > windows,
             )
-            biometric_icon.click()
-            self.random_wait()
 
             # Switch to biometric window
             self.driver.switch_to.window(self.driver.window_handles[-1])
@@ -236,6 +445,7 @@ class UnimedScraper:
 
             # Combine all information
             protocol_entry = {
+                "date": guide_data["date"],
                 "guide_number": guide_data["guide_number"],
                 "card_number": card_number,
                 "biometric_data": biometric_data,
@@ -253,18 +463,18 @@ class UnimedScraper:
     def _extract_biometric_data(self, execution_date: str) -> str:
         """Extract biometric data from the biometric window"""
         try:
-            table = self.wait.until(
-                EC.presence_of_element_located(
-                    (By.XPATH, '//*[@id="conteudo-submenu"]/table[2]')
-                )
+            self.wait.until(
+                EC.presence_of_element_located((By.XPATH, portal.BIOMETRIC_ROWS))
             )
-            rows = table.find_elements(By.TAG_NAME, "tr")
+            rows = self.driver.find_elements(By.XPATH, portal.BIOMETRIC_ROWS)
 
-            for i in range(len(rows)):
+            for i in range(len(rows) - 1):
                 try:
-                    date_elem = rows[i].find_element(By.XPATH, "./td[2]/span")
+                    date_elem = rows[i].find_element(By.XPATH, portal.BIOMETRIC_ROW_DATE)
                     if date_elem.text == execution_date:
-                        biometric_elem = rows[i + 1].find_element(By.XPATH, "./td/span")
+                        biometric_elem = rows[i + 1].find_element(
+                            By.XPATH, portal.BIOMETRIC_ROW_TEXT
+                        )
                         return biometric_elem.text
                 except NoSuchElementException:
                     continue
@@ -277,25 +487,22 @@ class UnimedScraper:
 
     def _extract_guide_details(self) -> Dict:
         """Extract detailed information from the guide"""
-        xpath_mappings = {
-            "professional_name": '//*[@id="conteudo"]/table[5]/tbody/tr[3]/td[4]',
-            "council_name": '//*[@id="conteudo"]/table[5]/tbody/tr[3]/td[5]',
-            "council_number": '//*[@id="conteudo"]/table[5]/tbody/tr[3]/td[6]',
-            "council_state": '//*[@id="conteudo"]/table[5]/tbody/tr[3]/td[7]',
-            "cbo_code": '//*[@id="conteudo"]/table[5]/tbody/tr[3]/td[8]',
-            "therapy_code": '//*[@id="conteudo"]/table[2]/tbody/tr[2]/td[2]',
-        }
-
         details = {}
-        for key, xpath in xpath_mappings.items():
+        for key, xpath in portal.GUIDE_DETAIL_FIELDS.items():
             try:
                 element = self.wait.until(
                     EC.presence_of_element_located((By.XPATH, xpath))
                 )
                 details[key] = element.text.strip()
-            except:
+            except TimeoutException:
                 details[key] = ""
 
+        cells = self.driver.find_elements(
+            By.XPATH, portal.EXECUTION_DATE_CELLS
+        ) or self.driver.find_elements(By.XPATH, portal.EXECUTION_DATE_CELLS_FALLBACK)
+        details["execution_dates"] = portal.parse_execution_dates(
+            [cell.text for cell in cells]
+        )
         return details
 
     def save_to_excel(self, filename: str):
@@ -307,3 +514,49 @@ class UnimedScraper:
         """Close the browser and clean up"""
         if self.driver:
             self.driver.quit()
+
+
+class AsyncUnimedScraper:
+    """
+    Async interface to UnimedScraper for asyncio callers.
+
+    Selenium calls block, so every call runs on a dedicated single-thread
+    executor: the event loop stays free and the driver is only ever used
+    from one thread.
+    """
+
+    def __init__(self, scraper: UnimedScraper = None, **kwargs):
+        self.scraper = scraper or UnimedScraper(**kwargs)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="unimed-driver"
+        )
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    @property
+    def pacer(self) -> AccountPacer:
+        return self.scraper.pacer
+
+    async def setup_driver(self):
+        await self._run(self.scraper.setup_driver)
+
+    async def login(self, username: str, password: str) -> bool:
+        return await self._run(self.scraper.login, username, password)
+
+    async def extract_guides(self, start_date: str, end_date: str, **kwargs) -> List[Dict]:
+        return await self._run(
+            self.scraper.extract_guides, start_date, end_date, **kwargs
+        )
+
+    async def guide_details(self, guide_number: str) -> List[Dict]:
+        return await self._run(self.scraper.guide_details, guide_number)
+
+    async def close(self):
+        try:
+            await self._run(self.scraper.close)
+        finally:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,311 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from browser_sessions import CookieStore, browser_pool
+from pacing import get_pacer
+from scrape_state import KnownGuidesIndex, ScrapeCheckpoint
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = "%d/%m/%Y"
+
+SCRAPER_POOL_SIZE = int(os.getenv("SCRAPER_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+# Portal sessions allowed at once for the same account, across all workers
+MAX_SESSIONS_PER_ACCOUNT = int(os.getenv("UNIMED_MAX_SESSIONS_PER_ACCOUNT", "3"))
+SESSION_LEASE_SECONDS = 60 * 60
+
+
+def split_date_range(
+    start_date: str, end_date: str, parts: int
+) -> List[Tuple[str, str]]:
+    """
+    Split an inclusive dd/mm/yyyy range into up to `parts` contiguous,
+    non-overlapping sub-ranges of whole days.
+    """
+    start = datetime.strptime(start_date, DATE_FORMAT)
+    end = datetime.strptime(end_date, DATE_FORMAT)
+    if end < start:
+        raise ValueError(f"end_date {end_date} is before start_date {start_date}")
+
+    total_days = (end - start).days + 1
+    parts = max(1, min(parts, total_days))
+    base, extra = divmod(total_days, parts)
+
+    ranges = []
+    current = start
+    for i in range(parts):
+        days = base + (1 if i < extra else 0)
+        last = current + timedelta(days=days - 1)
+        ranges.append((current.strftime(DATE_FORMAT), last.strftime(DATE_FORMAT)))
+        current = last + timedelta(days=1)
+    return ranges
+
+
+class AccountSessionLimiter:
+    """
+    Counting semaphore per portal account.
+
+    With a Redis connection the limit holds across every worker process
+    (slots are leases in a sorted set, so a crashed worker's slot expires;
+    a live holder calls renew() to keep it); without one it only applies
+    within this process.
+    """
+
+    def __init__(self, account: str, limit: int, redis_conn=None):
+        self.limit = limit
+        self.redis = redis_conn
+        self.key = f"scraper:sessions:{account}"
+        self._local = threading.BoundedSemaphore(limit)
+
+    def acquire(self, poll_seconds: float = 2.0) -> Optional[str]:
+        if self.redis is None:
+            self._local.acquire()
+            return None
+
+        token = str(uuid.uuid4())
+        while True:
+            now = time.time()
+            pipe = self.redis.pipeline()
+            pipe.zremrangebyscore(self.key, 0, now - SESSION_LEASE_SECONDS)
+            pipe.zadd(self.key, {token: now})
+            pipe.zrank(self.key, token)
+            pipe.expire(self.key, SESSION_LEASE_SECONDS)
+            _, _, rank, _ = pipe.execute()
+            if rank is not None and rank < self.limit:
+                return token
+            self.redis.zrem(self.key, token)
+            time.sleep(poll_seconds)
+
+    def renew(self, token: Optional[str]):
+        """Push a held lease's expiry forward (re-adding it if it lapsed)"""
+        if self.redis is None:
+            return
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.key, {token: time.time()})
+        pipe.expire(self.key, SESSION_LEASE_SECONDS)
+        pipe.execute()
+
+    def release(self, token: Optional[str]):
+        if self.redis is None:
+            self._local.release()
+        else:
+            self.redis.zrem(self.key, token)
+
+
+class ScraperPool:
+    """
+    Scrape a date range with several browser sessions in parallel.
+
+    The range is split into sub-ranges, each scraped by its own browser
+    session, taken from the worker's warm browser pool. At most `pool_size`
+    sessions run here, and at most `max_sessions_per_account` run for the
+    account overall. Results are merged in date order and deduplicated by
+    guide_number.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        pool_size: int = None,
+        max_sessions_per_account: int = None,
+        redis_conn=None,
+    ):
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size or SCRAPER_POOL_SIZE
+        self.limiter = AccountSessionLimiter(
+            username, max_sessions_per_account or MAX_SESSIONS_PER_ACCOUNT, redis_conn
+        )
+        self.failed_ranges: List[Dict] = []
+        self.pacing_report: Dict = {}
+        self.redis = redis_conn
+        self.cookie_store = CookieStore(redis_conn, username) if redis_conn else None
+        self.known_index: Optional[KnownGuidesIndex] = None
+        self.checkpoint: Optional[ScrapeCheckpoint] = None
+        self.on_guides: Optional[Callable[[List[Dict]], None]] = None
+        self._remaining: Optional[int] = None
+        self._budget_lock = threading.Lock()
+
+    def _day_range(self, start_date: str, end_date: str) -> List[str]:
+        start = datetime.strptime(start_date, DATE_FORMAT)
+        days = (datetime.strptime(end_date, DATE_FORMAT) - start).days + 1
+        return [(start + timedelta(days=i)).strftime(DATE_FORMAT) for i in range(days)]
+
+    def _remaining_budget(self) -> Optional[int]:
+        """Guides the run may still extract under max_guides (None: no limit)"""
+        with self._budget_lock:
+            return self._remaining
+
+    def _spend_budget(self, used: int):
+        with self._budget_lock:
+            if self._remaining is not None:
+                self._remaining -= used
+
+    def _scrape_day(self, scraper, day: str) -> List[Dict]:
+        checkpoint = self.checkpoint
+        skip_pages = checkpoint.pages_done(day) if checkpoint else 0
+        contiguous = True
+
+        def on_page(page: Optional[int], guides: List[Dict], complete: bool):
+            nonlocal contiguous
+            if guides and self.on_guides:
+                self.on_guides(guides)
+            if guides and self.known_index:
+                self.known_index.add(guides)
+            # Only pages delivered without gaps can be skipped on resume
+            contiguous = contiguous and complete
+            if checkpoint and page is not None and contiguous:
+                checkpoint.mark_page_done(day, page)
+
+        budget = self._remaining_budget()
+        if budget is not None and budget <= 0:
+            return []
+
+        # Back to the home page, where the listing menu is
+        scraper.is_logged_in()
+        guides = scraper.extract_guides(
+            day,
+            day,
+            max_guides=budget,
+            is_known=self.known_index.is_known if self.known_index else None,
+            skip_pages=skip_pages,
+            on_page=on_page,
+        )
+        self._spend_budget(len(guides))
+        # A day cut short by max_guides still has guides left
+        if checkpoint and (budget is None or len(guides) < budget):
+            checkpoint.mark_day_done(day)
+        return list(guides)
+
+    def _scrape_range(self, start_date: str, end_date: str) -> List[Dict]:
+        token = self.limiter.acquire()
+        try:
+            scraper = browser_pool.acquire(
+                self.username, self.password, self.cookie_store
+            )
+            healthy = False
+            try:
+                guides = []
+                for day in self._day_range(start_date, end_date):
+                    if self.checkpoint and self.checkpoint.is_day_done(day):
+                        continue
+                    # Long sub-ranges outlive SESSION_LEASE_SECONDS
+                    self.limiter.renew(token)
+                    guides.extend(self._scrape_day(scraper, day))
+                healthy = True
+                return guides
+            finally:
+                browser_pool.release(scraper, healthy=healthy)
+        finally:
+            self.limiter.release(token)
+
+    def run(
+        self,
+        start_date: str,
+        end_date: str,
+        max_guides: Optional[int] = None,
+        on_progress: Optional[Callable[[int, int, int], None]] = None,
+        on_guides: Optional[Callable[[List[Dict]], None]] = None,
+        incremental: bool = True,
+    ) -> List[Dict]:
+        """
+        Scrape all guides between start_date and end_date (dd/mm/yyyy).
+
+        Days are scraped one at a time within each sub-range, and each listing
+        page's guides are handed to `on_guides` as soon as they are extracted.
+        With `incremental` (and a Redis connection), guides already delivered
+        are skipped and completed days/pages are checkpointed, so a failed run
+        of the same range resumes where it stopped.
+
+        Args:
+            start_date (str): Start date in format dd/mm/yyyy
+            end_date (str): End date in format dd/mm/yyyy
+            max_guides (Optional[int]): Maximum number of guides to extract
+            on_progress: Called with (finished ranges, total ranges, guides so far)
+            on_guides: Called with each batch of extracted guides; should raise
+                if they could not be delivered
+            incremental (bool): Use the known-guides index and checkpoints
+
+        Returns:
+            List[Dict]: Guides ordered by sub-range, unique by guide_number.
+            Sub-ranges that failed are listed in self.failed_ranges, and the
+            portal request pacing of the run is in self.pacing_report.
+        """
+        pacer = get_pacer(self.username)
+        pacer.begin_run()
+        try:
+            return self._run(
+                start_date, end_date, max_guides, on_progress, on_guides, incremental
+            )
+        finally:
+            self.pacing_report = pacer.report()
+            logger.info(f"Pacing: {self.pacing_report}")
+
+    def _run(
+        self,
+        start_date: str,
+        end_date: str,
+        max_guides: Optional[int],
+        on_progress: Optional[Callable[[int, int, int], None]],
+        on_guides: Optional[Callable[[List[Dict]], None]],
+        incremental: bool,
+    ) -> List[Dict]:
+        self.on_guides = on_guides
+        self._remaining = max_guides if max_guides and max_guides > 0 else None
+        if incremental and self.redis is not None:
+            self.known_index = KnownGuidesIndex(self.redis, self.username)
+            self.checkpoint = ScrapeCheckpoint(
+                self.redis, self.username, start_date, end_date
+            )
+        else:
+            self.known_index = None
+            self.checkpoint = None
+
+        ranges = split_date_range(start_date, end_date, self.pool_size)
+        results_by_range: Dict[int, List[Dict]] = {}
+        self.failed_ranges = []
+
+        logger.info(
+            f"Scraping {start_date} - {end_date} in {len(ranges)} sub-ranges "
+            f"({self.pool_size} sessions, account cap {self.limiter.limit})"
+        )
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = {
+                executor.submit(self._scrape_range, start, end): i
+                for i, (start, end) in enumerate(ranges)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results_by_range[i] = future.result()
+                except Exception as e:
+                    logger.error(f"Sub-range {ranges[i]} failed: {str(e)}")
+                    self.failed_ranges.append(
+                        {"start_date": ranges[i][0], "end_date": ranges[i][1], "error": str(e)}
+                    )
+
+                if on_progress:
+                    done = len(results_by_range) + len(self.failed_ranges)
+                    found = sum(len(r) for r in results_by_range.values())
+                    on_progress(done, len(ranges), found)
+
+        if len(self.failed_ranges) == len(ranges):
+            raise Exception(f"All sub-ranges failed: {self.failed_ranges}")
+
+        merged = {}
+        for i in sorted(results_by_range):
+            for guide in results_by_range[i]:
+                merged.setdefault(guide["guide_number"], guide)
+
+        guides = list(merged.values())
+        if max_guides is not None and max_guides > 0:
+            guides = guides[:max_guides]
+        return guides
@@ -0,0 +1,97 @@
+import json
+import os
+from typing import AsyncIterator, Dict, Optional
+
+# Status hashes and event streams of a task expire after this long
+TASK_TTL_SECONDS = int(os.getenv("SCRAPER_TASK_TTL", str(24 * 60 * 60)))
+# Events kept per task (older ones are trimmed)
+MAX_EVENTS_PER_TASK = 1000
+# How long an SSE connection waits for an event before a keep-alive comment
+SSE_BLOCK_MS = 10_000
+
+FINAL_STATUSES = {"completed", "failed"}
+
+
+def status_key(task_id: str) -> str:
+    return f"task:{task_id}"
+
+
+def events_key(task_id: str) -> str:
+    return f"task:{task_id}:events"
+
+
+def _text(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def publish_status(redis_conn, task_id: str, fields: Dict):
+    """
+    Update the task's status hash and append the change to its event stream,
+    in one round trip. Both keys get the task TTL.
+    """
+    pipe = redis_conn.pipeline()
+    pipe.hset(status_key(task_id), mapping=fields)
+    pipe.expire(status_key(task_id), TASK_TTL_SECONDS)
+    pipe.xadd(events_key(task_id), fields, maxlen=MAX_EVENTS_PER_TASK, approximate=True)
+    pipe.expire(events_key(task_id), TASK_TTL_SECONDS)
+    pipe.execute()
+
+
+def _sse(event_id: Optional[str], fields: Dict) -> str:
+    data = {_text(k): _text(v) for k, v in fields.items()}
+    if data.get("result"):
+        data["result"] = json.loads(data["result"])
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += ["event: status", f"data: {json.dumps(data, ensure_ascii=False)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+async def client_is_done(redis_conn, task_id: str, last_event_id: str) -> bool:
+    """
+    True when a reconnecting client (Last-Event-ID) already has every event of
+    a task that reached a final status, so there is nothing left to stream.
+    """
+    status = await redis_conn.hget(status_key(task_id), "status")
+    if _text(status or b"") not in FINAL_STATUSES:
+        return False
+    missed = await redis_conn.xread({events_key(task_id): last_event_id}, count=1)
+    return not missed
+
+
+async def stream_events(
+    redis_conn, task_id: str, last_event_id: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Server-sent events for a task (redis_conn is a redis.asyncio client).
+
+    A new connection first gets the current status; a reconnecting client
+    (Last-Event-ID) gets the events it missed. Ends after a final status, or
+    when the task is already final (or expired) and nothing new arrives.
+    """
+    if last_event_id:
+        cursor = last_event_id
+    else:
+        latest = await redis_conn.xrevrange(events_key(task_id), count=1)
+        cursor = _text(latest[0][0]) if latest else "0-0"
+        snapshot = await redis_conn.hgetall(status_key(task_id))
+        yield _sse(cursor if latest else None, snapshot)
+        if _text(snapshot.get(b"status", b"")) in FINAL_STATUSES:
+            return
+
+    while True:
+        response = await redis_conn.xread(
+            {events_key(task_id): cursor}, block=SSE_BLOCK_MS
+        )
+        if not response:
+            # The final event was sent before the cursor, or the task expired
+            if not await redis_conn.exists(events_key(task_id)):
+                return
+            if await client_is_done(redis_conn, task_id, cursor):
+                return
+            yield ": keep-alive\n\n"
+            continue
+        for event_id, fields in response[0][1]:
+            cursor = _text(event_id)
+            yield _sse(cursor, fields)
+            if _text(fields.get(b"status", b"")) in FINAL_STATUSES:
+                return
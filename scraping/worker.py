@@ -1,10 +1,12 @@
 from datetime import datetime
 import os
-import requests
-from scraper import UnimedScraper
+from scraper_pool import ScraperPool
+from guide_delivery import GuideSender, ThrottledProgress
+from task_events import publish_status
 from redis import Redis
 import logging
 import json
+import threading
 import traceback
 
 # Configuração de logs
@@ -20,7 +22,7 @@ redis_conn = Redis(host="localhost", port=6379, socket_timeout=5, retry_on_timeo
 def atualizar_status(
     task_id: str, status: str, detalhes: dict = None, error: str = None
 ):
-    """Atualiza o status da tarefa no Redis"""
+    """Atualiza o status da tarefa no Redis e publica o evento de progresso"""
     try:
         status_data = {"status": status}
         if detalhes:
@@ -33,7 +35,7 @@ def atualizar_status(
         if error:
             status_data["error"] = error.encode("utf-8")
 
-        redis_conn.hset(f"task:{task_id}", mapping=status_data)
+        publish_status(redis_conn, task_id, status_data)
         logger.info(f"✅ Status atualizado: {task_id} -> {status}")
         logger.debug(f"📋 Detalhes do status: {status_data}")
     except Exception as e:
@@ -61,71 +63,92 @@ def process_scraping(task_id: str, task_data: dict, *args, **kwargs):
                 "Credenciais da Unimed não configuradas nos secrets do Replit"
             )
 
-        scraper = UnimedScraper()
-        logger.info("🔑 Realizando login na Unimed...")
-        atualizar_status(task_id, "login", {"message": "Realizando login na Unimed"})
-
-        scraper.login(username, password)
-        logger.info("✅ Login realizado com sucesso")
-
         # Define datas padrão se não fornecidas
         start_date = task_data.get("start_date") or datetime.now().strftime("%d/%m/%Y")
         end_date = task_data.get("end_date") or datetime.now().strftime("%d/%m/%Y")
         max_guides = task_data.get("max_guides")  # Pode ser None
 
+        api_url = os.environ.get("MAIN_API_BULK_URL")
+        if not api_url:
+            raise Exception("MAIN_API_BULK_URL não configurada")
+
+        # Cada subperíodo roda em uma sessão própria do navegador (com login)
+        pool = ScraperPool(username, password, redis_conn=redis_conn)
+        sender = GuideSender(api_url)
+        resumo_envio = {"sent": 0, "errors": [], "failed_batches": 0}
+        lock_envio = threading.Lock()
+
+        def enviar(guias: list):
+            """Envia as guias de cada página assim que são extraídas"""
+            with lock_envio:
+                resumo = sender.send_all(guias)
+                resumo_envio["sent"] += resumo["sent"]
+                resumo_envio["errors"].extend(resumo["errors"])
+                resumo_envio["failed_batches"] += resumo["failed_batches"]
+            if resumo["failed_batches"]:
+                # Sem checkpoint: as guias serão extraídas de novo na próxima execução
+                raise Exception(f"{resumo['failed_batches']} lotes não foram enviados")
+
+        progresso = ThrottledProgress(
+            lambda concluidos, total, guias: atualizar_status(
+                task_id,
+                "extraindo",
+                {
+                    "message": "Extraindo e enviando guias do sistema Unimed",
+                    "ranges_done": concluidos,
+                    "ranges_total": total,
+                    "guides_found": guias,
+                    "sent_guides": resumo_envio["sent"],
+                },
+            ),
+            interval=0.5,
+        )
+
         logger.info(
             f"🔍 Extraindo guias (limite: {max_guides if max_guides else 'sem limite'})..."
         )
         atualizar_status(
             task_id, "extraindo", {"message": "Extraindo guias do sistema Unimed"}
         )
-        results = scraper.extract_guides(start_date, end_date, max_guides=max_guides)
-        logger.info(f"✅ Extraídas {len(results)} guias")
-
-        # Envia resultados para o backend principal
-        api_url = os.environ.get("MAIN_API_URL")
-        if not api_url:
-            raise Exception("MAIN_API_URL não configurada")
+        try:
+            results = pool.run(
+                start_date,
+                end_date,
+                max_guides=max_guides,
+                on_progress=progresso,
+                on_guides=enviar,
+                incremental=not task_data.get("force"),
+            )
+        finally:
+            sender.close()
+        logger.info(f"✅ Extraídas {len(results)} guias novas")
+        if pool.failed_ranges:
+            logger.error(f"❌ Subperíodos com falha: {pool.failed_ranges}")
+        if resumo_envio["errors"]:
+            logger.error(f"❌ Guias rejeitadas pelo backend: {resumo_envio['errors']}")
+        if resumo_envio["failed_batches"]:
+            logger.error(
+                f"❌ {resumo_envio['failed_batches']} lotes não foram enviados"
+            )
 
-        logger.info("📤 Enviando guias para o backend principal...")
+        logger.info("🎉 Processo concluído com sucesso")
         atualizar_status(
             task_id,
-            "enviando",
+            "completed",
             {
-                "message": "Enviando guias para o sistema",
-                "total_guides": len(results),
-                "processed_guides": 0,
-            },
-        )
-
-        for i, guide in enumerate(results, 1):
-            try:
-                response = requests.post(api_url, json=guide)
-                response.raise_for_status()
-                atualizar_status(
-                    task_id,
-                    "enviando",
+                "result": json.dumps(
                     {
-                        "message": "Enviando guias para o sistema",
                         "total_guides": len(results),
-                        "processed_guides": i,
-                    },
+                        "sent_guides": resumo_envio["sent"],
+                        "rejected_guides": len(resumo_envio["errors"]),
+                        "failed_batches": resumo_envio["failed_batches"],
+                        "failed_ranges": pool.failed_ranges,
+                        "pacing": pool.pacing_report,
+                    }
                 )
-                logger.debug(f"✅ Guia {i}/{len(results)} enviada com sucesso")
-            except Exception as e:
-                logger.error(f"❌ Erro ao enviar guia {i}/{len(results)}: {str(e)}")
-
-        logger.info("🎉 Processo concluído com sucesso")
-        atualizar_status(
-            task_id, "completed", {"result": json.dumps({"total_guides": len(results)})}
+            },
         )
     except Exception as e:
         logger.error(f"❌ Erro durante o scraping: {str(e)}")
         logger.error(f"Stack trace: {traceback.format_exc()}")
         atualizar_status(task_id, "failed", error=str(e))
-    finally:
-        try:
-            scraper.close()
-            logger.info("✅ Recursos do scraper liberados")
-        except Exception as e:
-            logger.error(f"❌ Erro ao fechar scraper: {str(e)}")
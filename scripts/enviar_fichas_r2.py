@@ -0,0 +1,52 @@
+import os
+import argparse
+
+from storage_r2 import storage
+
+
+def enviar_pasta(pasta, prefixo="", workers=8, dedup=True):
+    """
+    Envia todos os PDFs da pasta para o R2 em paralelo.
+
+    Arquivos que já existem no bucket com o mesmo conteúdo são ignorados
+    (a menos que dedup=False). Retorna os resultados por arquivo.
+    """
+    arquivos = [
+        (os.path.join(pasta, nome), f"{prefixo}{nome}")
+        for nome in sorted(os.listdir(pasta))
+        if nome.lower().endswith(".pdf")
+    ]
+    return storage.upload_files(arquivos, max_workers=workers, dedup=dedup)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Envia os PDFs de fichas de uma pasta para o R2."
+    )
+    parser.add_argument("pasta", nargs="?", default="guias_processadas")
+    parser.add_argument("--prefixo", default="", help="Prefixo das chaves no bucket")
+    parser.add_argument("--workers", type=int, default=8, help="Uploads simultâneos")
+    parser.add_argument(
+        "--force", action="store_true", help="Reenvia mesmo arquivos idênticos"
+    )
+    args = parser.parse_args()
+
+    resultados = enviar_pasta(
+        args.pasta, args.prefixo, workers=args.workers, dedup=not args.force
+    )
+
+    resumo = {"enviado": 0, "ignorado": 0, "erro": 0}
+    for r in resultados:
+        resumo[r["status"]] += 1
+        if r["status"] == "erro":
+            print(f"Erro ao enviar {r['arquivo']}: {r['erro']}")
+
+    tempo_total = sum(r["tempo_ms"] for r in resultados) / 1000
+    print(
+        f"Concluído: {resumo['enviado']} enviados, {resumo['ignorado']} idênticos "
+        f"ignorados, {resumo['erro']} com erro ({tempo_total:.1f}s de upload)."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,41 @@
+"""
+Sincroniza os agendamentos do sistema ABA (MySQL, ps_schedule) com a tabela
+agendamentos do Supabase.
+
+As linhas são lidas em streaming (cursor no servidor, em ordem de schedule_id)
+e gravadas com upsert em mysql_id, então rodar de novo não duplica nada. Sem
+--full, só vêm as linhas alteradas desde a última sincronização (marca d'água
+de schedule_lastupdate guardada no Supabase). A leitura do MySQL e a escrita
+no Supabase correm em paralelo, ligadas por uma fila limitada.
+
+    python import_agendamentos_sistema_aba.py           # incremental
+    python import_agendamentos_sistema_aba.py --full    # carga completa
+
+Requer sql/migrations/agendamentos_sync.sql aplicada no Supabase.
+"""
+
+import argparse
 import os
+import queue
+import threading
+import time
 import mysql.connector
 from dotenv import load_dotenv
 from supabase import create_client, Client
-import time
-from datetime import datetime
-from typing import List, Dict, Any
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Any, Optional
 from decimal import Decimal
 
 # Configurações
-BATCH_SIZE = 100  # Número de registros a serem importados por vez
-TOTAL_LIMIT = 500  # Limite total de registros a serem importados (None para todos)
+BATCH_SIZE = int(os.getenv("SYNC_AGENDAMENTOS_BATCH", "1000"))  # Linhas por upsert
+WRITERS = int(os.getenv("SYNC_AGENDAMENTOS_WRITERS", "2"))  # Upserts simultâneos
+QUEUE_BATCHES = 8  # Lotes lidos e ainda não gravados; limita a memória
+# Linhas por SELECT; cada consulta continua do último schedule_id lido
+KEYSET_CHUNK = 50_000
+# Relê este intervalo antes da marca d'água, para não perder linhas gravadas
+# por transações que terminaram depois da última sincronização
+WATERMARK_OVERLAP = timedelta(minutes=5)
+WATERMARK_KEY = "agendamentos_mysql"
 
 # Configurações MySQL
 MYSQL_CONFIG = {
@@ -19,6 +45,34 @@ MYSQL_CONFIG = {
     "database": "abalarissa_db",
 }
 
+SCHEDULE_QUERY = """
+    SELECT
+        schedule_id as mysql_id,
+        schedule_date_start as data_inicio,
+        schedule_date_end as data_fim,
+        schedule_pacient_id as mysql_paciente_id,
+        schedule_pagamento_id as pagamento_id,
+        schedule_room_id as sala_id,
+        schedule_qtd_sessions as qtd_sessoes,
+        schedule_status as status,
+        schedule_room_rent_value as valor_sala,
+        schedule_fixed as fixo,
+        schedule_especialidade_id as especialidade_id,
+        schedule_local_id as local_id,
+        schedule_saldo_sessoes as saldo_sessoes,
+        schedule_elegibilidade as elegibilidade,
+        schedule_falta_do_profissional as falta_profissional,
+        schedule_parent_id as agendamento_pai_id,
+        parent_id,
+        schedule_codigo_faturamento as codigo_faturamento,
+        schedule_registration_date as data_registro,
+        schedule_lastupdate as ultima_atualizacao
+    FROM ps_schedule
+    WHERE schedule_id > %s {filtro}
+    ORDER BY schedule_id
+    LIMIT %s
+"""
+
 
 def connect_mysql():
     """Estabelece conexão com o MySQL"""
@@ -44,60 +98,101 @@ def connect_supabase() -> Client:
         raise
 
 
-def fetch_mysql_data(mysql_conn, offset: int = 0) -> List[Dict[str, Any]]:
-    """Busca dados do MySQL com paginação"""
-    cursor = mysql_conn.cursor(dictionary=True)
+def stream_mysql_data(
+    mysql_conn,
+    desde: Optional[datetime] = None,
+    batch_size: int = BATCH_SIZE,
+    limite: Optional[int] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lotes de agendamentos em ordem de schedule_id, lidos em streaming.
 
-    query = """
-    SELECT 
-        schedule_id as mysql_id,
-        schedule_date_start as data_inicio,
-        schedule_date_end as data_fim,
-        schedule_pacient_id as mysql_paciente_id,
-        schedule_pagamento_id as pagamento_id,
-        schedule_room_id as sala_id,
-        schedule_qtd_sessions as qtd_sessoes,
-        schedule_status as status,
-        schedule_room_rent_value as valor_sala,
-        schedule_fixed as fixo,
-        schedule_especialidade_id as especialidade_id,
-        schedule_local_id as local_id,
-        schedule_saldo_sessoes as saldo_sessoes,
-        schedule_elegibilidade as elegibilidade,
-        schedule_falta_do_profissional as falta_profissional,
-        schedule_parent_id as agendamento_pai_id,
-        parent_id,
-        schedule_codigo_faturamento as codigo_faturamento,
-        schedule_registration_date as data_registro,
-        schedule_lastupdate as ultima_atualizacao
-    FROM ps_schedule
-    ORDER BY schedule_id
-    LIMIT %s OFFSET %s
+    Cada SELECT pega até KEYSET_CHUNK linhas a partir do último id lido
+    (keyset, sem OFFSET); o cursor sem buffer traz as linhas do servidor aos
+    poucos. Com `desde`, só as alteradas a partir dessa data; com `limite`,
+    no máximo esse número de linhas.
     """
+    query = SCHEDULE_QUERY.format(
+        filtro="AND schedule_lastupdate >= %s" if desde else ""
+    )
+    ultimo_id = 0
+    total = 0
+    while True:
+        # O LIMIT já respeita o limite: o cursor sem buffer é sempre lido até o fim
+        chunk = min(KEYSET_CHUNK, limite - total) if limite else KEYSET_CHUNK
+        if chunk <= 0:
+            return
+        params = [ultimo_id] + ([desde] if desde else []) + [chunk]
+        cursor = mysql_conn.cursor(dictionary=True)
+        try:
+            cursor.execute(query, params)
+            lidas = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                lidas += len(rows)
+                total += len(rows)
+                ultimo_id = rows[-1]["mysql_id"]
+                yield rows
+        finally:
+            cursor.close()
+
+        if lidas < chunk:
+            return
 
-    cursor.execute(query, (BATCH_SIZE, offset))
-    data = cursor.fetchall()
-    cursor.close()
-    return data
 
+def get_paciente_id_mapping(supabase: Client, page_size: int = 1000) -> Dict[int, str]:
+    """
+    Busca o mapeamento entre IDs do MySQL e UUIDs do Supabase.
 
-def get_paciente_id_mapping(supabase: Client) -> Dict[int, str]:
-    """Busca o mapeamento entre IDs do MySQL e UUIDs do Supabase"""
+    Erros são propagados e abortam a sincronização: seguir com um mapeamento
+    incompleto gravaria os agendamentos sem paciente.
+    """
     try:
-        # Busca todos os pacientes que têm o mysql_id definido
-        response = supabase.table('pacientes').select('id, mysql_id').execute()
-        
-        # Cria um dicionário de mysql_id -> uuid
-        mapping = {
-            record['mysql_id']: record['id'] 
-            for record in response.data 
-            if 'mysql_id' in record
-        }
-        
-        return mapping
+        mapping = {}
+        offset = 0
+        # O Supabase limita as linhas por consulta; percorre todas as páginas
+        while True:
+            response = (
+                supabase.table("pacientes")
+                .select("id, mysql_id")
+                .not_.is_("mysql_id", "null")
+                .order("mysql_id")
+                .range(offset, offset + page_size - 1)
+                .execute()
+            )
+            mapping.update({record["mysql_id"]: record["id"] for record in response.data})
+            if len(response.data) < page_size:
+                return mapping
+            offset += page_size
     except Exception as e:
         print(f"Erro ao buscar mapeamento de pacientes: {e}")
-        return {}
+        raise
+
+
+def get_watermark(supabase: Client) -> Optional[datetime]:
+    """schedule_lastupdate mais recente já sincronizado"""
+    response = (
+        supabase.table("sincronizacoes")
+        .select("valor")
+        .eq("chave", WATERMARK_KEY)
+        .execute()
+    )
+    if not response.data or not response.data[0]["valor"]:
+        return None
+    return datetime.fromisoformat(response.data[0]["valor"])
+
+
+def save_watermark(supabase: Client, watermark: datetime):
+    supabase.table("sincronizacoes").upsert(
+        {
+            "chave": WATERMARK_KEY,
+            "valor": watermark.isoformat(),
+            "updated_at": datetime.now().isoformat(),
+        },
+        on_conflict="chave",
+    ).execute()
 
 
 def decimal_to_float(obj):
@@ -119,16 +214,17 @@ def convert_to_boolean(value):
 def transform_data(records: List[Dict[str, Any]], paciente_mapping: Dict[int, str]) -> List[Dict[str, Any]]:
     """Transforma os dados do MySQL para o formato do Supabase"""
     transformed = []
-    
+
     for record in records:
-        # Cria uma cópia do registro para não modificar o original
         transformed_record = {}
-        
+
         # Converte todos os valores do registro
         for key, value in record.items():
-            # Converte o ID do paciente se existir no mapeamento
-            if key == 'mysql_paciente_id' and value in paciente_mapping:
-                transformed_record['paciente_id'] = paciente_mapping[value]
+            # Converte o ID do paciente se existir no mapeamento. Sem mapeamento
+            # a coluna fica de fora, para o upsert não apagar um vínculo já feito
+            if key == 'mysql_paciente_id':
+                if value in paciente_mapping:
+                    transformed_record['paciente_id'] = paciente_mapping[value]
                 transformed_record['mysql_paciente_id'] = value
             # Converte campos booleanos
             elif key in ['fixo', 'falta_profissional']:
@@ -142,65 +238,163 @@ def transform_data(records: List[Dict[str, Any]], paciente_mapping: Dict[int, st
             # Mantém outros valores como estão
             else:
                 transformed_record[key] = value
-        
+
         transformed.append(transformed_record)
-    
+
     return transformed
 
 
-def import_data():
-    """Função principal de importação"""
+def split_by_columns(batch: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Separa um lote em grupos com as mesmas colunas. O PostgREST usa a união
+    das colunas do lote no upsert e grava null nas que faltam em uma linha.
+    """
+    groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+    for record in batch:
+        groups.setdefault(frozenset(record), []).append(record)
+    return list(groups.values())
+
+
+def import_data(
+    full: bool = False,
+    batch_size: int = BATCH_SIZE,
+    writers: int = WRITERS,
+    limite: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Função principal de sincronização.
+
+    Uma thread lê o MySQL e põe lotes já transformados na fila; `writers`
+    threads fazem os upserts. A marca d'água só avança se tudo foi gravado
+    (e não avança com `limite`, que interrompe a leitura no meio).
+    """
     mysql_conn = connect_mysql()
     supabase = connect_supabase()
-    
+    inicio = time.monotonic()
+    stats = {"lidos": 0, "gravados": 0, "lotes": 0}
+    erros: List[Exception] = []
+    lock = threading.Lock()
+    parar = threading.Event()
+    parar_por_limite = threading.Event()
+    fila: "queue.Queue[Optional[List[Dict]]]" = queue.Queue(maxsize=QUEUE_BATCHES)
+    maior_atualizacao: Optional[datetime] = None
+
+    def enfileirar(item) -> bool:
+        # put com timeout para não travar se os gravadores pararem por erro
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def ler(desde: Optional[datetime], paciente_mapping: Dict[int, str]):
+        nonlocal maior_atualizacao
+        try:
+            for rows in stream_mysql_data(mysql_conn, desde, batch_size, limite):
+                stats["lidos"] += len(rows)
+                atualizacao = max(r["ultima_atualizacao"] for r in rows)
+                if maior_atualizacao is None or atualizacao > maior_atualizacao:
+                    maior_atualizacao = atualizacao
+                if not enfileirar(transform_data(rows, paciente_mapping)):
+                    break
+            if limite and stats["lidos"] >= limite:
+                parar_por_limite.set()
+        except Exception as e:
+            erros.append(e)
+            parar.set()
+        finally:
+            for _ in range(writers):
+                fila.put(None)
+
+    def gravar():
+        while True:
+            lote = fila.get()
+            if lote is None:
+                return
+            if parar.is_set():
+                continue
+            try:
+                for grupo in split_by_columns(lote):
+                    supabase.table("agendamentos").upsert(
+                        grupo, on_conflict="mysql_id", returning="minimal"
+                    ).execute()
+                with lock:
+                    stats["gravados"] += len(lote)
+                    stats["lotes"] += 1
+                    if stats["lotes"] % 10 == 0:
+                        print(f"Gravados até agora: {stats['gravados']}")
+            except Exception as e:
+                erros.append(e)
+                parar.set()
+
     try:
+        watermark = None if full else get_watermark(supabase)
+        desde = watermark - WATERMARK_OVERLAP if watermark else None
+        print(
+            f"Sincronização incremental desde {desde}" if desde else "Carga completa"
+        )
+
         # Busca o mapeamento de IDs dos pacientes
         print("\nBuscando mapeamento de IDs dos pacientes...")
         paciente_mapping = get_paciente_id_mapping(supabase)
-        
         if not paciente_mapping:
             print("Aviso: Nenhum mapeamento de pacientes encontrado!")
-        
-        offset = 0
-        total_imported = 0
-        
-        while True:
-            # Verifica se atingiu o limite total
-            if TOTAL_LIMIT and total_imported >= TOTAL_LIMIT:
-                print(f"\nLimite total de {TOTAL_LIMIT} registros atingido.")
-                break
-            
-            print(f"\nBuscando registros do MySQL (offset: {offset})...")
-            records = fetch_mysql_data(mysql_conn, offset)
-            
-            if not records:
-                print("\nNenhum registro adicional encontrado.")
-                break
-            
-            # Transforma os dados
-            transformed_records = transform_data(records, paciente_mapping)
-            
-            # Importa para o Supabase
-            print(f"Importando {len(transformed_records)} registros para o Supabase...")
-            result = supabase.table("agendamentos").insert(transformed_records).execute()
-            
-            total_imported += len(transformed_records)
-            print(f"Total importado até agora: {total_imported}")
-            
-            # Incrementa o offset para a próxima iteração
-            offset += BATCH_SIZE
-            
-            # Pequena pausa para não sobrecarregar as APIs
-            time.sleep(1)
-            
+
+        threads = [threading.Thread(target=gravar) for _ in range(writers)]
+        # A leitura fica em uma thread própria: a conexão MySQL só é usada por ela
+        threads.append(threading.Thread(target=ler, args=(desde, paciente_mapping)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if erros:
+            raise erros[0]
+
+        if maior_atualizacao and not parar_por_limite.is_set():
+            # Nunca recua: uma rodada sem alterações mantém a marca anterior
+            if watermark is None or maior_atualizacao > watermark:
+                save_watermark(supabase, maior_atualizacao)
+                print(f"Marca d'água atualizada para {maior_atualizacao.isoformat()}")
+
     except Exception as e:
         print(f"Erro durante a importação: {e}")
         raise
     finally:
         mysql_conn.close()
-        print(f"\nImportação finalizada. Total de registros importados: {total_imported}")
+        segundos = time.monotonic() - inicio
+        print(
+            f"\nSincronização finalizada: {stats['lidos']} lidos, "
+            f"{stats['gravados']} gravados em {segundos:.1f}s "
+            f"({stats['gravados'] / segundos if segundos else 0:.0f} linhas/s)"
+        )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sincroniza os agendamentos do MySQL com o Supabase."
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="Ignora a marca d'água e relê tudo"
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Linhas por upsert")
+    parser.add_argument("--writers", type=int, default=WRITERS, help="Upserts simultâneos")
+    parser.add_argument(
+        "--limite", type=int, help="Para após este número de linhas (não avança a marca d'água)"
+    )
+    args = parser.parse_args()
+
+    import_data(
+        full=args.full,
+        batch_size=args.batch_size,
+        writers=args.writers,
+        limite=args.limite,
+    )
 
 
 if __name__ == "__main__":
     load_dotenv()
-    import_data()
+    main()
@@ -1,9 +1,41 @@
 import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import cv2
 import pymupdf
-from PIL import Image
 import numpy as np
 
+# As coordenadas dos retângulos foram medidas em páginas renderizadas a 300 dpi
+DPI_REFERENCIA = 300
+
+# Lista de coordenadas dos retângulos e seus rótulos (x, y, largura, altura, rótulo)
+RETANGULOS = [
+    (2850, 325, 315, 85, "    1. FICHA  "),
+    (280, 815, 405, 1350, "    2. DATA  "),
+    (760, 855, 600, 1320, "     3. CARTEIRA        "),
+    (1390, 855, 720, 1320, " 4. BENEFICIARIO           "),
+    (2170, 855, 550, 1320, " 5. NUMERO GUIA"),
+    (2800, 855, 460, 1320, "  6. ASSINATURA "),
+]
+
+# Retângulos de fundo opaco (x1, y1, x2, y2)
+FUNDOS_OPACOS = [
+    (1, 1, 2830, 760),
+    (2775, 480, 3335, 755),
+]
+
+# Cor das caixas e textos (BGR)
+BOX_COLOR = (0, 0, 255)  # Vermelho
+TEXT_COLOR = (0, 0, 255)  # Vermelho
+TEXT_BG_COLOR = (255, 255, 255)  # Branco
+
+QUALIDADE_JPEG = 85
+MANIFESTO = ".manifesto.json"
+
+
 def pdf_to_images(pdf_path, output_folder, dpi=300):
     # Abrir o PDF
     doc = pymupdf.open(pdf_path)
@@ -12,7 +44,7 @@ def pdf_to_images(pdf_path, output_folder, dpi=300):
     for page_number in range(len(doc)):
         page = doc[page_number]
         pix = page.get_pixmap(dpi=dpi)
-        
+
         # Salvar a imagem
         output_path = f"{output_folder}/page_{page_number + 1}.png"
         pix.save(output_path)
@@ -21,84 +53,226 @@ def pdf_to_images(pdf_path, output_folder, dpi=300):
     doc.close()
 
 
+def marcar_imagem(image, escala=1.0):
+    """Desenha os retângulos e rótulos dos campos da ficha sobre a imagem (BGR)"""
 
+    def s(valor):
+        return int(round(valor * escala))
 
-# Função para processar um PDF e aplicar o script de marcação
-def process_pdf(input_pdf_path, output_pdf_path):
-    # Abrir o PDF
-    doc = pymupdf.open(input_pdf_path)
-    processed_images = []
-
-    for page_num, page in enumerate(doc):
-        # Extrair a imagem da página
-        pix = page.get_pixmap(dpi=300)
-        image = cv2.cvtColor(
-            np.array(Image.frombytes("RGB", [pix.width, pix.height], pix.samples)),
-            cv2.COLOR_RGB2BGR
+    for x1, y1, x2, y2 in FUNDOS_OPACOS:
+        cv2.rectangle(image, (s(x1), s(y1)), (s(x2), s(y2)), (255, 255, 255), -1)
+
+    espessura = max(1, s(5))
+    for x, y, w, h, label in RETANGULOS:
+        x, y, w, h = s(x), s(y), s(w), s(h)
+        cv2.rectangle(image, (x, y), (x + w, y + h), BOX_COLOR, espessura)
+
+        text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 4 * escala, 2)[0]
+        text_width, text_height = text_size[0], text_size[1]
+        padding = s(5)
+        text_bg_x1, text_bg_y1 = x + 0, y - text_height - s(20) - padding
+        text_bg_x2, text_bg_y2 = x + s(30) + text_width + s(20), y - s(5) + padding
+
+        cv2.rectangle(
+            image, (text_bg_x1, text_bg_y1), (text_bg_x2, text_bg_y2), TEXT_BG_COLOR, -1
+        )
+        cv2.putText(
+            image,
+            label,
+            (text_bg_x1 + 0, y - s(10)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.7 * escala,
+            TEXT_COLOR,
+            2,
         )
 
-        # Aplicar o script de marcação
-        # Lista de coordenadas dos retângulos e seus rótulos com cores
-        rectangles = [
-            (2850, 325, 315, 85, "    1. FICHA  "),
-            (280, 815, 405, 1350, "    2. DATA  "),
-            (760, 855, 600, 1320, "     3. CARTEIRA        "),
-            (1390, 855, 720, 1320, " 4. BENEFICIARIO           "),
-            (2170, 855, 550, 1320, " 5. NUMERO GUIA"),
-            (2800, 855, 460, 1320, "  6. ASSINATURA "),
-        ]
-
-        # Retângulos de fundo opaco
-        cv2.rectangle(image, (1, 1), (2830, 760), (255, 255, 255), -1)
-        cv2.rectangle(image, (2775, 480), (3335, 755), (255, 255, 255), -1)
-
-        # Cor das caixas e textos
-        box_color = (0, 0, 255)  # Vermelho
-        text_color = (0, 0, 255)  # Vermelho
-        text_bg_color = (255, 255, 255)  # Branco
-
-        for rect in rectangles:
-            x, y, w, h, label = rect
-            cv2.rectangle(image, (x, y), (x + w, y + h), box_color, 5)
-
-            text_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 4, 2)[0]
-            text_width, text_height = text_size[0], text_size[1]
-            padding = 5
-            text_bg_x1, text_bg_y1 = x + 0, y - text_height - 20 - padding
-            text_bg_x2, text_bg_y2 = x + 30 + text_width + 20, y - 5 + padding
-
-            cv2.rectangle(image, (text_bg_x1, text_bg_y1), (text_bg_x2, text_bg_y2), text_bg_color, -1)
-            cv2.putText(image, label, (text_bg_x1 + 0, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, text_color, 2)
-
-        # Adicionar a imagem processada à lista
-        processed_images.append(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
-
-    # Salvar as imagens processadas como PDF
-    processed_images[0].save(output_pdf_path, "PDF", save_all=True, append_images=processed_images[1:])
+    return image
+
+
+# Função para processar um PDF e aplicar o script de marcação
+def process_pdf(input_pdf_path, output_pdf_path, dpi=DPI_REFERENCIA):
+    """
+    Marca os campos de cada página do PDF e grava o resultado em output_pdf_path.
+
+    Cada página é renderizada, marcada e inserida no PDF de saída como JPEG
+    antes da próxima ser renderizada, então só um bitmap fica em memória.
+    """
+    # Evita que cada processo do pool dispare várias threads do OpenCV
+    cv2.setNumThreads(1)
+    escala = dpi / DPI_REFERENCIA
+
+    with pymupdf.open(input_pdf_path) as doc, pymupdf.open() as saida:
+        for page in doc:
+            # Extrair a imagem da página
+            pix = page.get_pixmap(dpi=dpi)
+            rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
+                pix.height, pix.width, pix.n
+            )
+            image = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+            del pix, rgb
+
+            # Aplicar o script de marcação
+            marcar_imagem(image, escala)
+
+            ok, jpeg = cv2.imencode(
+                ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, QUALIDADE_JPEG]
+            )
+            del image
+            if not ok:
+                raise RuntimeError(f"Erro ao codificar página {page.number + 1}")
+
+            # Adicionar a página marcada ao PDF de saída, no tamanho original
+            nova = saida.new_page(width=page.rect.width, height=page.rect.height)
+            nova.insert_image(nova.rect, stream=jpeg.tobytes())
+
+        # Grava em arquivo temporário para não deixar PDFs pela metade no destino
+        temp_path = f"{output_pdf_path}.tmp"
+        saida.save(temp_path, garbage=3, deflate=True)
+        os.replace(temp_path, output_pdf_path)
+
+
+def _sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def carregar_manifesto(output_folder):
+    path = os.path.join(output_folder, MANIFESTO)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def salvar_manifesto(output_folder, manifesto):
+    path = os.path.join(output_folder, MANIFESTO)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def ja_processado(manifesto, input_pdf_path, output_pdf_path, dpi):
+    """
+    Verifica pelo manifesto se o PDF já foi marcado com o mesmo DPI.
+
+    Compara primeiro mtime e tamanho; se mudaram, confere o hash do conteúdo
+    antes de decidir reprocessar. Retorna (processado, entrada_atualizada).
+    """
+    entrada = manifesto.get(os.path.basename(input_pdf_path))
+    if not entrada or entrada.get("dpi") != dpi or not os.path.exists(output_pdf_path):
+        return False, None
+
+    stat = os.stat(input_pdf_path)
+    if entrada["mtime"] == stat.st_mtime and entrada["size"] == stat.st_size:
+        return True, entrada
+
+    if entrada["sha256"] == _sha256(input_pdf_path):
+        return True, {**entrada, "mtime": stat.st_mtime, "size": stat.st_size}
+
+    return False, None
+
+
+def _processar_arquivo(input_pdf_path, output_pdf_path, dpi):
+    """Executado nos processos do pool; retorna a entrada do manifesto"""
+    process_pdf(input_pdf_path, output_pdf_path, dpi)
+    stat = os.stat(input_pdf_path)
+    return {
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha256": _sha256(input_pdf_path),
+        "dpi": dpi,
+    }
+
 
 # Função principal para processar todos os PDFs em uma pasta
-def process_pdfs_in_folder(input_folder, output_folder):
+def process_pdfs_in_folder(
+    input_folder, output_folder, dpi=DPI_REFERENCIA, workers=None, force=False
+):
+    """
+    Marca todos os PDFs da pasta usando um pool de processos.
+
+    PDFs já marcados (segundo o manifesto da pasta de saída) são ignorados,
+    a menos que force=True. Retorna um resumo com processados, ignorados e erros.
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".pdf"):
-            input_pdf_path = os.path.join(input_folder, filename)
-            output_pdf_path = os.path.join(output_folder, filename)
+    manifesto = {} if force else carregar_manifesto(output_folder)
+    resumo = {"processados": 0, "ignorados": 0, "erros": 0}
+    pendentes = []
+
+    for filename in sorted(os.listdir(input_folder)):
+        if not filename.endswith(".pdf"):
+            continue
+
+        input_pdf_path = os.path.join(input_folder, filename)
+        output_pdf_path = os.path.join(output_folder, filename)
+
+        processado, entrada = ja_processado(
+            manifesto, input_pdf_path, output_pdf_path, dpi
+        )
+        if processado:
+            manifesto[filename] = entrada
+            resumo["ignorados"] += 1
+            continue
+
+        pendentes.append((filename, input_pdf_path, output_pdf_path))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_processar_arquivo, input_path, output_path, dpi): filename
+            for filename, input_path, output_path in pendentes
+        }
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                manifesto[filename] = future.result()
+                resumo["processados"] += 1
+                print(f"Processado: {filename}")
+            except Exception as e:
+                resumo["erros"] += 1
+                print(f"Erro ao processar {filename}: {e}")
+                continue
+
+            # Grava o manifesto a cada arquivo para poder retomar se interrompido
+            salvar_manifesto(output_folder, manifesto)
+
+    salvar_manifesto(output_folder, manifesto)
+    return resumo
 
-            print(f"Processando: {input_pdf_path} -> {output_pdf_path}")
-            process_pdf(input_pdf_path, output_pdf_path)
 
-# Configurações de pastas
-input_folder = "guias_novas"
-output_folder = "guias_processadas"
+def main():
+    parser = argparse.ArgumentParser(
+        description="Marca os campos das fichas de presença em PDFs de uma pasta."
+    )
+    parser.add_argument("input_folder", nargs="?", default="guias_novas")
+    parser.add_argument("output_folder", nargs="?", default="guias_processadas")
+    parser.add_argument(
+        "--dpi", type=int, default=DPI_REFERENCIA, help="Resolução de renderização"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Processos (padrão: nº de CPUs)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Reprocessa mesmo os já marcados"
+    )
+    args = parser.parse_args()
 
-# Executar o processamento
-process_pdfs_in_folder(input_folder, output_folder)
+    resumo = process_pdfs_in_folder(
+        args.input_folder,
+        args.output_folder,
+        dpi=args.dpi,
+        workers=args.workers,
+        force=args.force,
+    )
+    print(
+        f"Concluído: {resumo['processados']} processados, "
+        f"{resumo['ignorados']} já processados, {resumo['erros']} com erro."
+    )
 
-# Exemplo de uso
-#pdf_path = "guias_novas"
-#output_folder = "guias_processadas_imagens"
-#pdf_to_images(pdf_path, output_folder)
 
-print("Todos os PDFs foram processados e salvos na pasta destino.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+-- Sincronização incremental dos agendamentos do MySQL
+-- (scripts/import_agendamentos_sistema_aba.py)
+
+-- Marca d'água de cada sincronização (ex.: último schedule_lastupdate lido)
+CREATE TABLE IF NOT EXISTS sincronizacoes (
+    chave text PRIMARY KEY,
+    valor text,
+    updated_at timestamp with time zone DEFAULT now()
+);
+
+-- Garante mysql_id único em agendamentos, necessário para o upsert
+-- (on_conflict=mysql_id); as cargas antigas com insert podem ter duplicado linhas
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                  WHERE conname = 'agendamentos_mysql_id_unique') THEN
+        -- Mantém apenas o registro mais recente de cada agendamento
+        -- (updated_at nulo nas linhas antigas conta como o mais antigo)
+        DELETE FROM agendamentos
+        WHERE id IN (
+            SELECT id
+            FROM (
+                SELECT id,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY mysql_id
+                           ORDER BY updated_at DESC NULLS LAST, id DESC
+                       ) AS rn
+                FROM agendamentos
+                WHERE mysql_id IS NOT NULL
+            ) duplicados
+            WHERE rn > 1
+        );
+
+        ALTER TABLE agendamentos
+            ADD CONSTRAINT agendamentos_mysql_id_unique UNIQUE (mysql_id);
+    END IF;
+END $$;
@@ -0,0 +1,27 @@
+-- Garante numero_guia único em guias_unimed, necessário para o upsert em lote
+-- (on_conflict=numero_guia) usado por POST /guias-unimed/lote
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                  WHERE conname = 'guias_unimed_numero_guia_unique') THEN
+        -- Mantém apenas o registro mais recente de cada guia antes de criar a restrição
+        -- (updated_at nulo nas linhas antigas conta como o mais antigo)
+        DELETE FROM guias_unimed
+        WHERE id IN (
+            SELECT id
+            FROM (
+                SELECT id,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY numero_guia
+                           ORDER BY updated_at DESC NULLS LAST, id DESC
+                       ) AS rn
+                FROM guias_unimed
+                WHERE numero_guia IS NOT NULL
+            ) duplicados
+            WHERE rn > 1
+        );
+
+        ALTER TABLE guias_unimed
+            ADD CONSTRAINT guias_unimed_numero_guia_unique UNIQUE (numero_guia);
+    END IF;
+END $$;
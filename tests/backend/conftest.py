@@ -0,0 +1,27 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+# storage_r2 cria a instância global `storage` ao ser importado (e miniaturas a
+# usa); sem credenciais do R2, ela é criada sobre o disco local
+with patch.dict(
+    os.environ,
+    {
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_DIR": tempfile.mkdtemp(),
+        "R2_INDEX_PATH": os.path.join(tempfile.mkdtemp(), "objetos.db"),
+    },
+):
+    import storage_r2
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """StorageR2 sobre o disco local, com índice e cache em disco próprios"""
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("STORAGE_LOCAL_DIR", str(tmp_path / "bucket"))
+    monkeypatch.setenv("R2_INDEX_PATH", str(tmp_path / "objetos.db"))
+    monkeypatch.setenv("R2_CACHE_DIR", str(tmp_path / "cache"))
+    return storage_r2.StorageR2()
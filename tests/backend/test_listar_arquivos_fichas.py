@@ -0,0 +1,50 @@
+import pytest
+from unittest.mock import Mock, patch
+
+from database_supabase import listar_arquivos_fichas
+
+
+class FakeQuery:
+    """Builder do Supabase que, como o real, não aceita .range() duas vezes"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.intervalo = None
+
+    def __getattr__(self, name):
+        # select, not_, is_, gte, eq, order...: devolvem o próprio builder
+        return lambda *args, **kwargs: self
+
+    @property
+    def not_(self):
+        return self
+
+    def range(self, inicio, fim):
+        assert self.intervalo is None, "range() chamado duas vezes no mesmo builder"
+        self.intervalo = (inicio, fim)
+        return self
+
+    def execute(self):
+        inicio, fim = self.intervalo
+        return Mock(data=self.rows[inicio : fim + 1])
+
+
+def test_pagina_com_consulta_nova():
+    rows = [{"id": i, "arquivo_digitalizado": f"f{i}.pdf"} for i in range(5)]
+    supabase = Mock()
+    supabase.table.side_effect = lambda nome: FakeQuery(rows)
+
+    with patch("database_supabase.supabase", supabase):
+        fichas = listar_arquivos_fichas(data_inicio="2024-01-01", page_size=2)
+
+    assert fichas == rows
+    assert supabase.table.call_count == 3
+
+
+def test_erro_na_consulta_e_propagado():
+    supabase = Mock()
+    supabase.table.side_effect = RuntimeError("timeout")
+
+    with patch("database_supabase.supabase", supabase):
+        with pytest.raises(RuntimeError):
+            listar_arquivos_fichas()
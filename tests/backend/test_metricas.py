@@ -0,0 +1,38 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from metricas import MedicaoExtracao, RegistroMetricas
+
+
+def test_etapas_de_varias_threads_somam_todas():
+    medicao = MedicaoExtracao()
+
+    def registrar(_):
+        for _ in range(1000):
+            medicao.registrar_etapa("upload_r2", 0.001)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(registrar, range(8)))
+
+    assert medicao.etapas["upload_r2"] == pytest.approx(8.0)
+
+
+def test_chamada_ao_modelo_que_falha_e_registrada():
+    medicao = MedicaoExtracao()
+
+    async def chamada():
+        await asyncio.sleep(0.01)
+        raise TimeoutError("provedor")
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(medicao.medir("chamada_modelo", chamada()))
+
+    assert medicao.etapas["chamada_modelo"] >= 0.01
+
+    registro = RegistroMetricas()
+    registro.registrar(medicao)
+    [serie] = registro.exportar()["extracao_etapa_segundos"]
+    assert serie["labels"] == {"etapa": "chamada_modelo"}
+    assert serie["count"] == 1
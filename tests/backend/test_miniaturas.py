@@ -0,0 +1,34 @@
+import pymupdf
+
+import miniaturas
+
+
+def pdf_com_texto(texto: str) -> bytes:
+    with pymupdf.open() as doc:
+        page = doc.new_page()
+        page.insert_text((72, 72), texto, fontsize=48)
+        return doc.tobytes()
+
+
+def test_pdf_regravado_na_mesma_chave_tem_miniatura_nova(storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(miniaturas, "storage", storage)
+    monkeypatch.setattr(miniaturas, "MINIATURAS_DIR", str(tmp_path / "miniaturas"))
+
+    storage.upload_bytes(pdf_com_texto("primeira"), "fichas/a.pdf")
+    etag_v1 = storage.get_etag("fichas/a.pdf")
+    v1 = miniaturas.obter_miniatura("fichas/a.pdf", etag_v1, "p")
+
+    storage.upload_bytes(pdf_com_texto("segunda versao"), "fichas/a.pdf")
+    etag_v2 = storage.get_etag("fichas/a.pdf")
+    v2 = miniaturas.obter_miniatura("fichas/a.pdf", etag_v2, "p")
+
+    assert etag_v1 != etag_v2
+    assert v1 and v2 and v1 != v2
+    assert storage.read_file(miniaturas.chave_miniatura("fichas/a.pdf", etag_v2, "p")) == v2
+
+
+def test_pdf_inexistente(storage, monkeypatch):
+    monkeypatch.setattr(miniaturas, "storage", storage)
+
+    assert storage.get_etag("fichas/nao-existe.pdf") is None
+    assert miniaturas.guardar_miniaturas("fichas/nao-existe.pdf", {"p": b"webp"}) is False
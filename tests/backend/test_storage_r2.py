@@ -0,0 +1,110 @@
+import io
+import zipfile
+
+
+class TestCacheDisco:
+    def test_segunda_leitura_vem_do_cache(self, storage):
+        storage.upload_bytes(b"ficha v1", "fichas/a.pdf")
+
+        assert storage.read_file("fichas/a.pdf") == b"ficha v1"
+        assert storage.read_file("fichas/a.pdf") == b"ficha v1"
+
+        estatisticas = storage.cache.estatisticas()
+        assert estatisticas["gravacoes"] == 1
+        assert estatisticas["hits"] == 1
+
+    def test_gravacao_por_outro_processo_nao_serve_cache_antigo(self, storage):
+        storage.upload_bytes(b"ficha v1", "fichas/a.pdf")
+        assert storage.read_file("fichas/a.pdf") == b"ficha v1"
+
+        # Sobrescrito direto no bucket: o índice local ainda tem o ETag antigo
+        storage.client.put_object(Bucket=storage.bucket, Key="fichas/a.pdf", Body=b"ficha v2")
+
+        assert storage.read_file("fichas/a.pdf") == b"ficha v2"
+        assert storage.read_file("fichas/a.pdf") == b"ficha v2"
+        assert storage.index.obter("fichas/a.pdf")["tamanho"] == len(b"ficha v2")
+
+    def test_upload_invalida_a_entrada(self, storage):
+        storage.upload_bytes(b"ficha v1", "fichas/a.pdf")
+        assert storage.read_file("fichas/a.pdf") == b"ficha v1"
+
+        storage.upload_bytes(b"ficha v2", "fichas/a.pdf")
+
+        assert storage.read_file("fichas/a.pdf") == b"ficha v2"
+
+    def test_objeto_removido_nao_e_servido_do_cache(self, storage):
+        storage.upload_bytes(b"ficha v1", "fichas/a.pdf")
+        assert storage.read_file("fichas/a.pdf") == b"ficha v1"
+
+        storage.client.delete_object(Bucket=storage.bucket, Key="fichas/a.pdf")
+
+        assert storage.read_file("fichas/a.pdf") is None
+
+
+class TestMiniaturasForaDasListagens:
+    def test_listagem_e_zip_sem_miniaturas(self, storage):
+        storage.upload_bytes(b"ficha", "fichas/a.pdf")
+        storage.upload_bytes(b"webp", "miniaturas/fichas/a.pdf.etag.p.webp")
+
+        listagem = storage.list_indexed_files(exclude_prefix="miniaturas/")
+        assert [f["nome"] for f in listagem["items"]] == ["fichas/a.pdf"]
+        assert listagem["total"] == 1
+
+        zip_bytes = b"".join(storage.stream_files_as_zip(exclude_prefix="miniaturas/"))
+        assert zipfile.ZipFile(io.BytesIO(zip_bytes)).namelist() == ["fichas/a.pdf"]
+
+
+class TestBulkDelete:
+    def test_dry_run_so_conta(self, storage):
+        for nome in ("fichas/a.pdf", "fichas/b.pdf", "outros/c.pdf"):
+            storage.upload_bytes(b"x", nome)
+
+        resultado = storage.bulk_delete(prefix="fichas/", dry_run=True)
+
+        assert resultado["total"] == 2
+        assert resultado["deletados"] == 0
+        assert storage.read_file("fichas/a.pdf") == b"x"
+
+    def test_deleta_em_lotes_e_atualiza_o_indice(self, storage, monkeypatch):
+        monkeypatch.setattr("storage_r2.DELETE_CHUNK_SIZE", 2)
+        nomes = [f"fichas/{i}.pdf" for i in range(5)]
+        for nome in nomes + ["outros/c.pdf"]:
+            storage.upload_bytes(b"x", nome)
+
+        resultado = storage.bulk_delete(prefix="fichas/")
+
+        assert resultado["total"] == 5
+        assert resultado["deletados"] == 5
+        assert resultado["erros"] == []
+        assert [f["nome"] for f in storage.list_indexed_files()["items"]] == ["outros/c.pdf"]
+
+
+class TestGetFileRange:
+    def test_arquivo_inteiro(self, storage):
+        storage.upload_bytes(b"0123456789", "fichas/a.pdf")
+
+        resultado = storage.get_file_range("fichas/a.pdf")
+
+        assert resultado["status"] == 200
+        assert resultado["headers"]["Content-Length"] == "10"
+        assert b"".join(resultado["body"]) == b"0123456789"
+
+    def test_intervalo(self, storage):
+        storage.upload_bytes(b"0123456789", "fichas/a.pdf")
+
+        resultado = storage.get_file_range("fichas/a.pdf", "bytes=2-5")
+
+        assert resultado["status"] == 206
+        assert resultado["headers"]["Content-Range"] == "bytes 2-5/10"
+        assert b"".join(resultado["body"]) == b"2345"
+
+    def test_intervalo_invalido_informa_o_tamanho(self, storage):
+        storage.upload_bytes(b"0123456789", "fichas/a.pdf")
+
+        resultado = storage.get_file_range("fichas/a.pdf", "bytes=20-30")
+
+        assert resultado["status"] == 416
+        assert resultado["headers"] == {"Content-Range": "bytes */10"}
+
+    def test_arquivo_inexistente(self, storage):
+        assert storage.get_file_range("fichas/nao-existe.pdf")["status"] == 404
@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# The scraping service (and the scripts built on it) and the MySQL helpers
+# use flat imports, and so does the R2 storage layer
+sys.path.insert(0, os.path.join(ROOT, "scraping"))
+sys.path.insert(0, os.path.join(ROOT, "mysql"))
+sys.path.insert(0, os.path.join(ROOT, "R2"))
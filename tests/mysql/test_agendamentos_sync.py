@@ -0,0 +1,33 @@
+import pytest
+from unittest.mock import Mock
+
+from scripts.import_agendamentos_sistema_aba import (
+    get_paciente_id_mapping,
+    split_by_columns,
+    transform_data,
+)
+
+
+def test_unmapped_patients_keep_their_existing_link():
+    rows = transform_data(
+        [
+            {"mysql_id": 1, "mysql_paciente_id": 10, "fixo": "Sim"},
+            {"mysql_id": 2, "mysql_paciente_id": 20, "fixo": "Não"},
+            {"mysql_id": 3, "mysql_paciente_id": 10, "fixo": "Não"},
+        ],
+        {10: "uuid-10"},
+    )
+
+    assert rows[0]["paciente_id"] == "uuid-10"
+    assert "paciente_id" not in rows[1]
+
+    groups = split_by_columns(rows)
+    assert [[r["mysql_id"] for r in g] for g in groups] == [[1, 3], [2]]
+
+
+def test_mapping_failure_aborts_the_sync():
+    supabase = Mock()
+    supabase.table.side_effect = ConnectionError("Supabase fora do ar")
+
+    with pytest.raises(ConnectionError):
+        get_paciente_id_mapping(supabase)
@@ -0,0 +1,154 @@
+import os
+from datetime import datetime
+
+import mysql.connector
+import pytest
+
+import database_mysql
+from database_mysql import (
+    DB_CONFIG,
+    build_count_query,
+    build_schedule_query,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def test_date_filters_are_half_open_ranges_on_the_raw_column():
+    query, params = build_schedule_query(
+        limit=50, data_inicial="01/01/2024", data_final="31/01/2024"
+    )
+
+    assert "DATE(" not in query and "STR_TO_DATE" not in query
+    assert "ps.schedule_date_start >= %s" in query
+    assert "ps.schedule_date_start < %s" in query
+    assert params == [datetime(2024, 1, 1), datetime(2024, 2, 1), 50, 0]
+
+
+def test_name_search_is_an_escaped_prefix(monkeypatch):
+    monkeypatch.setattr(database_mysql, "NAME_SEARCH", "prefix")
+
+    query, params = build_count_query(paciente_nome=" 100%_ana ")
+
+    assert "LOWER(" not in query
+    assert "c.client_nome LIKE %s" in query
+    assert params == ["100\\%\\_ana%"]
+
+
+def test_count_only_joins_clients_for_name_search():
+    query, _ = build_count_query(data_inicial="01/01/2024")
+
+    assert "ps_clients" not in query
+
+
+def test_cursor_replaces_offset():
+    cursor = encode_cursor(
+        {"schedule_date_start": datetime(2024, 1, 5, 9, 30), "schedule_id": 42}
+    )
+
+    query, params = build_schedule_query(limit=20, offset=200, cursor=cursor)
+
+    assert decode_cursor(cursor) == (datetime(2024, 1, 5, 9, 30), 42)
+    assert "ps.schedule_id < %s" in query
+    assert params[-3:] == [42, 20, 0]
+
+
+class FakeCursor:
+    def execute(self, query, params):
+        pass
+
+    def fetchall(self):
+        return []
+
+
+class FakeConnection:
+    """The MySQL connection the pool keeps; reconnect() gets a new server id"""
+
+    def __init__(self):
+        self.connection_id = 1
+        self.cursors = 0
+
+    def cursor(self, prepared, dictionary):
+        self.cursors += 1
+        return FakeCursor()
+
+    def reconnect(self):
+        self.connection_id += 1
+
+
+class FakePooledConnection:
+    """What pool.get_connection() returns: a fresh wrapper on every checkout"""
+
+    def __init__(self, cnx):
+        self._cnx = cnx
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+
+def test_prepared_cursors_are_reused_until_the_pool_reconnects():
+    cnx = FakeConnection()
+
+    database_mysql._execute(FakePooledConnection(cnx), "SELECT 1", [])
+    database_mysql._execute(FakePooledConnection(cnx), "SELECT 1", [])
+    assert cnx.cursors == 1
+
+    cnx.reconnect()
+    database_mysql._execute(FakePooledConnection(cnx), "SELECT 1", [])
+
+    assert cnx.cursors == 2
+    connection_id, statements = cnx._prepared_statements
+    assert connection_id == 2
+    assert list(statements) == ["SELECT 1"]
+
+
+# The plans below need the real schedule database and its indexes
+# (mysql/migrate_schedule_indexes.py); run with MYSQL_EXPLAIN_TESTS=1
+explain_tests = pytest.mark.skipif(
+    os.getenv("MYSQL_EXPLAIN_TESTS") != "1", reason="needs the MySQL schedule database"
+)
+
+
+@pytest.fixture
+def explain():
+    connection = mysql.connector.connect(**DB_CONFIG)
+    cursor = connection.cursor(dictionary=True)
+
+    def run(query, params):
+        cursor.execute(f"EXPLAIN {query}", params)
+        return {row["table"]: row for row in cursor.fetchall()}
+
+    yield run
+    cursor.close()
+    connection.close()
+
+
+@explain_tests
+def test_date_range_page_uses_the_date_index(explain):
+    plan = explain(*build_schedule_query(50, 0, None, "01/01/2024", "31/01/2024"))
+
+    assert plan["ps"]["type"] == "range"
+    assert plan["ps"]["key"] is not None
+    assert "filesort" not in (plan["ps"]["Extra"] or "")
+
+
+@explain_tests
+def test_keyset_page_reads_the_index_in_order(explain):
+    cursor = encode_cursor(
+        {"schedule_date_start": datetime(2024, 1, 5, 9, 30), "schedule_id": 42}
+    )
+
+    plan = explain(*build_schedule_query(50, cursor=cursor))
+
+    assert plan["ps"]["type"] in ("range", "index")
+    assert "filesort" not in (plan["ps"]["Extra"] or "")
+
+
+@explain_tests
+def test_name_prefix_search_uses_an_index(explain, monkeypatch):
+    monkeypatch.setattr(database_mysql, "NAME_SEARCH", "prefix")
+
+    plan = explain(*build_count_query(paciente_nome="maria"))
+
+    assert plan["c"]["type"] == "range"
+    assert plan["ps"]["type"] == "ref"
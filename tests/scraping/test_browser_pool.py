@@ -0,0 +1,67 @@
+from browser_sessions import BrowserPool
+
+
+class FakeBrowser:
+    """Stands in for UnimedScraper: a session that stays logged in once it logs in"""
+
+    def __init__(self):
+        self.account = None
+        self.home_url = None
+        self.jobs_done = 0
+        self.logins = 0
+        self.closed = False
+        self.chrome_profile_path = "/nonexistent"
+
+    def is_healthy(self):
+        return not self.closed
+
+    def is_logged_in(self):
+        return self.home_url is not None
+
+    def login(self, username, password):
+        self.logins += 1
+        self.account = username
+        self.home_url = f"https://portal/{username}/home"
+        return True
+
+    def reset(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowserPool(BrowserPool):
+    def _new_browser(self):
+        return FakeBrowser()
+
+
+def test_idle_browsers_are_only_reused_by_their_account():
+    pool = FakeBrowserPool(max_idle=4)
+
+    first = pool.acquire("conta_a", "senha")
+    pool.release(first)
+
+    other = pool.acquire("conta_b", "senha")
+    assert other is not first
+    assert other.account == "conta_b"
+    pool.release(other)
+
+    again = pool.acquire("conta_a", "senha")
+    assert again is first
+    assert again.logins == 1
+
+
+def test_idle_limit_counts_every_account():
+    pool = FakeBrowserPool(max_idle=1)
+
+    a = pool.acquire("conta_a", "senha")
+    b = pool.acquire("conta_b", "senha")
+    pool.release(a)
+    pool.release(b)
+
+    assert not a.closed
+    assert b.closed
+
+    pool.close_all()
+    assert a.closed
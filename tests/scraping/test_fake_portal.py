@@ -0,0 +1,126 @@
+import pytest
+import requests
+from lxml import html
+
+from detail_fetcher import (
+    DetailFetcher,
+    SessionExpired,
+    parse_biometric_data,
+    parse_guide_details,
+    resolve_link,
+)
+from fake_portal import FakePortal
+from portal import LISTING_ROWS
+
+
+class BrowserSession:
+    """What DetailFetcher reads from the Selenium driver, taken from a requests session"""
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+
+    def execute_script(self, script):
+        return "Mozilla/5.0 (benchmark)"
+
+    def get_cookies(self):
+        return [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+            for c in self.session.cookies
+        ]
+
+
+@pytest.fixture
+def portal():
+    with FakePortal(guides_per_day=23, page_size=10) as portal:
+        yield portal
+
+
+def login(portal: FakePortal) -> requests.Session:
+    session = requests.Session()
+    response = session.post(
+        f"{portal.base_url}/Login.do",
+        data={"login": portal.username, "passwordTemp": portal.password},
+    )
+    assert 'id="centro_21"' in response.text
+    return session
+
+
+def listing_guides(portal, session, start_date, end_date):
+    """Walk the listing like the scraper: rows of every page, following 'Próxima'"""
+    url = f"{portal.base_url}/ExamesFinalizados.do"
+    params = {"s_dt_ini": start_date, "s_dt_fim": end_date, "Button_FIltro": "Filtrar"}
+    guides, pages = [], 0
+    while True:
+        tree = html.fromstring(session.get(url, params=params).content)
+        tree.make_links_absolute(url)
+        pages += 1
+        for row in tree.xpath(LISTING_ROWS)[1:]:
+            guides.append(
+                {
+                    "date": row.xpath("normalize-space(./td[1])"),
+                    "guide_number": row.xpath("normalize-space(./td[2]/a)"),
+                    "detail_url": row.xpath("string(./td[2]/a/@href)"),
+                    "biometric_url": resolve_link(
+                        row.xpath("string(./td[7]/span[2]/a/@href)"), url
+                    ),
+                }
+            )
+        next_link = tree.xpath('//a[normalize-space()="Próxima"]')[0]
+        if "disabled" in next_link.get("class"):
+            return guides, pages
+        url, params = next_link.get("href"), None
+
+
+def test_listing_paginates_every_guide_once(portal):
+    session = login(portal)
+
+    guides, pages = listing_guides(portal, session, "15/01/2024", "17/01/2024")
+
+    assert pages == 7
+    assert len(guides) == 3 * 23
+    assert len({g["guide_number"] for g in guides}) == len(guides)
+
+
+def test_detail_and_biometric_pages_parse(portal):
+    session = login(portal)
+    expected = portal.guide("2401150007")
+
+    details = parse_guide_details(
+        session.get(f"{portal.base_url}/Guia.do?guia=2401150007").content
+    )
+    biometric = parse_biometric_data(
+        session.get(f"{portal.base_url}/Biometria.do?guia=2401150007").content,
+        expected["date"],
+    )
+
+    assert details["card_number"] == f"{expected['card_number']} - {expected['beneficiary']}"
+    assert details["professional_name"] == expected["professional_name"]
+    assert details["council_number"] == expected["council_number"]
+    assert details["cbo_code"] == expected["cbo_code"]
+    assert details["therapy_code"] == expected["therapy_code"]
+    assert details["procedure_code"] == expected["procedure_code"]
+    assert details["execution_dates"] == expected["execution_dates"]
+    assert biometric == expected["biometric_data"]
+
+
+def test_expired_session_is_detected(portal):
+    page = requests.get(f"{portal.base_url}/Guia.do?guia=2401150001").content
+
+    with pytest.raises(SessionExpired):
+        parse_guide_details(page)
+
+
+def test_detail_fetcher_retries_transient_errors(portal):
+    portal.transient_errors = 1
+    session = login(portal)
+    guides, _ = listing_guides(portal, session, "15/01/2024", "15/01/2024")
+
+    fetcher = DetailFetcher(BrowserSession(session), max_workers=4)
+    try:
+        fetched, failed = fetcher.fetch_all(guides)
+    finally:
+        fetcher.close()
+
+    assert failed == []
+    assert [g["guide_number"] for g in fetched] == [g["guide_number"] for g in guides]
+    assert portal.stats["injected_errors"] == 2 * len(guides)
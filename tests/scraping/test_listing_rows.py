@@ -0,0 +1,67 @@
+from datetime import date
+
+import requests
+from lxml import html
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.support.wait import WebDriverWait
+
+from fake_portal import FakePortal
+from scraper import UnimedScraper
+
+
+class LxmlElement:
+    """The part of a Selenium WebElement that _read_listing_rows uses, over lxml"""
+
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def text(self):
+        return " ".join(self.element.text_content().split())
+
+    def get_attribute(self, name):
+        return self.element.get(name)
+
+    def find_elements(self, by, xpath):
+        return [LxmlElement(e) for e in self.element.xpath(xpath)]
+
+    def find_element(self, by, xpath):
+        elements = self.find_elements(by, xpath)
+        if not elements:
+            raise NoSuchElementException(xpath)
+        return elements[0]
+
+
+class LxmlDriver(LxmlElement):
+    """A loaded page, searched with the same XPaths the scraper gives Selenium"""
+
+    def __init__(self, page: bytes, url: str):
+        super().__init__(html.fromstring(page))
+        self.current_url = url
+
+
+def test_read_listing_rows_skips_header_and_navigator():
+    with FakePortal(guides_per_day=23, page_size=10) as portal:
+        session = requests.Session()
+        session.post(
+            f"{portal.base_url}/Login.do",
+            data={"login": portal.username, "passwordTemp": portal.password},
+        )
+        url = f"{portal.base_url}/ExamesFinalizados.do"
+        response = session.get(
+            url,
+            params={"s_dt_ini": "15/01/2024", "s_dt_fim": "15/01/2024", "Button_FIltro": "Filtrar"},
+        )
+        expected = portal.guides_between(date(2024, 1, 15), date(2024, 1, 15))[:10]
+
+    scraper = UnimedScraper(headless=True)
+    scraper.driver = LxmlDriver(response.content, response.url)
+    scraper.wait = WebDriverWait(scraper.driver, 1)
+
+    guides = scraper._read_listing_rows()
+
+    assert [g["guide_number"] for g in guides] == [g["guide_number"] for g in expected]
+    assert "Próxima" not in [g["guide_number"] for g in guides]
+    first = guides[0]
+    assert first["detail_url"] == f"{portal.base_url}/Guia.do?guia={first['guide_number']}"
+    assert first["biometric_url"] == f"{portal.base_url}/Biometria.do?guia={first['guide_number']}"
@@ -0,0 +1,211 @@
+import pytest
+import requests
+from lxml import html
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+import pacing
+import portal as portal_pages
+from detail_fetcher import DetailFetcher
+from fake_portal import FakePortal
+from pacing import AccountPacer, PolitenessBudgetExceeded, PortalBlocked, looks_blocked
+from scraper import UnimedScraper
+
+
+class FakeClock:
+    """time.monotonic/time.sleep for the pacing module; sleeping moves the clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+class PageElement:
+    def __init__(self, element):
+        self.text = " ".join(element.text_content().split())
+
+
+class PageDriver:
+    """The part of the Selenium driver that paced() and DetailFetcher use, over requests"""
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.current_url = None
+        self.tree = None
+
+    def get(self, url):
+        response = self.session.get(url)
+        self.current_url = response.url
+        self.tree = html.fromstring(response.content)
+
+    def find_elements(self, by, value):
+        elements = self.tree.iter(value) if by == By.TAG_NAME else self.tree.xpath(value)
+        return [PageElement(e) for e in elements]
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(value)
+        return elements[0]
+
+    def execute_script(self, script):
+        return "Mozilla/5.0 (test)"
+
+    def get_cookies(self):
+        return [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+            for c in self.session.cookies
+        ]
+
+
+def logged_in_driver(portal: FakePortal) -> PageDriver:
+    session = requests.Session()
+    session.post(
+        f"{portal.base_url}/Login.do",
+        data={"login": portal.username, "passwordTemp": portal.password},
+    )
+    return PageDriver(session)
+
+
+def paced_scraper(driver: PageDriver, pacer: AccountPacer) -> UnimedScraper:
+    scraper = UnimedScraper(headless=True, pacer=pacer)
+    scraper.driver = driver
+    scraper.wait = WebDriverWait(driver, 10)
+    return scraper
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(pacing.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(pacing.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_burst_then_waits_for_the_rate(clock):
+    pacer = AccountPacer("conta", rate=2, burst=3)
+
+    for _ in range(3):
+        pacer.acquire()
+    assert clock.slept == 0
+
+    pacer.acquire()
+    assert clock.slept == pytest.approx(0.5)
+    assert pacer.report()["requests"] == 4
+
+
+def test_rate_grows_on_fast_responses_and_halves_on_slow_ones(clock):
+    pacer = AccountPacer("conta", rate=2, min_rate=0.5, max_rate=2.5, slow_seconds=5)
+
+    pacer.observe(0.1)
+    pacer.observe(0.1)
+    pacer.observe(0.1)
+    assert pacer.rate == 2.5
+
+    pacer.observe(6)
+    assert pacer.rate == 1.25
+    pacer.observe(0.1, ok=False)
+    pacer.observe(0.1, ok=False)
+    assert pacer.rate == 0.5
+
+    report = pacer.report()
+    assert report["slow_responses"] == 1
+    assert report["errors"] == 2
+
+
+def test_block_drops_to_min_rate_and_pauses(clock):
+    pacer = AccountPacer("conta", rate=4, min_rate=0.5, burst=4)
+
+    with pytest.raises(PortalBlocked):
+        with pacer.step():
+            raise PortalBlocked("captcha")
+
+    assert pacer.rate == 0.5
+    pacer.acquire()
+    assert clock.slept >= pacing.BLOCK_COOLDOWN_SECONDS
+    assert pacer.report()["blocks"] == 1
+
+
+def test_run_budget(clock):
+    pacer = AccountPacer("conta", burst=10)
+    pacer.begin_run(max_requests=2)
+
+    pacer.acquire()
+    pacer.acquire()
+    with pytest.raises(PolitenessBudgetExceeded):
+        pacer.acquire()
+
+    pacer.begin_run(max_requests=0)
+    pacer.acquire()
+
+
+def test_looks_blocked():
+    assert looks_blocked("<p>Digite o CAPTCHA abaixo</p>")
+    assert looks_blocked("Usuário bloqueado por excesso de tentativas")
+    assert not looks_blocked("<p>Exames finalizados</p>")
+    assert not looks_blocked("")
+
+
+def test_captcha_page_in_the_browser_starts_the_cooldown(clock):
+    pacer = AccountPacer("conta", rate=4, min_rate=0.5, burst=4)
+    with FakePortal(blocked=True) as portal:
+        driver = logged_in_driver(portal)
+        scraper = paced_scraper(driver, pacer)
+
+        # The captcha page never shows the link the scraper waits for
+        with pytest.raises(PortalBlocked):
+            scraper.paced(
+                lambda: driver.get(f"{portal.base_url}/Home.do"),
+                EC.presence_of_element_located((By.XPATH, portal_pages.FINISHED_EXAMS_LINK)),
+            )
+
+    assert pacer.report()["blocks"] == 1
+    slept = clock.slept
+    pacer.acquire()
+    assert clock.slept - slept >= pacing.BLOCK_COOLDOWN_SECONDS
+
+
+def test_timeout_on_a_normal_page_is_an_error(clock):
+    pacer = AccountPacer("conta")
+    with FakePortal() as portal:
+        driver = logged_in_driver(portal)
+        scraper = paced_scraper(driver, pacer)
+
+        with pytest.raises(TimeoutException):
+            scraper.paced(
+                lambda: driver.get(f"{portal.base_url}/Home.do"),
+                EC.presence_of_element_located((By.ID, "nao_existe")),
+            )
+
+    report = pacer.report()
+    assert report["errors"] == 1
+    assert report["blocks"] == 0
+
+
+def test_captcha_page_over_http_starts_the_cooldown(clock):
+    pacer = AccountPacer("conta", rate=4, min_rate=0.5, burst=4)
+    with FakePortal(blocked=True) as portal:
+        fetcher = DetailFetcher(logged_in_driver(portal), max_workers=1, pacer=pacer)
+        guide = {
+            "date": "15/01/2024",
+            "guide_number": "2401150001",
+            "detail_url": f"{portal.base_url}/Guia.do?guia=2401150001",
+        }
+
+        # Served with status 200, so only the page text gives it away
+        with pytest.raises(PortalBlocked):
+            fetcher.fetch_guide(guide)
+
+    assert pacer.report()["blocks"] == 1
+    slept = clock.slept
+    pacer.acquire()
+    assert clock.slept - slept >= pacing.BLOCK_COOLDOWN_SECONDS
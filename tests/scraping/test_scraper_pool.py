@@ -0,0 +1,55 @@
+import pytest
+from fakeredis import FakeRedis
+
+import scraper_pool
+from scraper_pool import AccountSessionLimiter, split_date_range
+
+
+def test_split_date_range_covers_every_day_once():
+    ranges = split_date_range("30/01/2024", "08/02/2024", 3)
+
+    assert ranges == [
+        ("30/01/2024", "02/02/2024"),
+        ("03/02/2024", "05/02/2024"),
+        ("06/02/2024", "08/02/2024"),
+    ]
+
+
+def test_split_date_range_never_splits_a_day():
+    assert split_date_range("15/01/2024", "16/01/2024", 4) == [
+        ("15/01/2024", "15/01/2024"),
+        ("16/01/2024", "16/01/2024"),
+    ]
+    assert split_date_range("15/01/2024", "15/01/2024", 0) == [("15/01/2024", "15/01/2024")]
+
+
+def test_split_date_range_rejects_reversed_range():
+    with pytest.raises(ValueError):
+        split_date_range("16/01/2024", "15/01/2024", 2)
+
+
+class SlotBusy(Exception):
+    pass
+
+
+def test_renewed_lease_survives_past_the_lease_time(monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(scraper_pool.time, "time", lambda: clock[0])
+
+    def busy(seconds):
+        raise SlotBusy()
+
+    monkeypatch.setattr(scraper_pool.time, "sleep", busy)
+    limiter = AccountSessionLimiter("conta", 1, FakeRedis())
+
+    held = limiter.acquire()
+    clock[0] += scraper_pool.SESSION_LEASE_SECONDS - 60
+    limiter.renew(held)
+    clock[0] += 120
+
+    # Without the renewal the lease would have expired and freed the slot
+    with pytest.raises(SlotBusy):
+        limiter.acquire()
+
+    limiter.release(held)
+    assert limiter.acquire() is not None
@@ -0,0 +1,67 @@
+import pytest
+from fakeredis import FakeAsyncRedis, FakeRedis, FakeServer
+
+import task_events
+from task_events import events_key, publish_status, stream_events
+
+
+@pytest.fixture
+def redis_pair(monkeypatch):
+    """Sync client for the worker side, async client for the SSE side, same data"""
+    monkeypatch.setattr(task_events, "SSE_BLOCK_MS", 50)
+    server = FakeServer()
+    return FakeRedis(server=server), FakeAsyncRedis(server=server)
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def event_ids(chunks):
+    return [c.split("\n")[0][4:] for c in chunks if c.startswith("id: ")]
+
+
+@pytest.mark.asyncio
+async def test_new_connection_gets_snapshot_then_ends_on_final_status(redis_pair):
+    sync_redis, async_redis = redis_pair
+    publish_status(sync_redis, "t1", {"status": "running", "progress": "10"})
+    publish_status(sync_redis, "t1", {"status": "completed", "progress": "100"})
+
+    chunks = await collect(stream_events(async_redis, "t1"))
+
+    assert len(chunks) == 1
+    assert '"status": "completed"' in chunks[0]
+
+
+@pytest.mark.asyncio
+async def test_reconnect_gets_missed_events_only(redis_pair):
+    sync_redis, async_redis = redis_pair
+    publish_status(sync_redis, "t1", {"status": "running", "progress": "10"})
+    first = (await async_redis.xrange(events_key("t1")))[0][0].decode()
+    publish_status(sync_redis, "t1", {"status": "running", "progress": "50"})
+    publish_status(sync_redis, "t1", {"status": "failed", "error": "portal fora do ar"})
+
+    chunks = await collect(stream_events(async_redis, "t1", last_event_id=first))
+
+    assert len(event_ids(chunks)) == 2
+    assert '"status": "failed"' in chunks[-1]
+
+
+@pytest.mark.asyncio
+async def test_reconnect_after_final_event_ends_without_waiting(redis_pair):
+    sync_redis, async_redis = redis_pair
+    publish_status(sync_redis, "t1", {"status": "completed", "progress": "100"})
+    last = (await async_redis.xrange(events_key("t1")))[-1][0].decode()
+
+    assert await task_events.client_is_done(async_redis, "t1", last)
+    assert await collect(stream_events(async_redis, "t1", last_event_id=last)) == []
+
+
+@pytest.mark.asyncio
+async def test_stream_ends_when_the_events_expire(redis_pair):
+    sync_redis, async_redis = redis_pair
+    publish_status(sync_redis, "t1", {"status": "running", "progress": "10"})
+    last = (await async_redis.xrange(events_key("t1")))[-1][0].decode()
+    sync_redis.delete(events_key("t1"))
+
+    assert await collect(stream_events(async_redis, "t1", last_event_id=last)) == []